@@ -24,23 +24,35 @@
 # Imports
 ###############################################################################
 
+from collections import deque
+from hashlib import sha1
+import importlib
+from itertools import chain, islice
+import json
 import logging
+import multiprocessing
 import os
 from pkg_resources import resource_filename
+import re
+import resource
 import shutil
+import signal
+from subprocess import PIPE, Popen, STDOUT
 import sys
+from threading import Event, Lock, Thread
 import traceback
 import time
 
 from .metamodel import (
-    Configuration, MetamodelObject, Location, Resource, RosPrimitive,
+    Configuration, MetamodelObject, Location, Resource, RosName, RosPrimitive,
     RuntimeLocation
 )
 from .data import (
     Violation, Measurement, FileAnalysis, PackageAnalysis,
-    ConfigurationAnalysis, Statistics, AnalysisReport
+    ConfigurationAnalysis, Statistics, AnalysisReport, QueryProfile,
+    PluginProfile
 )
-from .util import cwd
+from .util import cwd, map_workers, run_workers, WorkerProcess
 
 
 ###############################################################################
@@ -67,6 +79,20 @@ class AnalysisScopeError(Exception):
     def __str__(self):
         return repr(self.value)
 
+class PluginTaskError(Exception):
+    def __init__(self, value):
+        self.value = value
+    def __str__(self):
+        return repr(self.value)
+
+# A BaseException (like KeyboardInterrupt), so that plugins that catch
+# any Exception do not stop it.
+class PluginTimeoutError(BaseException):
+    def __init__(self, value):
+        self.value = value
+    def __str__(self):
+        return repr(self.value)
+
 
 ###############################################################################
 # HAROS Plugin Interface
@@ -74,6 +100,10 @@ class AnalysisScopeError(Exception):
 
 class PluginInterface(LoggingObject):
     """Provides an interface for plugins to communicate with the framework."""
+    POLL_TIME = 0.1 # seconds, while waiting for tools
+    # Popen with preexec_fn is not thread-safe in Python 2, and run_tool
+    # starts processes from several threads, so they are started one at a time
+    _spawn_lock = Lock()
 
     def __init__(self, data, reports, allowed_rules, allowed_metrics,
                  ignored_lines):
@@ -85,6 +115,9 @@ class PluginInterface(LoggingObject):
         self._exported = set()
         self._buffer_violations = None
         self._buffer_metrics = None
+        self._recording = None  # (report, datum) for the plugin cache
+        self._added = 0         # number of findings reported so far
+        self._stream = None     # (pipe, marks), in plugin worker processes
         self._rules = allowed_rules
         self._metrics = allowed_metrics
         self._lines = ignored_lines
@@ -98,6 +131,76 @@ class PluginInterface(LoggingObject):
         if os.path.isfile(target):
             self._exported.add(target)
 
+    def run_tool(self, command, files, jobs = None, max_files = None):
+        """Run `command` (a list of arguments) over the paths of `files`,
+            with up to `jobs` processes at once (default: one per CPU)
+            and at most `max_files` files per process (default: an even
+            split among processes).
+            Returns a dict from each file to the lines of output that
+            start with its path (e.g., "path:line: message"); other
+            lines are under the None key.
+        """
+        files = list(files)
+        if not files:
+            return {}
+        jobs = jobs or multiprocessing.cpu_count()
+        size = max_files or (len(files) + jobs - 1) // jobs
+        chunks = deque(enumerate(files[i:i + size]
+                                 for i in xrange(0, len(files), size)))
+        outputs = [""] * len(chunks)
+        processes = []
+        stopped = Event()
+        def worker():
+            while True:
+                try:
+                    i, chunk = chunks.popleft()
+                except IndexError:
+                    return
+                args = list(command) + [sf.path for sf in chunk]
+                self.log.debug("run_tool: %s", " ".join(args))
+                try:
+                    # in a new process group, to stop the whole tool;
+                    # processes are stopped under the same lock
+                    with self._spawn_lock:
+                        if stopped.is_set():
+                            return
+                        process = Popen(args, stdout = PIPE, stderr = STDOUT,
+                                        preexec_fn = os.setsid)
+                        processes.append(process)
+                    outputs[i] = process.communicate()[0]
+                except OSError as e:
+                    self.log.error("Cannot run %s: %s", command[0], e)
+        threads = [Thread(target = worker)
+                   for i in xrange(min(jobs, len(chunks)))]
+        for thread in threads:
+            thread.start()
+        try:
+            for thread in threads:
+                # join with a timeout, so that signals (e.g., the plugin
+                # time limit) can interrupt the wait
+                while thread.is_alive():
+                    thread.join(self.POLL_TIME)
+        except BaseException:
+            with self._spawn_lock:
+                stopped.set()
+                chunks.clear()
+                for process in processes:
+                    if process.poll() is None:
+                        try:
+                            os.killpg(process.pid, signal.SIGKILL)
+                        except OSError:
+                            pass
+            raise
+        paths = {}
+        for sf in files:
+            paths[os.path.realpath(sf.path)] = sf
+        result = {}
+        for line in "".join(outputs).splitlines():
+            path = line.split(":", 1)[0]
+            sf = paths.get(os.path.realpath(path)) if path else None
+            result.setdefault(sf, []).append(line)
+        return result
+
     def find_package(self, scope_id):
         pkgs = self._data.packages
         return pkgs.get(scope_id, pkgs.get("package:" + scope_id))
@@ -112,11 +215,10 @@ class PluginInterface(LoggingObject):
         scope = scope or self._report.scope
         if scope is None:
             raise AnalysisScopeError("must provide a scope")
-        if scope.id in self._lines:
-            ignored = self._lines[scope.id]
-            if line in ignored["*"]:
-                self.log.debug("ignored file/line (%s:%s)", scope.id, line)
-                return
+        ignored = self._lines.get(scope.id)
+        if not ignored is None and line in ignored:
+            self.log.debug("ignored file/line (%s:%s)", scope.id, line)
+            return
         location = scope.location
         location.line = line
         location.function = function
@@ -129,12 +231,12 @@ class PluginInterface(LoggingObject):
         if not rule:
             self.log.debug("ignored rule: " + rule_id)
             return
+        if not ignored is None and ignored.ignores_rule(rule.id, line):
+            self.log.debug("ignored rule %s (%s:%s)", rule.id, scope.id, line)
+            return
         datum = Violation(rule, location, details = msg)
         datum.affected.append(scope)
-        if not self._buffer_violations is None:
-            self._buffer_violations.append(datum)
-        else:
-            report.violations.append(datum)
+        self._add_violation(report, datum)
 
     def report_runtime_violation(self, rule_id, msg, resources=None):
         scope = self._report.scope
@@ -156,10 +258,7 @@ class PluginInterface(LoggingObject):
         datum = Violation(rule, location, details=msg)
         datum.affected.append(scope)
         datum.affected.extend(resources)
-        if self._buffer_violations is not None:
-            self._buffer_violations.append(datum)
-        else:
-            self._report.violations.append(datum)
+        self._add_violation(self._report, datum)
 
     def report_metric(self, metric_id, value, scope = None,
                       line = None, function = None, class_ = None):
@@ -167,11 +266,10 @@ class PluginInterface(LoggingObject):
         scope = scope or self._report.scope
         if scope is None:
             raise AnalysisScopeError("must provide a scope")
-        if scope.id in self._lines:
-            ignored = self._lines[scope.id]
-            if line in ignored["*"]:
-                self.log.debug("ignored file/line (%s:%s)", scope.id, line)
-                return
+        ignored = self._lines.get(scope.id)
+        if not ignored is None and line in ignored:
+            self.log.debug("ignored file/line (%s:%s)", scope.id, line)
+            return
         location = scope.location
         location.line = line
         location.function = function
@@ -184,8 +282,138 @@ class PluginInterface(LoggingObject):
         if not metric:
             self.log.debug("ignored metric: " + metric_id)
             return
+        if not ignored is None and ignored.ignores_rule(metric.id, line):
+            self.log.debug("ignored metric %s (%s:%s)",
+                           metric.id, scope.id, line)
+            return
         self._check_metric_value(metric, value)
         datum = Measurement(metric, location, value)
+        self._add_metric(report, datum)
+
+    def report_violations(self, violations):
+        """Report many violations at once. Each violation is a tuple
+            (rule_id, msg[, scope[, line[, function[, class_]]]]),
+            with the same meaning as the arguments of report_violation.
+        """
+        rules = {}
+        targets = {}
+        added = []
+        try:
+            for item in violations:
+                rule_id, msg, scope, line, function, class_ = \
+                    (tuple(item) + (None,) * 4)[:6]
+                scope = scope or self._report.scope
+                target = targets.get(id(scope))
+                if target is None:
+                    target = targets[id(scope)] = self._bulk_target(scope)
+                report, pkg, sf, ignored = target
+                if not ignored is None and line in ignored:
+                    continue
+                rule = rules.get(rule_id, False)
+                if rule is False:
+                    rule = rules[rule_id] = self._get_property(rule_id,
+                        self._data.rules, self._rules)
+                if not rule:
+                    continue
+                if (not ignored is None and ignored.by_rule
+                        and ignored.ignores_rule(rule.id, line)):
+                    continue
+                if pkg is None:
+                    location = self._scope_location(scope, line,
+                                                    function, class_)
+                else:
+                    location = Location(pkg, sf, line, function, class_)
+                datum = Violation(rule, location, msg)
+                datum.affected.append(scope)
+                added.append((report, datum))
+        finally:
+            self.log.debug("violations(%d)", len(added))
+            self._add_all(added, self._buffer_violations, "violations")
+
+    def report_metrics(self, metrics):
+        """Report many metrics at once. Each metric is a tuple
+            (metric_id, value[, scope[, line[, function[, class_]]]]),
+            with the same meaning as the arguments of report_metric.
+        """
+        properties = {}
+        targets = {}
+        added = []
+        try:
+            for item in metrics:
+                metric_id, value, scope, line, function, class_ = \
+                    (tuple(item) + (None,) * 4)[:6]
+                scope = scope or self._report.scope
+                target = targets.get(id(scope))
+                if target is None:
+                    target = targets[id(scope)] = self._bulk_target(scope)
+                report, pkg, sf, ignored = target
+                if not ignored is None and line in ignored:
+                    continue
+                metric = properties.get(metric_id, False)
+                if metric is False:
+                    metric = properties[metric_id] = self._get_property(
+                        metric_id, self._data.metrics, self._metrics)
+                if not metric:
+                    continue
+                if (not ignored is None and ignored.by_rule
+                        and ignored.ignores_rule(metric.id, line)):
+                    continue
+                self._check_metric_value(metric, value)
+                if pkg is None:
+                    location = self._scope_location(scope, line,
+                                                    function, class_)
+                else:
+                    location = Location(pkg, sf, line, function, class_)
+                added.append((report, Measurement(metric, location, value)))
+        finally:
+            self.log.debug("metrics(%d)", len(added))
+            self._add_all(added, self._buffer_metrics, "metrics")
+
+    def _bulk_target(self, scope):
+        # report, location parts and ignored lines of a scope
+        if scope is None:
+            raise AnalysisScopeError("must provide a scope")
+        location = scope.location
+        report = self._reports.get(scope.id,
+                                   self._reports.get(location.largest_scope.id))
+        if report is None:
+            raise AnalysisScopeError("invalid scope: " + scope.id)
+        ignored = self._lines.get(scope.id)
+        if isinstance(location, Location):
+            return report, location.package, location.file, ignored
+        return report, None, None, ignored
+
+    @staticmethod
+    def _scope_location(scope, line, function, class_):
+        location = scope.location
+        location.line = line
+        location.function = function
+        location.class_ = class_
+        return location
+
+    def _add_all(self, added, buffered, attr):
+        self._added += len(added)
+        if not self._recording is None:
+            self._recording.extend(added)
+        if not buffered is None:
+            buffered.extend(datum for report, datum in added)
+        else:
+            for report, datum in added:
+                getattr(report, attr).append(datum)
+
+    def _add_violation(self, report, datum):
+        self._added += 1
+        if not self._recording is None:
+            self._recording.append((report, datum))
+        if not self._buffer_violations is None:
+            self._buffer_violations.append(datum)
+        else:
+            report.violations.append(datum)
+
+    def _add_metric(self, report, datum):
+        self._added += 1
+        if not self._recording is None:
+            self._recording.append((report, datum))
         if not self._buffer_metrics is None:
             self._buffer_metrics.append(datum)
         else:
@@ -222,10 +450,355 @@ class PluginInterface(LoggingObject):
         self._buffer_metrics = None
 
 
+###############################################################################
+# Query Result Cache
+###############################################################################
+
+class QueryCache(LoggingObject):
+    """Matches of package queries from previous runs, keyed by the
+        query text and a fingerprint of the package model (the package,
+        its files, the nodes extracted from it and the configurations
+        in which they are launched, reachable through `node.instances`).
+        Other packages, reachable through `package.project`, are not
+        part of the fingerprint; queries should not depend on them.
+        Only entries used or created in the current run are saved.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.hits = 0
+        self._old = {}
+        self._new = {}
+        self._fingerprints = {}
+        self._refs = {}
+        try:
+            with open(path, "r") as f:
+                self._old = json.load(f)
+        except IOError as e:
+            self.log.debug("No query cache at %s: %s", path, e)
+        except ValueError as e:
+            self.log.warning("Ignoring malformed query cache %s: %s", path, e)
+
+    def get(self, rule, pkg):
+        if not rule.query:
+            return None
+        key = self._key(rule, pkg)
+        records = self._old.get(key)
+        if records is None:
+            return None
+        objects = self._refs_for(pkg)[1]
+        try:
+            result = [self._load(record, objects) for record in records]
+        except (KeyError, TypeError, ValueError) as e:
+            self.log.debug("Discarding cached matches of %s: %s", rule.id, e)
+            return None
+        self._new[key] = records
+        self.hits += 1
+        return result
+
+    def put(self, rule, pkg, result):
+        if not rule.query:
+            return
+        refs = self._refs_for(pkg)[0]
+        try:
+            records = [self._dump(match, refs) for match in result]
+        except UnsharedObjectError as e:
+            self.log.debug("Cannot cache matches of %s: %s", rule.id, e)
+            return
+        self._new[self._key(rule, pkg)] = records
+
+    def save(self):
+        self.log.debug("Saving query cache to %s", self.path)
+        try:
+            with open(self.path, "w") as f:
+                json.dump(self._new, f, separators=(",", ":"))
+        except IOError as e:
+            self.log.warning("Could not save query cache: %s", e)
+
+    def _key(self, rule, pkg):
+        fingerprint = self._fingerprints.get(pkg.id)
+        if fingerprint is None:
+            fingerprint = self.fingerprint(pkg)
+            self._fingerprints[pkg.id] = fingerprint
+        return sha1(rule.query.encode("utf-8") + "\n" + fingerprint).hexdigest()
+
+    @staticmethod
+    def fingerprint(pkg):
+        configs = []
+        seen = set()
+        for node in pkg.nodes:
+            for instance in node.instances:
+                config = instance.configuration
+                if not id(config) in seen:
+                    seen.add(id(config))
+                    configs.append(config)
+        model = {
+            "package": [pkg.id, pkg.version, pkg.is_metapackage],
+            "files": [sf.to_JSON_object() for sf in pkg.source_files],
+            "nodes": [node.to_JSON_object() for node in pkg.nodes],
+            "configurations": [[config.id,
+                                QueryCache._stable(config.to_JSON_object()),
+                                [sf.id for sf in config.roslaunch]]
+                               for config in configs]
+        }
+        data = json.dumps(model, sort_keys = True,
+                          default = QueryCache._json_default)
+        return sha1(data).hexdigest()
+
+    @staticmethod
+    def _stable(value, uids = None):
+        # uids of runtime objects change between runs; they are replaced
+        # by their order of appearance, which keeps the links between them
+        uids = {} if uids is None else uids
+        if isinstance(value, dict):
+            result = {}
+            for key in sorted(value):
+                other = value[key]
+                if key.endswith("uid") and not other is None:
+                    result[key] = uids.setdefault(other, len(uids))
+                else:
+                    result[key] = QueryCache._stable(other, uids)
+            return result
+        if isinstance(value, list):
+            return [QueryCache._stable(other, uids) for other in value]
+        return value
+
+    @staticmethod
+    def _json_default(obj):
+        if isinstance(obj, RosName):
+            return obj.full
+        return str(obj)
+
+    def _refs_for(self, pkg):
+        # stable references to the objects of a package, across runs
+        refs = self._refs.get(pkg.id)
+        if refs is None:
+            by_id = {id(pkg): pkg.id}
+            for sf in pkg.source_files:
+                by_id[id(sf)] = sf.id
+            for node in pkg.nodes:
+                by_id[id(node)] = node.id
+                for attr in ("advertise", "subscribe", "service", "client",
+                             "read_param", "write_param"):
+                    for i, call in enumerate(getattr(node, attr)):
+                        by_id[id(call)] = "{}#{}#{}".format(node.id, attr, i)
+            objects = {}
+            for obj in [pkg] + pkg.source_files + pkg.nodes:
+                objects[by_id[id(obj)]] = obj
+            for node in pkg.nodes:
+                for attr in ("advertise", "subscribe", "service", "client",
+                             "read_param", "write_param"):
+                    for call in getattr(node, attr):
+                        objects[by_id[id(call)]] = call
+            refs = (by_id, objects)
+            self._refs[pkg.id] = refs
+        return refs
+
+    def _dump(self, value, refs):
+        if value is None or isinstance(value, (bool, int, long, float, basestring)):
+            return ["v", value]
+        key = refs.get(id(value))
+        if not key is None:
+            return ["o", key]
+        if isinstance(value, tuple):
+            return ["t", [self._dump(v, refs) for v in value]]
+        if isinstance(value, list):
+            return ["l", [self._dump(v, refs) for v in value]]
+        if isinstance(value, dict):
+            return ["d", [[self._dump(k, refs), self._dump(v, refs)]
+                          for k, v in value.iteritems()]]
+        raise UnsharedObjectError(value)
+
+    def _load(self, record, objects):
+        tag, value = record
+        if tag == "v":
+            if isinstance(value, unicode):
+                try:
+                    return str(value)
+                except UnicodeEncodeError:
+                    pass
+            return value
+        if tag == "o":
+            return objects[value]
+        if tag == "t":
+            return tuple(self._load(v, objects) for v in value)
+        if tag == "l":
+            return [self._load(v, objects) for v in value]
+        if tag == "d":
+            return _load_dict([(self._load(k, objects), self._load(v, objects))
+                               for k, v in value])
+        raise ValueError("unknown record: " + tag)
+
+
+###############################################################################
+# Plugin Result Cache
+###############################################################################
+
+class PluginCache(LoggingObject):
+    """Persistent cache of the violations and metrics that plugins report
+        when analysing a file, for plugins that declare `cache: files`.
+        Entries are keyed by the plugin name and version, the allowed
+        rules and metrics, the file, its contents and its ignored lines.
+        Only entries used or created in the current run are saved.
+    """
+
+    def __init__(self, path, database, allowed_rules, allowed_metrics,
+                 ignored_lines):
+        self.path = path
+        self.hits = 0
+        self._data = database
+        self._lines = ignored_lines or {}
+        self._old = {}
+        self._new = {}
+        self._digests = {}
+        allowed = json.dumps([sorted(allowed_rules), sorted(allowed_metrics)])
+        self._allowed = sha1(allowed).hexdigest()
+        try:
+            with open(path, "r") as f:
+                self._old = json.load(f)
+        except IOError as e:
+            self.log.debug("No plugin cache at %s: %s", path, e)
+        except ValueError as e:
+            self.log.warning("Ignoring malformed plugin cache %s: %s", path, e)
+
+    def replay(self, iface, plugin, sf):
+        # reports the cached results of `plugin` for `sf`, if any
+        key = self._key(plugin, sf)
+        records = self._old.get(key) if not key is None else None
+        if records is None:
+            return False
+        try:
+            data = [self._load(record, iface._reports) for record in records]
+        except (KeyError, TypeError, ValueError) as e:
+            self.log.debug("Discarding cached results of %s for %s: %s",
+                           plugin.name, sf.id, e)
+            return False
+        for report, datum in data:
+            if isinstance(datum, Violation):
+                iface._add_violation(report, datum)
+            else:
+                iface._add_metric(report, datum)
+        self._new[key] = records
+        self.hits += 1
+        return True
+
+    def put(self, plugin, sf, recorded):
+        key = self._key(plugin, sf)
+        if key is None:
+            return
+        try:
+            self._new[key] = [self._dump(report, datum)
+                              for report, datum in recorded]
+        except (AttributeError, TypeError) as e:
+            self.log.debug("Cannot cache results of %s for %s: %s",
+                           plugin.name, sf.id, e)
+
+    def save(self):
+        self.log.debug("Saving plugin cache to %s", self.path)
+        try:
+            with open(self.path, "w") as f:
+                json.dump(self._new, f, separators=(",", ":"))
+        except IOError as e:
+            self.log.warning("Could not save plugin cache: %s", e)
+
+    def mark(self):
+        return set(self._new), self.hits
+
+    def changes(self, mark):
+        # entries created or used (in a worker process) since `mark`
+        keys, hits = mark
+        return (dict((k, v) for k, v in self._new.iteritems()
+                     if not k in keys), self.hits - hits)
+
+    def merge(self, changes):
+        entries, hits = changes
+        self._new.update(entries)
+        self.hits += hits
+
+    def _key(self, plugin, sf):
+        digest = self._digests.get(sf.id)
+        if digest is None:
+            try:
+                with open(sf.path, "rb") as f:
+                    digest = sha1(f.read()).hexdigest()
+            except IOError as e:
+                self.log.debug("Cannot read %s: %s", sf.path, e)
+                return None
+            self._digests[sf.id] = digest
+        # findings are recorded with their file, so files with the
+        # same contents (e.g., empty __init__.py) get their own entries
+        data = json.dumps([plugin.name, plugin.version, self._allowed,
+                           sf.id, digest, self._lines.get(sf.id)],
+                          sort_keys = True, default = self._json_default)
+        return sha1(data).hexdigest()
+
+    @staticmethod
+    def _json_default(obj):
+        if isinstance(obj, (set, frozenset)):
+            return sorted(obj)
+        if hasattr(obj, "to_JSON_object"):
+            return obj.to_JSON_object()
+        return str(obj)
+
+    def _dump(self, report, datum):
+        location = datum.location
+        loc = [location.package.id,
+               location.file.id if not location.file is None else None,
+               location.line, location.function, location.class_]
+        if isinstance(datum, Violation):
+            return ["v", report.scope.id, datum.rule.id, loc, datum.details,
+                    [obj.id for obj in datum.affected]]
+        return ["m", report.scope.id, datum.metric.id, loc, datum.value]
+
+    def _load(self, record, reports):
+        tag = record[0]
+        report = reports[record[1]]
+        pkg, sf, line, function, class_ = record[3]
+        location = Location(self._data.packages[pkg],
+                            file = self._data.files[sf] if sf else None,
+                            line = line, fun = function, cls = class_)
+        if tag == "v":
+            datum = Violation(self._data.rules[record[2]], location,
+                              details = record[4])
+            datum.affected = [self._scope(ident) for ident in record[5]]
+        else:
+            datum = Measurement(self._data.metrics[record[2]], location,
+                                record[4])
+        return report, datum
+
+    def _scope(self, ident):
+        for scopes in (self._data.files, self._data.packages,
+                       self._data.nodes):
+            if ident in scopes:
+                return scopes[ident]
+        raise KeyError(ident)
+
+
 ###############################################################################
 # HAROS Query Engine
 ###############################################################################
 
+class QueryTable(dict):
+    """Index of query objects by some key (e.g. a message type).
+        Keys without objects map to an empty tuple.
+        Queries look keys up in FLWR expressions (`for x in t["key"]`);
+        path expressions (`t["key"]`) filter the table items instead.
+    """
+    def __missing__(self, key):
+        return ()
+
+
+class LazyGraph(object):
+    """Stands for the ComputationGraph of a configuration in queries,
+        so that it is only built by the queries that use it.
+    """
+    def __init__(self, config):
+        self.configuration = config
+
+    def __getattr__(self, name):
+        return getattr(self.configuration.graph, name)
+
+
 class QueryEngine(LoggingObject):
     query_data = {
         "files": [],
@@ -251,72 +824,361 @@ class QueryEngine(LoggingObject):
         "round": round
     }
 
-    def __init__(self, database, pyflwor):
+    # collections counted as the objects scanned by a query
+    scanned_data = ("files", "packages", "nodes", "configs",
+                    "topics", "services", "parameters")
+
+    # path queries, such as "nodes/publishers[...]", split into
+    # the leading path expression and the rest of the query
+    leading_path = re.compile(r"^\s*([A-Za-z_]\w*(?:\s*/\s*[A-Za-z_]\w*)*)"
+                              r"\s*(\[.*)$", re.DOTALL)
+    shared_var = "_shared_path"
+    # python rules given as references to "package.module:function"
+    python_ref = re.compile(r"^\s*([A-Za-z_][\w.]*):([A-Za-z_]\w*)\s*$")
+
+    def __init__(self, database, pyflwor, jobs = 1, cache = None,
+                 time_limit = None, result_limit = None):
         self.pyflwor = pyflwor
+        self.jobs = jobs
+        self.cache = cache
+        self.time_limit = time_limit     # seconds per rule and scope
+        self.result_limit = result_limit # matches per rule and scope
+        self.profiles = {}
+        self._paths = {}    # rule id -> shared leading path
+        self._batched = {}  # rule id -> query over the shared path
+        self._functions = {} # rule id -> python rule
         self.data = dict(self.query_data)
         self.data["is_rosglobal"] = QueryEngine.is_rosglobal
         self.data["files"] = list(database.files.itervalues())
         self.data["packages"] = list(database.packages.itervalues())
         self.data["nodes"] = list(database.nodes.itervalues())
         self.data["configs"] = list(database.configurations)
+        self._tables = {}
+        self._make_tables()
 
     def execute(self, rules, reports):
         pkg_rules = []
         config_rules = []
         other_rules = []
         for rule in rules:
-            if rule.query:
+            if rule.query or rule.python:
+                profile = QueryProfile(rule)
+                start = time.time()
+                try:
+                    if rule.python:
+                        self._functions[rule.id] = self._compile_python(rule)
+                    else:
+                        self.pyflwor.compile(rule.query)
+                except SyntaxError as e:
+                    self.log.error("SyntaxError on query %s: %s", rule.id, e)
+                    continue
+                except (ImportError, AttributeError) as e:
+                    self.log.error("Cannot load python rule %s: %s",
+                                   rule.id, e)
+                    continue
+                profile.compile_time = time.time() - start
+                self.profiles[rule.id] = profile
                 if rule.scope == "package":
                     pkg_rules.append(rule)
                 elif rule.scope == "configuration":
                     config_rules.append(rule)
                 else:
                     other_rules.append(rule)
-        self._execute_pkg_queries(pkg_rules, reports)
-        self._execute_config_queries(config_rules, reports)
-        for rule in other_rules:
-            self._execute(rule, self.data, reports, None)
+        self._make_batches(pkg_rules)
+        self._make_batches(config_rules)
+        if self.jobs > 1 or not self.time_limit is None:
+            # time limits are enforced by killing worker processes
+            self._execute_parallel(pkg_rules, config_rules, other_rules,
+                                   reports)
+        else:
+            self._execute_pkg_queries(pkg_rules, reports)
+            self._execute_config_queries(config_rules, reports)
+            for rule in other_rules:
+                self._execute(rule, self.data, reports, None)
 
     def _execute_pkg_queries(self, rules, reports):
         data = dict(self.query_data)
         data["is_rosglobal"] = QueryEngine.is_rosglobal
         for pkg in self.data["packages"]:
-            data["package"] = pkg
-            data["files"] = pkg.source_files
-            data["nodes"] = pkg.nodes
-            location = pkg.location
-            for rule in rules:
-                self._execute(rule, data, reports, location)
+            self._pkg_data(data, pkg)
+            pending = self._replay(rules, pkg, data, reports)
+            self._execute_rules(pending, data, reports, pkg.location)
 
     def _execute_config_queries(self, rules, reports):
         data = dict(self.query_data)
         data["is_rosglobal"] = QueryEngine.is_rosglobal
         for config in self.data["configs"]:
-            data["config"] = config
-            data["nodes"] = config.nodes
-            data["topics"] = config.topics
-            data["services"] = config.services
-            data["parameters"] = config.parameters
-            location = config.location
-            for rule in rules:
-                self._execute(rule, data, reports, location)
+            self._config_data(data, config)
+            self._execute_rules(rules, data, reports, config.location)
+
+    def _execute_parallel(self, pkg_rules, config_rules, other_rules,
+                          reports):
+        tasks = []
+        if pkg_rules:
+            for pkg in self.data["packages"]:
+                data = dict(self.query_data)
+                self._pkg_data(data, pkg)
+                pending = self._replay(pkg_rules, pkg, data, reports)
+                if pending:
+                    tasks.append((pending, pkg, self._pkg_data))
+        if config_rules:
+            for config in self.data["configs"]:
+                tasks.append((config_rules, config, self._config_data))
+        if other_rules:
+            tasks.append((other_rules, None, self._global_data))
+        if not tasks:
+            return
+        self.log.debug("Executing queries with %d workers.", self.jobs)
+        results = execute_queries(self, tasks, self.jobs)
+        for task, matches in zip(tasks, results):
+            rules, scope, make_data = task
+            location = scope.location if not scope is None else None
+            data = dict(self.query_data)
+            data["is_rosglobal"] = QueryEngine.is_rosglobal
+            make_data(data, scope)
+            for rule, (elapsed, result) in zip(rules, matches):
+                if result is QUERY_TIMEOUT:
+                    self._timeout(rule, data, elapsed, location)
+                elif result is None:
+                    # the matches could not be sent back; run it here
+                    self._execute(rule, data, reports, location)
+                elif result is not False:
+                    self._accept(rule, result, data, elapsed,
+                                 reports, location)
+
+    def _make_tables(self):
+    # ----- relation tables are built once and shared by all queries
+        files = self.data["files"]
+        self.data.update(self._source_tables(files, self.data["nodes"]))
+        self.data["files_by_package"] = self._table(files,
+                                                    lambda f: f.package.name)
+        self.data.update(self._runtime_tables(self.data["configs"]))
+        for pkg in self.data["packages"]:
+            self._tables[pkg.id] = self._source_tables(pkg.source_files,
+                                                       pkg.nodes)
+        for config in self.data["configs"]:
+            self._tables[config.id] = self._runtime_tables((config,))
+
+    def _source_tables(self, files, nodes):
+        return {
+            "files_by_language": self._table(files, lambda f: f.language),
+            "nodes_by_language": self._table(nodes, lambda n: n.language)
+        }
+
+    def _runtime_tables(self, configs):
+        publishers = []
+        subscribers = []
+        servers = []
+        clients = []
+        parameters = []
+        for config in configs:
+            parameters.extend(config.parameters)
+            for node in config.nodes:
+                publishers.extend(node.publishers)
+                subscribers.extend(node.subscribers)
+                servers.extend(node.servers)
+                clients.extend(node.clients)
+        by_type = lambda obj: obj.type
+        return {
+            "publishers_by_type": self._table(publishers, by_type),
+            "subscribers_by_type": self._table(subscribers, by_type),
+            "servers_by_type": self._table(servers, by_type),
+            "clients_by_type": self._table(clients, by_type),
+            "parameters_by_type": self._table(parameters, by_type)
+        }
+
+    @staticmethod
+    def _table(objects, key):
+        table = QueryTable()
+        for obj in objects:
+            table.setdefault(key(obj), []).append(obj)
+        return table
+
+    def _pkg_data(self, data, pkg):
+        data["package"] = pkg
+        data["files"] = pkg.source_files
+        data["nodes"] = pkg.nodes
+        data.update(self._tables[pkg.id])
+
+    def _config_data(self, data, config):
+        data["config"] = config
+        data["nodes"] = config.nodes
+        data["topics"] = config.topics
+        data["services"] = config.services
+        data["parameters"] = config.parameters
+        data["graph"] = LazyGraph(config)
+        data.update(self._tables[config.id])
+
+    def _global_data(self, data, scope):
+        data.update(self.data)
+
+    def _make_batches(self, rules):
+        # Rules that start with the same path expression share its
+        # traversal; the rest of each query runs over the shared result.
+        batches = {}
+        for rule in rules:
+            if rule.id in self._functions:
+                continue
+            match = self.leading_path.match(rule.query)
+            if match:
+                path = re.sub(r"\s+", "", match.group(1))
+                query = self.shared_var + match.group(2)
+                batches.setdefault(path, []).append((rule, query))
+        for path, batch in batches.iteritems():
+            if len(batch) < 2:
+                continue
+            try:
+                self.pyflwor.compile(path)
+                for rule, query in batch:
+                    self.pyflwor.compile(query)
+            except SyntaxError as e:
+                self.log.debug("Cannot batch queries over %s: %s", path, e)
+                continue
+            self.log.debug("Batching %d queries over %s.", len(batch), path)
+            for rule, query in batch:
+                self._paths[rule.id] = path
+                self._batched[rule.id] = query
+
+    def _execute_rules(self, rules, data, reports, default_location):
+        for rule, elapsed, result in self._evaluate_rules(rules, data):
+            if not result is None:
+                self._accept(rule, result, data, elapsed,
+                             reports, default_location)
+
+    def _replay(self, rules, pkg, data, reports):
+        # reports cached matches; returns the rules that must be evaluated
+        if self.cache is None:
+            return rules
+        pending = []
+        location = pkg.location
+        for rule in rules:
+            result = self.cache.get(rule, pkg)
+            if result is None:
+                pending.append(rule)
+            else:
+                self.log.debug("Using cached matches of %s for %s.",
+                               rule.id, pkg.id)
+                self.profiles[rule.id].cached += 1
+                result = self._limit_matches(rule, result, location)
+                self._profile(rule, location, data, 0.0, result)
+                self._report_all(rule, result, reports, location)
+        return pending
+
+    def _accept(self, rule, result, data, elapsed, reports, location):
+        matches = self._limit_matches(rule, result, location)
+        if (matches is result and rule.scope == "package"
+                and not self.cache is None):
+            self.cache.put(rule, location.package, result)
+        self._profile(rule, location, data, elapsed, matches)
+        self._report_all(rule, matches, reports, location)
+
+    def _limit_matches(self, rule, result, location):
+        limit = self.result_limit
+        if limit is None or len(result) <= limit:
+            return result
+        self._overrun(rule, location, "matches")
+        self.log.warning("Query %s exceeded the budget of %d matches on %s; "
+                         "reporting only the first %d.", rule.id, limit,
+                         self._scope_name(location), limit)
+        return list(islice(result, limit))
+
+    def _timeout(self, rule, data, elapsed, location):
+        self._overrun(rule, location, "time")
+        self.log.warning("Query %s exceeded the time budget of %.1fs on %s; "
+                         "its evaluation was stopped.", rule.id,
+                         self.time_limit, self._scope_name(location))
+        self._profile(rule, location, data, elapsed, ())
+
+    def _overrun(self, rule, location, budget):
+        scope = location.smallest_scope.id if not location is None else None
+        self.profiles[rule.id].overruns.append((scope, budget))
+
+    @staticmethod
+    def _scope_name(location):
+        if location is None:
+            return "the global scope"
+        return location.smallest_scope.id
+
+    def _evaluate_rules(self, rules, data):
+        # yields (rule, time, result); the time of a shared traversal
+        # is counted for the first rule that needs it
+        shared = {}
+        for rule in rules:
+            start = time.time()
+            path = self._paths.get(rule.id)
+            if path is None:
+                result = self._evaluate(rule, data)
+            else:
+                shared_data = shared.get(path)
+                if shared_data is None:
+                    shared_data = dict(data)
+                    shared_data[self.shared_var] = self.pyflwor(path, data)
+                    shared[path] = shared_data
+                result = self._evaluate(rule, shared_data,
+                                        query = self._batched[rule.id])
+            yield rule, time.time() - start, result
 
     def _execute(self, rule, data, reports, default_location):
+        start = time.time()
+        result = self._evaluate(rule, data)
+        elapsed = time.time() - start
+        if not result is None:
+            self._accept(rule, result, data, elapsed,
+                         reports, default_location)
+
+    def _evaluate(self, rule, data, query = None):
+        function = self._functions.get(rule.id)
+        if not function is None:
+            return self._call_python(rule, function, data)
         try:
-            result = self.pyflwor(rule.query, data)
+            return self.pyflwor(query or rule.query, data)
         except SyntaxError as e:
             self.log.error("SyntaxError on query %s: %s", rule.id, e)
-        else:
-            # result can be of types:
-            # - pyflwor.OrderedSet.OrderedSet<object> for Path queries
-            # - tuple<object> for FLWR queries single return
-            # - tuple<tuple<object>> for FLWR queries multi return
-            # - tuple<dict<str, object>> for FLWR queries named return
-            # NOTE: sometimes 'object' can be a tuple or dict...
-            self.log.info("Query %s found %d matches.", rule.id, len(result))
-            for match in result:
-                self.log.debug("Query %s found %s", rule.id, match)
-                self._report(rule, match, reports, default_location)
+            return None
+
+    def _compile_python(self, rule):
+        match = self.python_ref.match(rule.python)
+        if match:
+            module = importlib.import_module(match.group(1))
+            return getattr(module, match.group(2))
+        code = compile(rule.python.strip(), "<rule " + rule.id + ">", "eval")
+        def function(data):
+            return eval(code, data)
+        return function
+
+    def _call_python(self, rule, function, data):
+        # python rules receive a copy of the query variables and
+        # return an iterable of matches, like queries
+        try:
+            result = function(dict(data))
+        except Exception as e:
+            self.log.error("Python rule %s raised %s: %s",
+                           rule.id, type(e).__name__, e)
+            self.log.debug("%s", traceback.format_exc())
+            return None
+        if result is None:
+            return ()
+        if not isinstance(result, (list, tuple)):
+            result = list(result)
+        return result
+
+    def _profile(self, rule, location, data, elapsed, result):
+        scope = location.smallest_scope.id if not location is None else None
+        objects = sum(len(data.get(key, ())) for key in self.scanned_data)
+        self.profiles[rule.id].scopes.append((scope, elapsed,
+                                              len(result), objects))
+
+    def _report_all(self, rule, result, reports, default_location):
+        # result can be of types:
+        # - pyflwor.OrderedSet.OrderedSet<object> for Path queries
+        # - tuple<object> for FLWR queries single return
+        # - tuple<tuple<object>> for FLWR queries multi return
+        # - tuple<dict<str, object>> for FLWR queries named return
+        # NOTE: sometimes 'object' can be a tuple or dict...
+        self.log.info("Query %s found %d matches.", rule.id, len(result))
+        for match in result:
+            self.log.debug("Query %s found %s", rule.id, match)
+            self._report(rule, match, reports, default_location)
 
     def _report(self, rule, match, reports, default_location):
         details = ""
@@ -380,17 +1242,537 @@ class QueryEngine(LoggingObject):
         return name and name.startswith("/")
 
 
+###############################################################################
+# Parallel Query Execution
+###############################################################################
+
+# Queries over different packages and configurations are independent, so they
+# can be evaluated in worker processes. Workers are forked after the queries
+# are compiled, and share a read-only (copy-on-write) snapshot of the data.
+# Matches are sent back as lightweight records, in which the objects from the
+# shared data are replaced by their id (which is the same in the parent).
+# Violations are then created in the parent, as in sequential execution.
+# With a time limit, each task runs in its own process, which reports the
+# matches of each rule as soon as they are found. A worker that spends more
+# than the time limit on a single rule is killed, and a new one is started
+# for the remaining rules of the task.
+
+_shared_objects = {}    # id -> object shared with the workers, for dumps
+
+QUERY_TIMEOUT = object() # marks rules stopped by the time limit
+
+
+class UnsharedObjectError(Exception):
+    def __init__(self, value):
+        self.value = value
+    def __str__(self):
+        return repr(self.value)
+
+
+def execute_queries(engine, tasks, jobs):
+    """Evaluate the queries of each (rules, scope, make_data) task
+        with up to `jobs` worker processes.
+        Returns, for each task, a list with the (time, matches) of each
+        rule; matches are None for rules that must be evaluated again,
+        False for rules that failed, and QUERY_TIMEOUT for rules that
+        exceeded the time limit of the engine.
+    """
+    global _shared_objects
+    _shared_objects = _query_objects(engine.data)
+    try:
+        if engine.time_limit is None:
+            task_matches = lambda i: list(_task_matches(engine, tasks[i]))
+            results = map_workers(task_matches, len(tasks), jobs)
+        else:
+            results = _execute_timed(engine, tasks, jobs)
+    finally:
+        objects = _shared_objects
+        _shared_objects = {}
+    return [[(elapsed, [_load_match(record, objects) for record in records]
+              if isinstance(records, list) else records)
+             for elapsed, records in matches] for matches in results]
+
+
+def _execute_timed(engine, tasks, jobs):
+    # each task runs in its own worker, which sends the matches of each
+    # rule as they are found; the time limit starts again for each rule
+    time_limit = engine.time_limit
+    results = [[] for task in tasks]
+
+    def start(i):
+        first = len(results[i])
+        def target(conn):
+            for matches in _task_matches(engine, tasks[i], first):
+                conn.send(matches)
+            conn.close()
+        worker = WorkerProcess(target, task = i)
+        worker.started = time.time()
+        worker.deadline = worker.started + time_limit
+        return worker
+
+    def receive(worker, message):
+        matches = results[worker.task]
+        if not message is EOFError:
+            matches.append(message)
+            worker.started = time.time()
+            worker.deadline = worker.started + time_limit
+            return False
+        worker.stop()
+        rules = tasks[worker.task][0]
+        if len(matches) < len(rules):
+            engine.log.error("Query worker exited after %d of %d rules.",
+                             len(matches), len(rules))
+            matches.extend((0.0, False) for rule in rules[len(matches):])
+        return True
+
+    def expire(worker):
+        matches = results[worker.task]
+        matches.append((time.time() - worker.started, QUERY_TIMEOUT))
+        if len(matches) < len(tasks[worker.task][0]):
+            pending.appendleft(worker.task)
+
+    pending = deque(xrange(len(tasks)))
+    run_workers(pending, start, receive, jobs, expire = expire)
+    return results
+
+
+def _task_matches(engine, task, first = 0):
+    rules, scope, make_data = task
+    data = dict(engine.query_data)
+    data["is_rosglobal"] = QueryEngine.is_rosglobal
+    make_data(data, scope)
+    limit = engine.result_limit
+    for rule, elapsed, result in engine._evaluate_rules(rules[first:], data):
+        if result is None:
+            yield elapsed, False # failed, already logged
+            continue
+        if not limit is None:
+            # one more than the limit, so that the parent sees the overrun
+            result = islice(result, limit + 1)
+        try:
+            yield elapsed, [_dump_match(match) for match in result]
+        except UnsharedObjectError as e:
+            engine.log.debug("Query %s matched %s, which is not "
+                             "shared with the parent process.",
+                             rule.id, e.value)
+            yield elapsed, None
+
+
+def _query_objects(data):
+    objects = {}
+    for pkg in data["packages"]:
+        objects[id(pkg)] = pkg
+        for obj in (pkg.project, pkg.repository):
+            if not obj is None:
+                objects[id(obj)] = obj
+    for sf in data["files"]:
+        objects[id(sf)] = sf
+    for node in data["nodes"]:
+        objects[id(node)] = node
+        for calls in (node.advertise, node.subscribe, node.service,
+                      node.client, node.read_param, node.write_param):
+            for call in calls:
+                objects[id(call)] = call
+    for config in data["configs"]:
+        objects[id(config)] = config
+        for resources in (config.nodes, config.topics,
+                          config.services, config.parameters):
+            for resource in resources:
+                objects[id(resource)] = resource
+        for node in config.nodes:
+            for links in (node.publishers, node.subscribers, node.servers,
+                          node.clients, node.reads, node.writes):
+                for link in links:
+                    objects[id(link)] = link
+    return objects
+
+
+def _dump_match(value):
+    if value is None or isinstance(value, (bool, int, long, float, basestring)):
+        return ("v", value)
+    if _shared_objects.get(id(value)) is value:
+        return ("o", id(value))
+    if isinstance(value, tuple):
+        return ("t", [_dump_match(v) for v in value])
+    if isinstance(value, list):
+        return ("l", [_dump_match(v) for v in value])
+    if isinstance(value, dict):
+        return ("d", [(_dump_match(k), _dump_match(v))
+                      for k, v in value.iteritems()])
+    raise UnsharedObjectError(value)
+
+
+def _load_match(record, objects):
+    tag, value = record
+    if tag == "v":
+        return value
+    if tag == "o":
+        return objects[value]
+    if tag == "t":
+        return tuple(_load_match(v, objects) for v in value)
+    if tag == "l":
+        return [_load_match(v, objects) for v in value]
+    return _load_dict([(_load_match(k, objects), _load_match(v, objects))
+                       for k, v in value])
+
+
+def _load_dict(items):
+    # ----- items come in the iteration order of the original dict;
+    #       when keys collide, rebuilding in that order may swap them
+    result = dict(items)
+    if result.keys() != [k for k, v in items]:
+        result = dict(reversed(items))
+    return result
+
+
+###############################################################################
+# Parallel Plugin Execution
+###############################################################################
+
+# Plugins are independent of each other, and spend most of their time waiting
+# for external tools, so each one can run in its own (forked) worker process.
+# The file analyses of plugins that declare `parallel: files` in their
+# manifest are also split among workers, in chunks of consecutive files.
+# Workers share a copy-on-write snapshot of the database and reports. As a
+# task goes, its worker streams back the violations and metrics it added,
+# in which rules, metrics and scopes are replaced by their ids. The parent
+# merges them into its reports in task order, as in sequential execution.
+# Whatever a plugin changes in the database is discarded with its worker.
+# Plugins stop themselves when they run out of time (see _PluginWatchdog);
+# workers that still do not finish shortly after are killed.
+
+PLUGIN_TIMEOUT = object() # marks a worker killed after its time limit
+
+
+def run_plugins(iface, tasks, run, jobs, time_limits = None, then = None,
+                barrier = None):
+    """Call `run(iface, task)` for each task (e.g., a plugin) in a worker
+        process, with up to `jobs` workers.
+        Returns, for each task, a tuple with the violations and metrics
+        added to each report (by report key), the violations and metrics
+        added to the interface buffers, the exported files, the error
+        raised by `run` (if any) and the value it returned.
+        The error is PLUGIN_TIMEOUT if the worker was killed after its
+        time limit (seconds, in `time_limits`). Findings are streamed by
+        workers, so those of failed workers are returned up to the failure.
+        With `then`, workers wait after `run` until all tasks are done.
+        `barrier(results)` is then called, to merge the results into
+        `iface`, and returns the time limits (by task index) of the tasks
+        that go on. Their workers get the findings merged into `iface`
+        and call `then(iface, task)` (with the module state left by `run`),
+        and the results of `then` are returned instead.
+    """
+    global _shared_objects
+    # ----- workers of a plugin may run their own workers (per file)
+    previous = _shared_objects
+    _shared_objects = _query_objects(_plugin_data(iface._data))
+    marks = _findings_marks(iface)
+    results = [([], [], [], [], None, None) for task in tasks]
+    waiting = {} # task index -> worker, waiting for `then`
+    park = not then is None
+
+    def start(i):
+        limit = time_limits[i] if time_limits else None
+        target = lambda conn: _plugin_worker(iface, run, tasks[i], conn,
+                                             then = then)
+        return WorkerProcess(target, daemon = False, duplex = park, task = i,
+            deadline = None if limit is None else time.time() + limit)
+
+    def resume(i):
+        worker = waiting.pop(i)
+        limit = time_limits[i]
+        worker.deadline = None if limit is None else time.time() + limit
+        worker.send(findings)
+        return worker
+
+    def receive(worker, message):
+        i = worker.task
+        if message is EOFError:
+            iface.log.error("Plugin worker exited unexpectedly.")
+            message = (None, "worker exited unexpectedly", None)
+        if message[0] == "findings":
+            for items, more in zip(results[i], message[1:]):
+                items.extend(more)
+            return False
+        if park and message[1] is None:
+            waiting[i] = worker # waiting workers do not count as jobs
+        else:
+            worker.stop()
+        results[i] = results[i][:4] + message[1:]
+        return True
+
+    def expire(worker):
+        results[worker.task] = results[worker.task][:4] + (PLUGIN_TIMEOUT,
+                                                           None)
+        iface.log.debug("Plugin worker killed after its time limit.")
+
+    try:
+        run_workers(deque(xrange(len(tasks))), start, receive, jobs,
+                    expire = expire)
+        if not then is None:
+            time_limits = barrier([_load_findings(iface._data, result,
+                                                  _shared_objects)
+                                   for result in results])
+            for i in waiting.keys():
+                if not i in time_limits:
+                    waiting.pop(i).stop()
+            findings = _dump_findings(iface, marks)
+            results = [([], [], [], [], None, None) for task in tasks]
+            park = False
+            run_workers(deque(sorted(waiting)), resume, receive, jobs,
+                        expire = expire)
+    finally:
+        for worker in waiting.itervalues():
+            worker.stop()
+        objects = _shared_objects
+        _shared_objects = previous
+    return [_load_findings(iface._data, result, objects)
+            for result in results]
+
+
+def _plugin_data(database):
+    return {
+        "packages": database.packages.values(),
+        "files": database.files.values(),
+        "nodes": database.nodes.values(),
+        "configs": database.project.configurations
+    }
+
+
+def stream_findings(iface, at_least = 1):
+    """Send the findings added since the last call to the parent process,
+        if running in a plugin worker and there are at least `at_least`.
+    """
+    if iface._stream is None:
+        return
+    conn, marks = iface._stream
+    if iface._added - marks[0] < at_least:
+        return
+    conn.send(("findings",) + _dump_findings(iface, marks))
+    iface._stream = (conn, _findings_marks(iface))
+
+
+def _findings_marks(iface):
+    sizes = {}
+    for key, report in iface._reports.iteritems():
+        sizes[key] = (len(report.violations),
+                      len(getattr(report, "metrics", ())))
+    buffered = (len(iface._buffer_violations or ()),
+                len(iface._buffer_metrics or ()))
+    return (iface._added, sizes, buffered, set(iface._exported))
+
+
+def _dump_findings(iface, marks):
+    # the findings added since the marks were taken
+    added, sizes, buffered, exported = marks
+    reports = []
+    for key, report in iface._reports.iteritems():
+        nv, nm = sizes[key]
+        violations = report.violations[nv:]
+        metrics = getattr(report, "metrics", ())[nm:]
+        if violations or metrics:
+            reports.append((key, [_dump_violation(v) for v in violations],
+                            [_dump_measurement(m) for m in metrics]))
+    violations = (iface._buffer_violations or ())[buffered[0]:]
+    metrics = (iface._buffer_metrics or ())[buffered[1]:]
+    return (reports, [_dump_violation(v) for v in violations],
+            [_dump_measurement(m) for m in metrics],
+            list(iface._exported - exported))
+
+
+def _restore_findings(iface, marks, findings):
+    # replaces the findings added since the marks were taken
+    added, sizes, buffered, exported = marks
+    reports, violations, metrics, files, error, value = _load_findings(
+        iface._data, findings + (None, None), _shared_objects)
+    for key, report in iface._reports.iteritems():
+        nv, nm = sizes[key]
+        del report.violations[nv:]
+        if hasattr(report, "metrics"):
+            del report.metrics[nm:]
+    for key, vs, ms in reports:
+        report = iface._reports[key]
+        report.violations.extend(vs)
+        if ms:
+            report.metrics.extend(ms)
+        added += len(vs) + len(ms)
+    if not iface._buffer_violations is None:
+        del iface._buffer_violations[buffered[0]:]
+        del iface._buffer_metrics[buffered[1]:]
+        iface._buffer_violations.extend(violations)
+        iface._buffer_metrics.extend(metrics)
+        added += len(violations) + len(metrics)
+    iface._added = added
+    iface._exported = exported | set(files)
+
+
+def _plugin_worker(iface, run, task, conn, then = None):
+    # findings already in the reports of the worker are not streamed
+    marks = _findings_marks(iface)
+    error = _plugin_task(iface, run, task, conn, marks)
+    if not then is None and error is None:
+        _restore_findings(iface, marks, conn.recv())
+        _plugin_task(iface, then, task, conn, _findings_marks(iface))
+    conn.close()
+
+
+def _plugin_task(iface, run, task, conn, marks):
+    iface._stream = (conn, marks)
+    value = error = None
+    try:
+        value = run(iface, task)
+    except Exception as e:
+        error = "{}: {}\n{}".format(type(e).__name__, e,
+                                    traceback.format_exc())
+    stream_findings(iface, at_least = 0)
+    conn.send(("done", error, value))
+    return error
+
+
+def _dump_violation(datum):
+    affected = [id(obj) for obj in datum.affected
+                if _shared_objects.get(id(obj)) is obj]
+    return (datum.rule.id, _dump_location(datum.location), datum.details,
+            affected)
+
+
+def _dump_measurement(datum):
+    return (datum.metric.id, _dump_location(datum.location), datum.value)
+
+
+def _dump_location(location):
+    if isinstance(location, Location):
+        return ("l", id(location.package),
+                id(location.file) if not location.file is None else None,
+                location.line, location.function, location.class_)
+    if isinstance(location, RuntimeLocation):
+        return ("r", id(location.configuration))
+    return None
+
+
+def _load_findings(database, result, objects):
+    reports, violations, metrics, exported, error, value = result
+    load_v = lambda r: _load_violation(database, r, objects)
+    load_m = lambda r: _load_measurement(database, r, objects)
+    return ([(key, map(load_v, vs), map(load_m, ms)) for key, vs, ms in reports],
+            map(load_v, violations), map(load_m, metrics), exported, error,
+            value)
+
+
+def _load_violation(database, record, objects):
+    rule_id, location, details, affected = record
+    datum = Violation(database.rules[rule_id],
+                      _load_location(location, objects), details = details)
+    datum.affected = [objects[i] for i in affected]
+    return datum
+
+
+def _load_measurement(database, record, objects):
+    metric_id, location, value = record
+    return Measurement(database.metrics[metric_id],
+                       _load_location(location, objects), value)
+
+
+def _load_location(record, objects):
+    if record is None:
+        return None
+    if record[0] == "r":
+        return RuntimeLocation(objects[record[1]])
+    tag, pkg, sf, line, function, class_ = record
+    return Location(objects[pkg], file = objects.get(sf), line = line,
+                    fun = function, cls = class_)
+
+
+###############################################################################
+# Plugin Resource Accounting
+###############################################################################
+
+class _ResourceMeter(object):
+    """Adds the resources used within a block of code to a phase
+        of a PluginProfile: wall time, CPU time, CPU time of (finished)
+        child processes, the peak resident set size of the whole process
+        and how much it grew within the block (in kilobytes).
+    """
+    def __init__(self, profile, phase):
+        self.profile = profile
+        self.phase = phase
+
+    def __enter__(self):
+        self.wall = time.time()
+        self.own = resource.getrusage(resource.RUSAGE_SELF)
+        self.children = resource.getrusage(resource.RUSAGE_CHILDREN)
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        own = resource.getrusage(resource.RUSAGE_SELF)
+        children = resource.getrusage(resource.RUSAGE_CHILDREN)
+        self.profile.add(self.phase, time.time() - self.wall,
+            own.ru_utime + own.ru_stime
+                - self.own.ru_utime - self.own.ru_stime,
+            children.ru_utime + children.ru_stime
+                - self.children.ru_utime - self.children.ru_stime,
+            own.ru_maxrss, own.ru_maxrss - self.own.ru_maxrss)
+        if exc_type is PluginTimeoutError and self.profile.timed_out is None:
+            self.profile.timed_out = self.phase
+
+
+class _PluginWatchdog(object):
+    """Interrupts the code within it with a PluginTimeoutError once
+        `time_limit` seconds have passed (with SIGALRM, so it must run
+        in the main thread). Does nothing if there is no time limit.
+    """
+    def __init__(self, time_limit):
+        self.time_limit = time_limit
+        self.handler = None
+
+    def __enter__(self):
+        if self.time_limit is None:
+            return
+        self.handler = signal.signal(signal.SIGALRM, self._expire)
+        signal.setitimer(signal.ITIMER_REAL, max(self.time_limit, 0.001))
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self.time_limit is None:
+            return
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, self.handler)
+
+    def _expire(self, signum, frame):
+        raise PluginTimeoutError("time limit exceeded: {:.1f}s".format(
+                                 self.time_limit))
+
+
 ###############################################################################
 # Analysis Manager - Main Interface to Run Analyses
 ###############################################################################
 
 class AnalysisManager(LoggingObject):
-    def __init__(self, data, out_dir, export_dir, pyflwor_dir=None):
+    SLOW_QUERY_TIME = 1.0 # seconds
+    SLOW_QUERY_REPORT = 10
+    FILE_TASKS = 4 # per worker, for plugins with parallel file analysis
+    KILL_DELAY = 10.0 # seconds after the time limit, for plugin workers
+    STREAM_SIZE = 1000 # findings per message, for plugin workers
+
+    def __init__(self, data, out_dir, export_dir, pyflwor_dir=None, jobs=1,
+                 query_cache=None, query_timeout=None, query_limit=None,
+                 plugin_cache=None, plugin_timeout=None,
+                 plugin_timeouts=None, isolate_plugins=False):
         self.database = data
         self.report = None
         self.out_dir = out_dir
         self.export_dir = export_dir
         self.pyflwor_dir = pyflwor_dir
+        self.jobs = jobs
+        self.query_cache = query_cache
+        self.query_timeout = query_timeout
+        self.query_limit = query_limit
+        self.plugin_cache = plugin_cache
+        self.plugin_timeout = plugin_timeout    # default, in seconds
+        self.plugin_timeouts = plugin_timeouts or {} # by plugin name
+        self.isolate_plugins = isolate_plugins  # each in its own process
+        self._plugin_cache = None
+        self._profiles = {}
+        self._files_by_language = {}
+        self._file_order = {}   # file id -> position in the project
 
     def run(self, plugins, allowed_rules=None, allowed_metrics=None,
             ignored_lines=None):
@@ -403,11 +1785,25 @@ class AnalysisManager(LoggingObject):
         self._prepare_directories(plugins)
         project = self.database.project
         reports = self._make_reports(project)
+        self._index_files(project)
         self._execute_queries(reports, allowed_rules)
         iface = PluginInterface(self.database, reports,
                                 allowed_rules, allowed_metrics, ignored_lines)
-        self._analysis(iface, plugins)
-        self._processing(iface, plugins)
+        self._profiles = {}
+        for plugin in plugins:
+            self._profiles[plugin.name] = PluginProfile(plugin.name,
+                time_limit = self._time_limit(plugin))
+        if self.plugin_cache and any(p.cache == "files" for p in plugins):
+            self._plugin_cache = PluginCache(self.plugin_cache, self.database,
+                allowed_rules, allowed_metrics, ignored_lines)
+        if self.isolate_plugins or (self.jobs > 1 and len(plugins) > 1):
+            self._run_plugins(iface, plugins)
+        else:
+            self._analysis(iface, plugins)
+            self._save_plugin_cache()
+            self._processing(iface, plugins)
+        self.report.plugins = [self._profiles[p.name] for p in plugins]
+        self._report_plugin_usage(self.report.plugins)
         self._exports(iface._exported)
         self.report.calculate_statistics()
         stats = self.report.statistics
@@ -441,6 +1837,30 @@ class AnalysisManager(LoggingObject):
         reports[None] = self.report
         return reports
 
+    def _index_files(self, project):
+        # analysed source files by language, in project order
+        self._files_by_language = {}
+        self._file_order = {}
+        for pkg in project.packages:
+            if not pkg._analyse:
+                continue
+            for sf in pkg.source_files:
+                self._file_order[sf.id] = len(self._file_order)
+                self._files_by_language.setdefault(sf.language, []).append(sf)
+
+    def _plugin_files(self, plugin):
+        # the files a plugin analyses, in project order
+        analysis = plugin.analysis
+        if not analysis.f_analysis and not analysis.b_analysis:
+            return []
+        lists = [self._files_by_language[language]
+                 for language in analysis.languages
+                 if language in self._files_by_language]
+        if len(lists) == 1:
+            return list(lists[0])
+        order = self._file_order
+        return sorted(chain.from_iterable(lists), key = lambda sf: order[sf.id])
+
     def _execute_queries(self, reports, allowed_rules):
         try:
             self.log.debug("Monkey-patching pyflwor.")
@@ -452,76 +1872,349 @@ class AnalysisManager(LoggingObject):
                              "Skipping query execution.")
             return
         self.log.debug("Creating query engine.")
-        query_engine = QueryEngine(self.database, pyflwor)
+        cache = None
+        if self.query_cache:
+            cache = QueryCache(self.query_cache)
+        query_engine = QueryEngine(self.database, pyflwor, jobs=self.jobs,
+                                   cache=cache,
+                                   time_limit=self.query_timeout,
+                                   result_limit=self.query_limit)
         rules = tuple(r for r in self.database.rules.viewvalues()
                       if r.id in allowed_rules)
         query_engine.execute(rules, reports)
+        if not cache is None:
+            self.log.info("Reused %d cached query results.", cache.hits)
+            cache.save()
+        profiles = query_engine.profiles.values()
+        profiles.sort(key = lambda p: p.total_time, reverse = True)
+        self.report.queries = profiles
+        self._report_slow_queries(profiles)
+        self._report_overruns(profiles)
+
+    def _report_slow_queries(self, profiles):
+        if not profiles:
+            return
+        self.log.info("Query execution times (slowest first):")
+        for profile in profiles[:self.SLOW_QUERY_REPORT]:
+            if profile.total_time >= self.SLOW_QUERY_TIME:
+                log = self.log.warning
+            else:
+                log = self.log.info
+            log("  %s: %.3fs (compile %.3fs, eval %.3fs over %d scopes), "
+                "%d matches, %d objects scanned", profile.rule.id,
+                profile.total_time, profile.compile_time, profile.eval_time,
+                len(profile.scopes), profile.match_count,
+                profile.object_count)
+
+    def _report_overruns(self, profiles):
+        overruns = [p for p in profiles if p.overruns]
+        if overruns:
+            self.log.warning("%d queries exceeded their budget: %s",
+                len(overruns), ", ".join(p.rule.id for p in overruns))
+
+    def _report_plugin_usage(self, profiles):
+        if not profiles:
+            return
+        self.log.info("Plugin resource usage:")
+        for profile in profiles:
+            self.log.info("  %s: %.3fs (CPU %.3fs, child processes %.3fs), "
+                "RSS growth %d KB (process peak %d KB)", profile.plugin_id,
+                profile.wall_time, profile.cpu_time, profile.child_cpu_time,
+                profile.rss_growth, profile.process_peak_rss)
+
+    def _time_limit(self, plugin):
+        # plugins can be named with or without the common prefix
+        short_name = plugin.name[len(plugin.PREFIX):]
+        return self.plugin_timeouts.get(plugin.name,
+            self.plugin_timeouts.get(short_name, self.plugin_timeout))
+
+    def _time_left(self, profile):
+        if profile.time_limit is None:
+            return None
+        return profile.time_limit - profile.wall_time
+
+    def _plugin_timeout(self, plugin, profile):
+        self.log.error("Plugin %s exceeded its time limit (%.1fs) in %s.",
+                       plugin.name, profile.time_limit, profile.timed_out)
 
     def _analysis(self, iface, plugins):
         for plugin in plugins:
-            self.log.debug("Running analyses for " + plugin.name)
-            with cwd(plugin.tmp_path):
+            self._analyse_plugin(iface, plugin)
+
+    def _save_plugin_cache(self):
+        if not self._plugin_cache is None:
+            self.log.info("Reused %d cached plugin results.",
+                          self._plugin_cache.hits)
+            self._plugin_cache.save()
+            self._plugin_cache = None
+
+    def _analyse_plugin(self, iface, plugin):
+        self.log.debug("Running analyses for " + plugin.name)
+        profile = self._profiles[plugin.name]
+        with cwd(plugin.tmp_path):
+            try:
+                with _PluginWatchdog(self._time_left(profile)):
+                    self._analyse_phases(iface, plugin, profile)
+            except PluginTimeoutError:
+                self._plugin_timeout(plugin, profile)
+            except Exception:
+                self.log.error("Plugin %s ran into an error.", plugin.name)
+                self.log.debug("%s", traceback.format_exc())
+        return profile
+
+    def _analyse_phases(self, iface, plugin, profile):
+        with _ResourceMeter(profile, "pre_analysis"):
+            plugin.analysis.pre_analysis()
+        stream_findings(iface)
+        iface._plugin = plugin
+        iface.state = plugin.analysis.state
+        # ----- each plugin gets only the scopes it analyses
+        files = self._plugin_files(plugin)
+        if files:
+            with _ResourceMeter(profile, "file_analysis"):
+                if (plugin.parallel == "files" and self.jobs > 1
+                        and len(files) > 1):
+                    self._run_files(iface, plugin, files)
+                else:
+                    self._analyse_files(iface, plugin, files)
+            stream_findings(iface)
+        if plugin.analysis.p_analysis:
+            with _ResourceMeter(profile, "package_analysis"):
+                for scope in self.report.project.packages:
+                    if not scope._analyse:
+                        continue
+                    iface._report = iface._reports[scope.id]
+                    plugin.analysis.analyse_package(iface, scope)
+                    stream_findings(iface, self.STREAM_SIZE)
+            stream_findings(iface)
+        if plugin.analysis.c_analysis:
+            with _ResourceMeter(profile, "configuration_analysis"):
+                for scope in self.report.project.configurations:
+                    iface._report = iface._reports[scope.id]
+                    plugin.analysis.analyse_configuration(iface, scope)
+                    stream_findings(iface, self.STREAM_SIZE)
+            stream_findings(iface)
+        iface._report = None
+        with _ResourceMeter(profile, "post_analysis"):
+            plugin.analysis.post_analysis(iface)
+
+    def _analyse_files(self, iface, plugin, files):
+        cache = self._plugin_cache if plugin.cache == "files" else None
+        if plugin.analysis.b_analysis:
+            for batch in self._file_batches(files):
+                self._analyse_batch(iface, plugin, batch, cache)
+                stream_findings(iface, self.STREAM_SIZE)
+            return
+        for scope in files:
+            iface._report = iface._reports[scope.id]
+            if cache is None:
+                plugin.analysis.analyse_file(iface, scope)
+            elif not cache.replay(iface, plugin, scope):
+                iface._recording = []
                 try:
-                    plugin.analysis.pre_analysis()
-                    iface._plugin = plugin
-                    iface.state = plugin.analysis.state
-                    for pkg in self.report.project.packages:
-                        if not pkg._analyse:
-                            continue
-                        for scope in pkg.source_files:
-                            iface._report = iface._reports[scope.id]
-                            plugin.analysis.analyse_file(iface, scope)
-                    for scope in self.report.project.packages:
-                        if not scope._analyse:
-                            continue
-                        iface._report = iface._reports[scope.id]
-                        plugin.analysis.analyse_package(iface, scope)
-                    for scope in self.report.project.configurations:
-                        iface._report = iface._reports[scope.id]
-                        plugin.analysis.analyse_configuration(iface, scope)
-                    iface._report = None
-                    plugin.analysis.post_analysis(iface)
-                except Exception:
-                    self.log.error("Plugin %s ran into an error.", plugin.name)
-                    self.log.debug("%s", traceback.format_exc())
+                    plugin.analysis.analyse_file(iface, scope)
+                    cache.put(plugin, scope, iface._recording)
+                finally:
+                    iface._recording = None
+            stream_findings(iface, self.STREAM_SIZE)
+
+    def _analyse_batch(self, iface, plugin, files, cache):
+        iface._report = iface._reports[files[0].package.id]
+        if cache is None:
+            plugin.analysis.analyse_file_batch(iface, files)
+            return
+        files = [sf for sf in files if not cache.replay(iface, plugin, sf)]
+        if not files:
+            return
+        iface._recording = []
+        try:
+            plugin.analysis.analyse_file_batch(iface, files)
+            # results can be cached only if they belong to single files
+            by_file = dict((sf.id, []) for sf in files)
+            for report, datum in iface._recording:
+                sf = datum.location.file
+                if sf is None or not sf.id in by_file:
+                    break
+                by_file[sf.id].append((report, datum))
+            else:
+                for sf in files:
+                    cache.put(plugin, sf, by_file[sf.id])
+        finally:
+            iface._recording = None
+
+    @staticmethod
+    def _file_batches(files):
+        # files grouped by package and language, in order
+        batches = {}
+        order = []
+        for sf in files:
+            key = (sf.package.id, sf.language)
+            batch = batches.get(key)
+            if batch is None:
+                batch = batches[key] = []
+                order.append(key)
+            batch.append(sf)
+        return [batches[key] for key in order]
+
+    def _run_files(self, iface, plugin, files):
+        if plugin.analysis.b_analysis:
+            tasks = self._file_batches(files)
+        else:
+            # consecutive files in each task, a few tasks per worker
+            size = max(1, len(files) // (self.jobs * self.FILE_TASKS))
+            tasks = [files[i:i + size] for i in xrange(0, len(files), size)]
+        self.log.debug("Running file analyses of %s with %d workers.",
+                       plugin.name, self.jobs)
+        run = lambda iface, files: self._analyse_files(iface, plugin, files)
+        results = run_plugins(iface, tasks, self._worker_task(run),
+                              self.jobs)
+        for result in results:
+            self._merge_findings(iface, result)
+            if result[4]:
+                raise PluginTaskError(result[4])
 
     def _processing(self, iface, plugins):
         iface._buffer_violations = []
         iface._buffer_metrics = []
         for plugin in plugins:
-            self.log.debug("Running processing for " + plugin.name)
-            with cwd(plugin.tmp_path):
-                try:
-                    plugin.process.pre_process()
-                    iface._plugin = plugin
-                    iface.state = plugin.process.state
-                    for pkg in self.report.project.packages:
-                        if not pkg._analyse:
-                            continue
-                        for scope in pkg.source_files:
-                            iface._report = iface._reports[scope.id]
-                            plugin.process.process_file(iface, scope,
-                                    iface._report.violations,
-                                    iface._report.metrics)
-                    for scope in self.report.project.packages:
-                        if not scope._analyse:
-                            continue
-                        iface._report = iface._reports[scope.id]
-                        plugin.process.process_package(iface, scope,
-                                iface._report.violations,
-                                iface._report.metrics)
-                    for scope in self.report.project.configurations:
-                        iface._report = iface._reports[scope.id]
-                        plugin.process.process_configuration(iface, scope,
-                                iface._report.violations,
-                                iface._report.metrics)
-                    iface._report = None
-                    plugin.process.post_process(iface)
-                except Exception:
-                    self.log.error("Plugin %s ran into an error.", plugin.name)
-                    self.log.debug("%s", traceback.format_exc())
+            self._process_plugin(iface, plugin)
         iface._commit_buffers()
 
+    def _process_plugin(self, iface, plugin):
+        self.log.debug("Running processing for " + plugin.name)
+        profile = self._profiles[plugin.name]
+        if profile.timed_out or profile.killed:
+            self.log.debug("Skipping processing for " + plugin.name)
+            return profile
+        with cwd(plugin.tmp_path):
+            try:
+                with _PluginWatchdog(self._time_left(profile)):
+                    with _ResourceMeter(profile, "processing"):
+                        self._process_phases(iface, plugin)
+            except PluginTimeoutError:
+                self._plugin_timeout(plugin, profile)
+            except Exception:
+                self.log.error("Plugin %s ran into an error.", plugin.name)
+                self.log.debug("%s", traceback.format_exc())
+        return profile
+
+    def _process_phases(self, iface, plugin):
+        plugin.process.pre_process()
+        iface._plugin = plugin
+        iface.state = plugin.process.state
+        process = plugin.process
+        if process.f_violations or process.f_metrics:
+            for pkg in self.report.project.packages:
+                if not pkg._analyse:
+                    continue
+                for scope in pkg.source_files:
+                    iface._report = iface._reports[scope.id]
+                    process.process_file(iface, scope,
+                            iface._report.violations,
+                            iface._report.metrics)
+                    stream_findings(iface, self.STREAM_SIZE)
+        if process.p_violations or process.p_metrics:
+            for scope in self.report.project.packages:
+                if not scope._analyse:
+                    continue
+                iface._report = iface._reports[scope.id]
+                process.process_package(iface, scope,
+                        iface._report.violations,
+                        iface._report.metrics)
+                stream_findings(iface, self.STREAM_SIZE)
+        if process.c_violations or process.c_metrics:
+            for scope in self.report.project.configurations:
+                iface._report = iface._reports[scope.id]
+                process.process_configuration(iface, scope,
+                        iface._report.violations,
+                        iface._report.metrics)
+                stream_findings(iface, self.STREAM_SIZE)
+        iface._report = None
+        plugin.process.post_process(iface)
+
+    def _run_plugins(self, iface, plugins):
+        # each plugin runs in its own process, which streams back its
+        # findings and then exits (with anything the plugin changed);
+        # findings are merged in plugin order, as in sequential execution.
+        # Processing runs in the same process as analysis (with the state
+        # the plugin kept), once the findings of all analyses are merged.
+        self.log.debug("Running %d plugins with %d workers.",
+                       len(plugins), self.jobs)
+        def process(iface, plugin):
+            iface._buffer_violations = []
+            iface._buffer_metrics = []
+            return self._process_plugin(iface, plugin), None
+        def barrier(results):
+            self._merge_results(iface, plugins, results)
+            self._save_plugin_cache()
+            iface._buffer_violations = []
+            iface._buffer_metrics = []
+            time_limits = {}
+            for i, plugin in enumerate(plugins):
+                profile = self._profiles[plugin.name]
+                if not profile.timed_out and not profile.killed:
+                    time_limits[i] = self._kill_time(profile)
+            return time_limits
+        time_limits = [self._kill_time(self._profiles[plugin.name])
+                       for plugin in plugins]
+        results = run_plugins(iface, plugins,
+                              self._worker_task(self._analyse_plugin),
+                              self.jobs, time_limits = time_limits,
+                              then = process, barrier = barrier)
+        self._merge_results(iface, plugins, results)
+        iface._commit_buffers()
+
+    def _kill_time(self, profile):
+        # workers get some time to stop on their own after the time limit
+        limit = self._time_left(profile)
+        if limit is None:
+            return None
+        return max(limit, 0.0) + self.KILL_DELAY
+
+    def _merge_results(self, iface, plugins, results):
+        for plugin, result in zip(plugins, results):
+            profile = self._merge_findings(iface, result)
+            if not profile is None:
+                self._profiles[plugin.name] = profile
+            error = result[4]
+            if error is PLUGIN_TIMEOUT:
+                self._profiles[plugin.name].killed = True
+                self.log.error("Plugin %s did not stop after its time limit.",
+                               plugin.name)
+            elif error:
+                self.log.error("Plugin %s ran into an error.", plugin.name)
+                self.log.debug("%s", error)
+
+    def _worker_task(self, run):
+        # the value returned by a task and the results it cached
+        # in a worker process are sent back to the parent
+        cache = self._plugin_cache
+        def run_task(iface, task):
+            mark = cache.mark() if not cache is None else None
+            value = run(iface, task)
+            if cache is None:
+                return value, None
+            return value, cache.changes(mark)
+        return run_task
+
+    def _merge_findings(self, iface, result):
+        reports, violations, metrics, exported, error, value = result
+        value, changes = value or (None, None)
+        if not changes is None:
+            self._plugin_cache.merge(changes)
+        for key, vs, ms in reports:
+            report = iface._reports[key]
+            report.violations.extend(vs)
+            if ms:
+                report.metrics.extend(ms)
+            iface._added += len(vs) + len(ms)
+        if not iface._buffer_violations is None:
+            iface._buffer_violations.extend(violations)
+            iface._buffer_metrics.extend(metrics)
+            iface._added += len(violations) + len(metrics)
+        iface._exported.update(exported)
+        return value
+
     def _exports(self, files):
         for f in files:
             i = f.rfind(os.sep)
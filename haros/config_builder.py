@@ -37,6 +37,8 @@
 ###############################################################################
 
 from collections import namedtuple
+import cPickle
+from cStringIO import StringIO
 import logging
 import os
 import re
@@ -50,8 +52,10 @@ from .launch_parser import (
 )
 from .metamodel import (
     Node, Configuration, RosName, NodeInstance, Parameter, Topic, Service,
-    SourceCondition, TopicPrimitive, ServicePrimitive, ParameterPrimitive
+    SourceCondition, TopicPrimitive, ServicePrimitive, ParameterPrimitive,
+    SourceObject
 )
+from .util import map_workers
 
 
 ###############################################################################
@@ -81,7 +85,12 @@ class LaunchScope(LoggingObject):
         self.parameters = params if not params is None else []
         self.arguments = args if not args is None else {}
         self.conditions = conditions if not conditions is None else []
-        self._params = list(parent._params) if parent else []
+    # ----- pending private parameters are shared with child scopes,
+    #       and only copied when a scope defines a new one
+        self._params = parent._params if parent else []
+        self._own_params = not parent
+    # ----- names of the parameters defined by the node of this scope
+        self._defined = set()
         self._future = []
 
     @property
@@ -99,6 +108,7 @@ class LaunchScope(LoggingObject):
         if not condition is True:
             new.conditions.append(condition)
         self.children.append(new)
+        self._own_params = False
         return new
 
     def remap(self, source, target):
@@ -128,16 +138,10 @@ class LaunchScope(LoggingObject):
                                 args = self.arguments,
                                 conditions = instance.conditions)
         self.children.append(new_scope)
-        pns = new_scope.private_ns
-        for param in self._params:
-            rosname = RosName(param.rosname.given, pns, pns)
-            conditions = param.conditions + instance.conditions
-            self.log.debug("Creating new forward Parameter %s.", rosname.full)
-            param = Parameter(self.configuration, rosname, param.type,
-                              param.value, node_scope = param.node_scope,
-                              launch = param.launch_file,
-                              conditions = conditions)
-            self.parameters.append(param)
+        if self._params:
+            self.parameters.append(ForwardedParams(instance, self._params,
+                                                   new_scope._defined))
+            self._own_params = False
         return new_scope
 
     def make_params(self, name, ptype, value, condition):
@@ -156,9 +160,9 @@ class LaunchScope(LoggingObject):
                               launch = self.launch_file,
                               conditions = conditions)
             if not self.node and rosname.is_private:
-                self._params.append(param)
+                self._pending_param(param)
             else:
-                self.parameters.append(param)
+                self._add_param(param)
 
     def make_rosparam(self, name, ns, value, condition):
     # ---- lazy rosparam import as per the oringinal roslaunch code
@@ -193,8 +197,8 @@ class LaunchScope(LoggingObject):
             raise ConfigurationError("missing parameter: " + name)
         if not condition is True or self.conditions:
             return
-        else:
-            self.resources.deleted_params.append(name)
+        for param in self.configuration.parameters.get_all(name):
+            self.configuration.parameters.remove(param)
 
     def _namespace(self, ns, private = False):
         pns = self.private_ns
@@ -218,7 +222,7 @@ class LaunchScope(LoggingObject):
                 self.log.debug("Linking %s to %s.", self.node.id, link.topic.id)
                 self.node.publishers.append(link)
                 link.topic.publishers.append(link)
-                self._update_topic_conditions(link.topic)
+                self._update_topic_conditions(link.topic, link)
                 if not call.repeats:
                     break
         self.log.debug("Iterating subscribe calls for node %s.", self.node.id)
@@ -230,7 +234,7 @@ class LaunchScope(LoggingObject):
                 self.log.debug("Linking %s to %s.", self.node.id, link.topic.id)
                 self.node.subscribers.append(link)
                 link.topic.subscribers.append(link)
-                self._update_topic_conditions(link.topic)
+                self._update_topic_conditions(link.topic, link)
                 if not call.repeats:
                     break
 
@@ -249,7 +253,7 @@ class LaunchScope(LoggingObject):
                                self.node.id, link.service.id)
                 self.node.servers.append(link)
                 link.service.server = link
-                self._update_service_conditions(link.service)
+                self._update_service_conditions(link.service, link)
                 if not call.repeats:
                     break
         self.log.debug("Iterating Srv client calls for node %s.", self.node.id)
@@ -262,7 +266,7 @@ class LaunchScope(LoggingObject):
                                self.node.id, link.service.id)
                 self.node.clients.append(link)
                 link.service.clients.append(link)
-                self._update_service_conditions(link.service)
+                self._update_service_conditions(link.service, link)
                 if not call.repeats:
                     break
 
@@ -461,9 +465,20 @@ class LaunchScope(LoggingObject):
                               node_scope = node_scope,
                               launch = self.launch_file, conditions = conditions)
             if independent or not private:
-                self.parameters.append(param)
+                self._add_param(param)
             else:
-                self._params.append(param)
+                self._pending_param(param)
+
+    def _add_param(self, param):
+        self.parameters.append(param)
+        if not self.node is None:
+            self._defined.add(param.rosname.full)
+
+    def _pending_param(self, param):
+        if not self._own_params:
+            self._params = list(self._params)
+            self._own_params = True
+        self._params.append(param)
 
     def _unfold(self, name, value):
         result = []
@@ -497,36 +512,111 @@ class LaunchScope(LoggingObject):
             return self.private_ns
         return RosName.resolve(ns, self.namespace, self.private_ns)
 
-    def _update_topic_conditions(self, topic):
-        topic.conditions = []
-        for link in topic.publishers:
-            if not link.node.conditions:
-                topic.conditions = link.conditions
-                break
-            topic.conditions.extend(link.node.conditions)
-            topic.conditions.extend(link.conditions)
-        for link in topic.subscribers:
-            if not link.node.conditions:
-                topic.conditions = link.conditions
-                break
-            topic.conditions.extend(link.node.conditions)
-            topic.conditions.extend(link.conditions)
-
-    def _update_service_conditions(self, service):
-        service.conditions = []
-        link = service.server
-        if link:
-            if not link.node.conditions:
-                service.conditions = link.conditions
-            else:
-                service.conditions.extend(link.node.conditions)
-                service.conditions.extend(link.conditions)
-        for link in service.clients:
-            if not link.node.conditions:
-                service.conditions = link.conditions
-                break
-            service.conditions.extend(link.node.conditions)
-            service.conditions.extend(link.conditions)
+    def _update_topic_conditions(self, topic, link):
+        previous = len(topic.publishers) + len(topic.subscribers) - 1
+        self._update_conditions(topic, link, previous)
+
+    def _update_service_conditions(self, service, link):
+        previous = len(service.servers) + len(service.clients) - 1
+        self._update_conditions(service, link, previous)
+
+    def _update_conditions(self, resource, link, previous):
+        # Conditions are maintained incrementally, as links are added.
+        # A resource that already has links, but no conditions,
+        # has an unconditional link, and so it is unconditional as well.
+        if previous > 0 and not resource.conditions:
+            return
+        conditions = link.node.conditions + link.conditions
+        if not conditions:
+            resource.conditions = []
+            return
+        known = set(id(c) for c in resource.conditions)
+        for condition in conditions:
+            if not id(condition) in known:
+                known.add(id(condition))
+                resource.conditions.append(condition)
+
+
+class LaunchPlan(object):
+    """Records the operations that a launch tree performs on a LaunchScope,
+        with all substitution arguments already resolved.
+        A plan can be applied to (and replayed on) any number of scopes.
+    """
+
+    def __init__(self, parent = None, args = None, conditional = False):
+        self.parent = parent
+        self.arguments = args if not args is None else {}
+        self.conditional = conditional
+        self.cacheable = True
+        self.operations = []
+
+    def child(self, ns, condition, launch = None, args = None):
+        new = LaunchPlan(self, args if not args is None else self.arguments,
+                         self.conditional or not condition is True)
+        self.operations.append(("child", (ns, condition, launch, args), new))
+        return new
+
+    def make_node(self, node, name, ns, args, condition):
+        new = LaunchPlan(self, self.arguments,
+                         self.conditional or not condition is True)
+        self.operations.append(("make_node", (node, name, ns, args, condition),
+                                new))
+        return new
+
+    def remap(self, source, target):
+        self.operations.append(("remap", (source, target), None))
+
+    def make_params(self, name, ptype, value, condition):
+        self.operations.append(("make_params", (name, ptype, value, condition),
+                                None))
+
+    def make_rosparam(self, name, ns, value, condition):
+        self.operations.append(("make_rosparam", (name, ns, value, condition),
+                                None))
+
+    def remove_param(self, name, ns, condition):
+        self.operations.append(("remove_param", (name, ns, condition), None))
+
+    def error(self, msg):
+        self.operations.append(("error", (msg,), None))
+
+    def extend(self, plan):
+        self.operations.extend(plan.operations)
+        if not plan.cacheable:
+            self.set_uncacheable()
+
+    def set_uncacheable(self):
+        plan = self
+        while not plan is None:
+            plan.cacheable = False
+            plan = plan.parent
+
+
+class ForwardedParams(LoggingObject):
+    """The private parameters of a launch scope forwarded to a node
+        (shared with other nodes of the scope), except those that the
+        node defines itself. Parameters are created by `make()`.
+    """
+    def __init__(self, node, params, defined):
+        self.node = node
+        self.params = params
+        self.defined = defined
+
+    def make(self):
+        pns = self.node.rosname.full
+        result = []
+        for param in self.params:
+            rosname = RosName(param.rosname.given, pns, pns)
+            if rosname.full in self.defined:
+                self.log.debug("Skipping overridden forward Parameter %s.",
+                               rosname.full)
+                continue
+            self.log.debug("Creating new forward Parameter %s.", rosname.full)
+            conditions = param.conditions + self.node.conditions
+            result.append(Parameter(self.node.configuration, rosname,
+                param.type, param.value, node_scope = param.node_scope,
+                launch = param.launch, conditions = conditions))
+        return result
 
 
 class FutureParamLink(object):
@@ -664,122 +754,138 @@ class ConfigurationHints(LoggingObject):
     def make_missing_links(self, scope):
         self.log.debug("making missing links for %s", scope.node.rosname.full)
         pns = scope.private_ns
+    # ----- index the links of the node by resolved name only once
+        publishers = self._index_links(scope.node.publishers, "topic")
+        subscribers = self._index_links(scope.node.subscribers, "topic")
+        servers = self._index_links(scope.node.servers, "service")
+        clients = self._index_links(scope.node.clients, "service")
         for topic in self.advertise:
             self.log.debug("hint topic %s", topic.rosname.full)
             remap_name = scope.node.remaps.get(topic.rosname.full,
                                                topic.rosname.full)
-            for link in scope.node.publishers:
-                if link.topic.rosname.full == remap_name:
-                    if link.topic.type is None:
-                        self.log.debug("Refining %s with type %s.",
-                                       link.topic.rosname.full, topic.type)
-                        link.topic.type = topic.type
-                    elif link.topic.type != topic.type:
-                        self.log.warning(
-                            ("Extraction hint for node %s advertises topic %s "
-                             "(%s), but extractor found %s (%s)."),
-                            scope.node.id, topic.id, topic.type,
-                            link.topic.id, link.topic.type)
-                        break
-                    else:
-                        self.log.debug("%s (%s) is already extracted",
-                                       link.topic.rosname.full, link.topic.type)
-                        break
+            for link in publishers.get(remap_name, ()):
+                if link.topic.type is None:
+                    self.log.debug("Refining %s with type %s.",
+                                   link.topic.rosname.full, topic.type)
+                    link.topic.type = topic.type
+                elif link.topic.type != topic.type:
+                    self.log.warning(
+                        ("Extraction hint for node %s advertises topic %s "
+                         "(%s), but extractor found %s (%s)."),
+                        scope.node.id, topic.id, topic.type,
+                        link.topic.id, link.topic.type)
+                    break
+                else:
+                    self.log.debug("%s (%s) is already extracted",
+                                   link.topic.rosname.full, link.topic.type)
+                    break
             else:
                 for link in scope._make_topic_links(topic.rosname.full,
                                                     scope.namespace, pns,
                                                     topic.type, None,
                                                     None, (), None):
                     link.node.publishers.append(link)
+                    publishers.setdefault(link.topic.rosname.full,
+                                          []).append(link)
                     link.topic.publishers.append(link)
-                    link.topic.conditions.extend(link.node.conditions)
+                    scope._update_topic_conditions(link.topic, link)
         for topic in self.subscribe:
             self.log.debug("hint topic %s", topic.rosname.full)
             remap_name = scope.node.remaps.get(topic.rosname.full,
                                                topic.rosname.full)
-            for link in scope.node.subscribers:
-                if link.topic.rosname.full == remap_name:
-                    if link.topic.type is None:
-                        self.log.debug("Refining %s with type %s.",
-                                       link.topic.rosname.full, topic.type)
-                        link.topic.type = topic.type
-                    elif link.topic.type != topic.type:
-                        self.log.warning(
-                            ("Extraction hint for node %s subscribes topic %s "
-                             "(%s), but extractor found %s (%s)."),
-                            scope.node.id, topic.id, topic.type,
-                            link.topic.id, link.topic.type)
-                        break
-                    else:
-                        self.log.debug("%s (%s) is already extracted",
-                                       link.topic.rosname.full, link.topic.type)
-                        break
+            for link in subscribers.get(remap_name, ()):
+                if link.topic.type is None:
+                    self.log.debug("Refining %s with type %s.",
+                                   link.topic.rosname.full, topic.type)
+                    link.topic.type = topic.type
+                elif link.topic.type != topic.type:
+                    self.log.warning(
+                        ("Extraction hint for node %s subscribes topic %s "
+                         "(%s), but extractor found %s (%s)."),
+                        scope.node.id, topic.id, topic.type,
+                        link.topic.id, link.topic.type)
+                    break
+                else:
+                    self.log.debug("%s (%s) is already extracted",
+                                   link.topic.rosname.full, link.topic.type)
+                    break
             else:
                 for link in scope._make_topic_links(topic.rosname.full,
                                                     scope.namespace, pns,
                                                     topic.type, None,
                                                     None, (), None):
                     link.node.subscribers.append(link)
+                    subscribers.setdefault(link.topic.rosname.full,
+                                           []).append(link)
                     link.topic.subscribers.append(link)
-                    link.topic.conditions.extend(link.node.conditions)
+                    scope._update_topic_conditions(link.topic, link)
         for service in self.service:
             self.log.debug("hint service %s", service.rosname.full)
             remap_name = scope.node.remaps.get(service.rosname.full,
                                                service.rosname.full)
-            for link in scope.node.servers:
-                if link.service.rosname.full == remap_name:
-                    if link.service.type is None:
-                        self.log.debug("Refining %s with type %s.",
-                                       link.service.rosname.full, service.type)
-                        link.service.type = service.type
-                    elif link.service.type != service.type:
-                        self.log.warning(
-                            ("Extraction hint for node %s advertises service "
-                             "%s (%s), but extractor found %s (%s)."),
-                            scope.node.id, service.id, service.type,
-                            link.service.id, link.service.type)
-                        break
-                    else:
-                        self.log.debug("%s (%s) is already extracted",
-                                       link.service.rosname.full, link.service.type)
-                        break
+            for link in servers.get(remap_name, ()):
+                if link.service.type is None:
+                    self.log.debug("Refining %s with type %s.",
+                                   link.service.rosname.full, service.type)
+                    link.service.type = service.type
+                elif link.service.type != service.type:
+                    self.log.warning(
+                        ("Extraction hint for node %s advertises service "
+                         "%s (%s), but extractor found %s (%s)."),
+                        scope.node.id, service.id, service.type,
+                        link.service.id, link.service.type)
+                    break
+                else:
+                    self.log.debug("%s (%s) is already extracted",
+                                   link.service.rosname.full, link.service.type)
+                    break
             else:
                 for link in scope._make_service_links(service.rosname.full,
                                                       scope.namespace, pns,
                                                       service.type,
-                                                      None, None, (), None):
+                                                      None, (), None):
                     link.node.servers.append(link)
+                    servers.setdefault(link.service.rosname.full,
+                                       []).append(link)
                     link.service.server = link
-                    link.service.conditions.extend(link.node.conditions)
+                    scope._update_service_conditions(link.service, link)
         for service in self.client:
             self.log.debug("hint service %s", service.rosname.full)
             remap_name = scope.node.remaps.get(service.rosname.full,
                                                service.rosname.full)
-            for link in scope.node.clients:
-                if link.service.rosname.full == remap_name:
-                    if link.service.type is None:
-                        self.log.debug("Refining %s with type %s.",
-                                       link.service.rosname.full, service.type)
-                        link.service.type = service.type
-                    elif link.service.type != service.type:
-                        self.log.warning(
-                            ("Extraction hint for node %s is client of service "
-                             "%s (%s), but extractor found %s (%s)."),
-                            scope.node.id, service.id, service.type,
-                            link.service.id, link.service.type)
-                        break
-                    else:
-                        self.log.debug("%s (%s) is already extracted",
-                                       link.service.rosname.full, link.service.type)
-                        break
+            for link in clients.get(remap_name, ()):
+                if link.service.type is None:
+                    self.log.debug("Refining %s with type %s.",
+                                   link.service.rosname.full, service.type)
+                    link.service.type = service.type
+                elif link.service.type != service.type:
+                    self.log.warning(
+                        ("Extraction hint for node %s is client of service "
+                         "%s (%s), but extractor found %s (%s)."),
+                        scope.node.id, service.id, service.type,
+                        link.service.id, link.service.type)
+                    break
+                else:
+                    self.log.debug("%s (%s) is already extracted",
+                                   link.service.rosname.full, link.service.type)
+                    break
             else:
                 for link in scope._make_service_links(service.rosname.full,
                                                       scope.namespace, pns,
                                                       service.type,
-                                                      None, None, (), None):
+                                                      None, (), None):
                     link.node.clients.append(link)
+                    clients.setdefault(link.service.rosname.full,
+                                       []).append(link)
                     link.service.clients.append(link)
-                    link.service.conditions.extend(link.node.conditions)
+                    scope._update_service_conditions(link.service, link)
+
+    @staticmethod
+    def _index_links(links, attr):
+        index = {}
+        for link in links:
+            index.setdefault(getattr(link, attr).rosname.full, []).append(link)
+        return index
 
     def _valid_msg_type(self, msg_type, node_name):
         parts = msg_type.split("::")
@@ -805,6 +911,8 @@ class ConfigurationBuilder(LoggingObject):
         self.node_specs = nodes if nodes is not None else {}
         self.hints = hints if not hints is None else {}
         self._future = []
+        self._includes = {}
+        self._merged_hints = {}
         self._pkg_finder = PackageExtractor() # FIXME should this be given?
 
     def add_launch(self, launch_file):
@@ -820,17 +928,26 @@ class ConfigurationBuilder(LoggingObject):
             env_depends=config.dependencies.environment)
         scope = LaunchScope(None, self.configuration, launch_file,
                             args = sub.arguments)
-        self._analyse_tree(launch_file.tree, scope, sub)
+    # ----- conditions refer to the top-level launch file, so the
+    #       include cache is only valid within the same launch file
+        self._includes = {}
+        plan = LaunchPlan(args = sub.arguments)
+        self._analyse_tree(launch_file.tree, plan, sub)
+        self._apply_plan(plan, scope)
     # ----- parameters can only be added in the end, because of rosparam
         for param in scope.parameters:
-            self.configuration.parameters.add(param)
+            if isinstance(param, ForwardedParams):
+                self.configuration.parameters.defer(param.node.rosname.full,
+                                                    param.make)
+            else:
+                self.configuration.parameters.add(param)
         for link in self._future:
             link.make()
 
     def _analyse_tree(self, tree, scope, sub):
         for tag in tree.children:
             if tag.tag == "error":
-                self.errors.append(tag.text)
+                scope.error(tag.text)
                 continue
             try:
                 condition = self._condition(tag.condition, sub)
@@ -839,6 +956,27 @@ class ConfigurationBuilder(LoggingObject):
                 handler = getattr(self, "_" + tag.tag + "_tag")
                 handler(tag, condition, scope, sub)
             except (ConfigurationError, SubstitutionError) as e:
+                scope.error(e.value)
+
+    def _apply_plan(self, plan, scope):
+        for op, args, child_plan in plan.operations:
+            try:
+                if op == "error":
+                    self.errors.append(args[0])
+                elif op == "child":
+                    self._apply_plan(child_plan, scope.child(*args))
+                elif op == "make_node":
+                    new_scope = scope.make_node(*args)
+                    self._apply_plan(child_plan, new_scope)
+                    self._make_node_links(args[0], new_scope)
+                elif op == "make_params":
+                    try:
+                        scope.make_params(*args)
+                    except ValueError as e:
+                        raise ConfigurationError(str(e))
+                else:
+                    getattr(scope, op)(*args)
+            except ConfigurationError as e:
                 self.errors.append(e.value)
 
     def _node_tag(self, tag, condition, scope, sub):
@@ -852,6 +990,8 @@ class ConfigurationBuilder(LoggingObject):
         ns = sub.resolve(tag.namespace, strict = True)
         new_scope = scope.make_node(node, name, ns, args, condition)
         self._analyse_tree(tag, new_scope, sub)
+
+    def _make_node_links(self, node, new_scope):
         hints = self._merge_hints(node.node_name, new_scope.node.rosname.full)
         config_hints = ConfigurationHints.make_hints(hints, new_scope)
         new_scope.make_topics(advertise = config_hints.advertise,
@@ -878,17 +1018,33 @@ class ConfigurationBuilder(LoggingObject):
                                 args = args)
         # define child args in the new scope
         self._analyse_tree(tag, new_scope, sub)
-        new_sub = SubstitutionParser(args = args, env = sub.environment,
-                                     pkgs = sub.packages,
-                                     dirname = launch_file.dir_path,
-                                     pkg_depends = sub.pkg_depends,
-                                     env_depends = sub.env_depends)
-        self._analyse_tree(launch_file.tree, new_scope, new_sub)
+        # The included tree only depends on the given arguments (and on
+        # whether its scope is conditional), so it is resolved only once
+        # and its operations are replayed for every other inclusion.
+        key = (launch_file.id, new_scope.conditional,
+               tuple(sorted(args.iteritems())))
+        plan = self._includes.get(key)
+        if plan is None:
+            plan = LaunchPlan(args = args, conditional = new_scope.conditional)
+            new_sub = SubstitutionParser(args = args, env = sub.environment,
+                                         pkgs = sub.packages,
+                                         dirname = launch_file.dir_path,
+                                         pkg_depends = sub.pkg_depends,
+                                         env_depends = sub.env_depends)
+            self._analyse_tree(launch_file.tree, plan, new_sub)
+            # anonymous names must be unique for each inclusion
+            if new_sub.anonymous:
+                plan.set_uncacheable()
+            if plan.cacheable:
+                self._includes[key] = plan
+        else:
+            self.log.debug("Replaying cached include: %s", launch_file.id)
+        new_scope.extend(plan)
 
     def _remap_tag(self, tag, condition, scope, sub):
         assert not tag.children
         if not condition is True:
-            self.errors.append("cannot resolve conditional remap")
+            scope.error("cannot resolve conditional remap")
         else:
             origin = sub.resolve(tag.origin, strict = True)
             target = sub.resolve(tag.target, strict = True)
@@ -910,10 +1066,7 @@ class ConfigurationBuilder(LoggingObject):
             value = None
         elif not tag.command is None:
             value = None
-        try:
-            scope.make_params(name, ptype, value, condition)
-        except ValueError as e:
-            raise ConfigurationError(str(e))
+        scope.make_params(name, ptype, value, condition)
 
     def _rosparam_tag(self, tag, condition, scope, sub):
         assert not tag.children
@@ -943,7 +1096,7 @@ class ConfigurationBuilder(LoggingObject):
 
     def _arg_tag(self, tag, condition, scope, sub):
         assert not tag.children
-        if scope.conditions or not condition is True:
+        if scope.conditional or not condition is True:
             raise ConfigurationError("cannot resolve conditional arg")
         if not tag.value is None:
             value = sub.resolve(tag.value, strict = True)
@@ -1007,6 +1160,14 @@ class ConfigurationBuilder(LoggingObject):
         return pkg
 
     def _merge_hints(self, node_name, instance_name):
+        key = (node_name, instance_name)
+        if key in self._merged_hints:
+            return self._merged_hints[key]
+        hints = self._do_merge_hints(node_name, instance_name)
+        self._merged_hints[key] = hints
+        return hints
+
+    def _do_merge_hints(self, node_name, instance_name):
         self.log.debug("merging hints for %s (%s)", instance_name, node_name)
         node_hints = self.node_specs.get(node_name)
         cfg_hints = self.hints.get(instance_name)
@@ -1040,3 +1201,144 @@ class ConfigurationBuilder(LoggingObject):
         except LaunchParserError as e:
             self.log.warning("Parsing error in %s:\n%s",
                              launch_file.path, str(e))
+
+
+###############################################################################
+# Parallel Configuration Building
+###############################################################################
+
+# Configurations are independent from each other, so they can be built in
+# worker processes. Workers are forked after the database is extracted, which
+# means they share a read-only (copy-on-write) snapshot of packages, files and
+# nodes. Results are sent back in a compact form: source objects known to the
+# parent (packages, files, nodes) are pickled as references to their ids,
+# and only the runtime objects of the configuration are pickled by value.
+# Links and resources also refer to parts of the calls of their nodes
+# (conditions and locations), which are pickled as references as well.
+
+_NODE_CALLS = ("advertise", "subscribe", "service", "client",
+               "read_param", "write_param")
+
+
+def build_configurations(database, build, tasks, jobs = 1):
+    """Build a configuration for each (name, data) pair in `tasks`.
+        `build` is a function (name, data) -> ConfigurationBuilder.
+        Returns a list of (configuration, errors) in the order of `tasks`.
+        Errors raised by `build` are raised again, as in a sequential build
+        (the error of the first task that failed).
+    """
+    tasks = list(tasks)
+    jobs = min(jobs, len(tasks))
+    if jobs <= 1:
+        results = []
+        for name, data in tasks:
+            builder = build(name, data)
+            results.append((builder.configuration, builder.errors))
+        return results
+    def build_worker(i):
+        name, data = tasks[i]
+        try:
+            builder = build(name, data)
+        except Exception as e:
+            # errors such as ConfigurationError do not pickle by themselves
+            return None, (type(e), e.args, e.__dict__)
+        return dump_configuration(builder.configuration, builder.errors,
+                                  database), None
+    results = []
+    for data, error in map_workers(build_worker, len(tasks), jobs):
+        if not error is None:
+            cls, args, state = error
+            e = cls.__new__(cls, *args)
+            e.args = args
+            e.__dict__.update(state)
+            raise e
+        results.append(load_configuration(data, database))
+    return results
+
+
+def _source_objects(database):
+    objects = {}
+    if database.project is not None:
+        objects[database.project.id] = database.project
+    for collection in (database.repositories, database.packages,
+                       database.files, database.nodes):
+        objects.update(collection)
+    return objects
+
+
+def _call_objects(node, pid):
+    """Yields (object, persistent id) for the calls of a node shared
+        with its instances: the calls, their conditions and locations.
+    """
+    for attr in _NODE_CALLS:
+        for i, call in enumerate(getattr(node, attr)):
+            prefix = "call:{}:{}:".format(attr, i)
+            yield call, prefix + "call:" + pid
+            yield call.conditions, prefix + "conditions:" + pid
+            for j, condition in enumerate(call.conditions):
+                yield condition, "{}{}:{}".format(prefix, j, pid)
+            if not call.location is None:
+                yield call.location, prefix + "location:" + pid
+
+
+def _call_object(node, attr, i, part):
+    call = getattr(node, attr)[i]
+    if part == "call":
+        return call
+    if part == "conditions":
+        return call.conditions
+    if part == "location":
+        return call.location
+    return call.conditions[int(part)]
+
+
+def dump_configuration(configuration, errors, database):
+    objects = _source_objects(database)
+    calls = {}
+    def persistent_id(obj):
+        if isinstance(obj, SourceObject):
+            if objects.get(obj.id) is obj:
+                return "db:" + obj.id
+            if HardcodedNodeParser._cache.get(obj.id) is obj:
+                return "hardcoded:" + obj.id
+            return None
+        item = calls.get(id(obj))
+        if not item is None and item[0] is obj:
+            return item[1]
+        return None
+    for instance in configuration.nodes:
+        pid = persistent_id(instance.node)
+        if not pid is None:
+            for obj, call_pid in _call_objects(instance.node, pid):
+                calls[id(obj)] = (obj, call_pid)
+    handle = StringIO()
+    pickler = cPickle.Pickler(handle, cPickle.HIGHEST_PROTOCOL)
+    pickler.persistent_id = persistent_id
+    pickler.dump((configuration, errors))
+    return handle.getvalue()
+
+
+def load_configuration(data, database):
+    objects = _source_objects(database)
+    shared = set()
+    def persistent_load(pid):
+        kind, ident = pid.split(":", 1)
+        if kind == "call":
+            attr, i, part, pid = ident.split(":", 3)
+            return _call_object(persistent_load(pid), attr, int(i), part)
+        if kind == "db":
+            obj = objects[ident]
+        else:
+            assert kind == "hardcoded"
+            pkg, exe = ident.split(":", 1)[1].split("/", 1)
+            obj = HardcodedNodeParser.get(pkg, exe)
+        shared.add(ident)
+        return obj
+    unpickler = cPickle.Unpickler(StringIO(data))
+    unpickler.persistent_load = persistent_load
+    configuration, errors = unpickler.load()
+    # node instances were registered with the worker's copy of each node
+    for instance in configuration.nodes:
+        if instance.node.id in shared:
+            instance.node.instances.append(instance)
+    return configuration, errors
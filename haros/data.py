@@ -23,6 +23,8 @@
 # Imports
 ###############################################################################
 
+from array import array
+from bisect import bisect_right
 from collections import Counter
 import cPickle
 import datetime
@@ -47,13 +49,15 @@ class LoggingObject(object):
 
 class Rule(object):
     """Represents a coding rule."""
-    def __init__(self, rule_id, name, scope, desc, tags, query = None):
+    def __init__(self, rule_id, name, scope, desc, tags, query = None,
+                 python = None):
         self.id = rule_id
         self.name = name
         self.scope = scope  # can be "global", "package" or "configuration"
         self.description = desc
         self.tags = tags
         self.query = query
+        self.python = python # "module:function" or a Python expression
 
     def to_JSON_object(self):
         return {
@@ -62,7 +66,8 @@ class Rule(object):
             "scope": self.scope,
             "description": self.description,
             "tags": self.tags,
-            "query": self.query
+            "query": self.query,
+            "python": self.python
         }
 
 
@@ -94,6 +99,125 @@ class Violation(object):
         }
 
 
+class QueryProfile(object):
+    """Execution times and match counts of a rule query."""
+    def __init__(self, rule):
+        self.rule = rule
+        self.compile_time = 0.0
+        self.scopes = []    # (scope id, eval time, matches, objects)
+        self.cached = 0     # scopes with matches from a previous run
+        self.overruns = []  # (scope id, "time" or "matches")
+
+    @property
+    def eval_time(self):
+        return sum(s[1] for s in self.scopes)
+
+    @property
+    def total_time(self):
+        return self.compile_time + self.eval_time
+
+    @property
+    def match_count(self):
+        return sum(s[2] for s in self.scopes)
+
+    @property
+    def object_count(self):
+        return sum(s[3] for s in self.scopes)
+
+    def to_JSON_object(self):
+        return {
+            "rule": self.rule.id,
+            "compileTime": self.compile_time,
+            "evalTime": self.eval_time,
+            "matches": self.match_count,
+            "objects": self.object_count,
+            "cached": self.cached,
+            "overruns": [{
+                "scope": scope,
+                "budget": budget
+            } for scope, budget in self.overruns],
+            "scopes": [{
+                "scope": scope,
+                "time": t,
+                "matches": matches,
+                "objects": objects
+            } for scope, t, matches, objects in self.scopes]
+        }
+
+
+class PluginProfile(object):
+    """Resources used by a plugin in each phase of the analysis.
+        The peak RSS is that of the whole process running the plugin
+        (HAROS itself, unless the plugin runs in a worker process, which
+        still starts with a copy of the model); the RSS growth is the
+        part of it that appeared while the plugin was running.
+    """
+    PHASES = ("pre_analysis", "file_analysis", "package_analysis",
+              "configuration_analysis", "post_analysis", "processing")
+
+    def __init__(self, plugin_id, time_limit = None):
+        self.plugin_id = plugin_id
+        self.time_limit = time_limit
+        # phase -> [wall, cpu, child cpu, process peak rss, rss growth]
+        self.phases = {}
+        self.timed_out = None   # phase in which the time limit ran out
+        self.killed = False     # worker process killed after the limit
+
+    def add(self, phase, wall, cpu, child_cpu, process_peak_rss, rss_growth):
+        usage = self.phases.get(phase)
+        if usage is None:
+            self.phases[phase] = [wall, cpu, child_cpu, process_peak_rss,
+                                  rss_growth]
+        else:
+            usage[0] += wall
+            usage[1] += cpu
+            usage[2] += child_cpu
+            usage[3] = max(usage[3], process_peak_rss)
+            usage[4] += rss_growth
+
+    @property
+    def wall_time(self):
+        return sum(u[0] for u in self.phases.itervalues())
+
+    @property
+    def cpu_time(self):
+        return sum(u[1] for u in self.phases.itervalues())
+
+    @property
+    def child_cpu_time(self):
+        return sum(u[2] for u in self.phases.itervalues())
+
+    @property
+    def process_peak_rss(self):
+        return max([u[3] for u in self.phases.itervalues()] or [0])
+
+    @property
+    def rss_growth(self):
+        return sum(u[4] for u in self.phases.itervalues())
+
+    def to_JSON_object(self):
+        return {
+            "plugin": self.plugin_id,
+            "timeLimit": self.time_limit,
+            "timedOut": self.timed_out,
+            "killed": self.killed,
+            "wallTime": self.wall_time,
+            "cpuTime": self.cpu_time,
+            "childCpuTime": self.child_cpu_time,
+            "processPeakRss": self.process_peak_rss,
+            "rssGrowth": self.rss_growth,
+            "phases": [{
+                "phase": phase,
+                "wallTime": usage[0],
+                "cpuTime": usage[1],
+                "childCpuTime": usage[2],
+                "processPeakRss": usage[3],
+                "rssGrowth": usage[4]
+            } for phase, usage in ((p, self.phases.get(p))
+                                   for p in self.PHASES) if usage]
+        }
+
+
 class Metric(object):
     """Represents a quality metric."""
     def __init__(self, metric_id, name, scope, desc, minv = None, maxv = None):
@@ -134,11 +258,98 @@ class Measurement(object):
         }
 
 
+class MeasurementIndex(object):
+    """Values of measurements by metric and scope (e.g., file) id, kept in
+        compact arrays (for integers), for sums, averages, histograms and
+        percentiles over a scope or all scopes (scope id None).
+        Values of measurements within functions are also kept apart.
+    """
+    def __init__(self):
+        self._values = {}       # (metric id, scope id) -> values
+        self._functions = {}    # (metric id, scope id) -> values
+
+    def add(self, datum, scope_id):
+        mid = datum.metric.id
+        value = datum.value
+        _add_value(self._values, (mid, scope_id), value)
+        _add_value(self._values, (mid, None), value)
+        if not datum.location is None and not datum.location.function is None:
+            _add_value(self._functions, (mid, scope_id), value)
+            _add_value(self._functions, (mid, None), value)
+
+    def values(self, metric_id, scope_id = None, functions = False):
+        values = self._functions if functions else self._values
+        return values.get((metric_id, scope_id), ())
+
+    def sum(self, metric_id, scope_id = None, functions = False):
+        return sum(self.values(metric_id, scope_id, functions))
+
+    def average(self, metric_id, scope_id = None, functions = False,
+                float_ = False):
+        return avg(self.values(metric_id, scope_id, functions), float_)
+
+    def histogram(self, metric_id, edges, scope_id = None, functions = False):
+        """Counts of values in each bin [edges[i], edges[i+1]), with the
+            last bin closed; values outside the edges are not counted.
+        """
+        counts = [0] * (len(edges) - 1)
+        last = len(counts) - 1
+        for value in self.values(metric_id, scope_id, functions):
+            i = bisect_right(edges, value) - 1
+            if i == last + 1 and value == edges[-1]:
+                i = last
+            if 0 <= i <= last:
+                counts[i] += 1
+        return counts
+
+    def percentile(self, metric_id, q, scope_id = None, functions = False):
+        """The q-th percentile (0-100) of the values, with linear
+            interpolation between the closest ranks; None if empty.
+        """
+        values = sorted(self.values(metric_id, scope_id, functions))
+        if not values:
+            return None
+        k = (len(values) - 1) * q / 100.0
+        i = int(k)
+        if i + 1 >= len(values):
+            return values[-1]
+        return values[i] + (values[i + 1] - values[i]) * (k - i)
+
+
+class MeasurementList(list):
+    """A list of measurements that counts its changes other than appends
+        (e.g., replaced or removed measurements) in `version`, so that
+        indexes over it know when to start over.
+    """
+    def __init__(self, *args):
+        list.__init__(self, *args)
+        self.version = 0
+
+    def _changed(method):
+        def change(self, *args):
+            self.version += 1
+            return method(self, *args)
+        change.__name__ = method.__name__
+        return change
+
+    __setitem__ = _changed(list.__setitem__)
+    __delitem__ = _changed(list.__delitem__)
+    __setslice__ = _changed(list.__setslice__)
+    __delslice__ = _changed(list.__delslice__)
+    __imul__ = _changed(list.__imul__)
+    insert = _changed(list.insert)
+    pop = _changed(list.pop)
+    remove = _changed(list.remove)
+    reverse = _changed(list.reverse)
+    sort = _changed(list.sort)
+    del _changed
+
+
 class FileAnalysis(object):
     def __init__(self, source_file):
         self.source_file = source_file
         self.violations = []
-        self.metrics = []
+        self.metrics = MeasurementList()
 
     @property
     def scope(self):
@@ -152,6 +363,8 @@ class PackageAnalysis(object):
         self.metrics = []
         self.file_analysis = []
         self.statistics = None
+        self._index = None      # MeasurementIndex of file metrics
+        self._indexed = None    # id(file report) -> indexed metrics state
 
     @property
     def scope(self):
@@ -164,20 +377,51 @@ class PackageAnalysis(object):
         return result
 
     def sum_metric(self, metric_id):
-        result = 0
-        for f in self.file_analysis:
-            for m in f.metrics:
-                if m.metric.id == metric_id:
-                    result += m.value
-        return result
+        return self.metric_index().sum(metric_id)
 
     def avg_metric(self, metric_id):
-        result = []
-        for f in self.file_analysis:
-            for m in f.metrics:
-                if m.metric.id == metric_id:
-                    result.append(m.value)
-        return avg(result)
+        return self.metric_index().average(metric_id)
+
+    def metric_index(self):
+        """MeasurementIndex of the metrics of the package's files,
+            updated with the measurements appended since the last call.
+            It is built again if the metrics of a file were replaced
+            or changed in any other way.
+        """
+        index = getattr(self, "_index", None)
+        if index is None or not self._update_index(index):
+            index = MeasurementIndex()
+            self._indexed = {}
+            for report in self.file_analysis:
+                self._index_metrics(index, report, 0)
+            self._index = index
+        return index
+
+    def _update_index(self, index):
+        # False if the index must be built again
+        indexed = self._indexed
+        for report in self.file_analysis:
+            state = indexed.get(id(report))
+            if state is None:
+                self._index_metrics(index, report, 0)
+                continue
+            metrics = report.metrics
+            version = getattr(metrics, "version", None)
+            if (version is None or not state[0] is report
+                    or not state[1] is metrics or state[2] != version):
+                return False
+            if state[3] < len(metrics):
+                self._index_metrics(index, report, state[3])
+        return len(indexed) == len(self.file_analysis)
+
+    def _index_metrics(self, index, report, start):
+        # state of a file report: (report, metrics, version, indexed count)
+        metrics = report.metrics
+        sf_id = report.source_file.id
+        for datum in metrics[start:]:
+            index.add(datum, sf_id)
+        self._indexed[id(report)] = (report, metrics,
+            getattr(metrics, "version", None), len(metrics))
 
     def get_statistics(self):
         if not self.statistics:
@@ -303,8 +547,7 @@ class Statistics(object):
     def from_reports(cls, reports):
         stats = cls()
         stats._pkg_statistics(reports)
-        file_analysis = [r for p in reports for r in p.file_analysis]
-        stats._file_statistics(file_analysis)
+        stats._file_statistics(reports)
         return stats
 
     def _pkg_statistics(self, reports):
@@ -327,11 +570,21 @@ class Statistics(object):
                 if node.is_nodelet:
                     self.nodelet_count += 1
 
-    def _file_statistics(self, reports):
+    def _file_statistics(self, pkg_reports):
         complexities = []
         fun_lines = []
         file_lines = []
-        for report in reports:
+        for pkg_report in pkg_reports:
+            self._add_file_statistics(pkg_report, complexities, fun_lines,
+                                      file_lines)
+        self.avg_complexity = avg(complexities)
+        self.avg_function_length = avg(fun_lines)
+        self.avg_file_length = avg(file_lines)
+
+    def _add_file_statistics(self, pkg_report, complexities, fun_lines,
+                             file_lines):
+        index = pkg_report.metric_index()
+        for report in pkg_report.file_analysis:
             sf = report.source_file
             self.lines_of_code += sf.lines
             file_lines.append(sf.lines)
@@ -339,7 +592,7 @@ class Statistics(object):
                 self.script_count += 1
             if sf.language == "cpp":
                 self.cpp_lines += sf.lines
-            elif sf.language == "python":
+            elif sf.language == "py":
                 self.python_lines += sf.lines
             elif sf.language == "launch":
                 self.launch_count += 1
@@ -356,19 +609,13 @@ class Statistics(object):
                     self.metrics_issue_count += 1
                 if other:
                     self.other_issue_count += 1
-            if sf.language == "cpp" or sf.language == "python":
-                for metric in report.metrics:
-                    mid = metric.metric.id
-                    if mid == "comments":
-                        self.comment_lines += metric.value
-                    elif mid == "cyclomatic_complexity":
-                        complexities.append(metric.value)
-                    elif mid == "sloc" or mid == "eloc" or mid == "ploc":
-                        if not metric.location.function is None:
-                            fun_lines.append(metric.value)
-        self.avg_complexity = avg(complexities)
-        self.avg_function_length = avg(fun_lines)
-        self.avg_file_length = avg(file_lines)
+            if sf.language == "cpp" or sf.language == "py":
+                self.comment_lines += index.sum("comments", sf.id)
+                complexities.extend(index.values("cyclomatic_complexity",
+                                                 sf.id))
+                for mid in ("sloc", "eloc", "ploc"):
+                    fun_lines.extend(index.values(mid, sf.id,
+                                                  functions = True))
 
 
 class AnalysisReport(object):
@@ -380,6 +627,8 @@ class AnalysisReport(object):
         self.by_config = {}
         self.statistics = None
         self.violations = []    # unknown location
+        self.queries = []       # QueryProfile, slowest first
+        self.plugins = []       # PluginProfile, in plugin order
 
     @property
     def package_count(self):
@@ -423,7 +672,9 @@ class AnalysisReport(object):
                 "messages":     None,
                 "services":     None,
                 "actions":      None
-            }
+            },
+            "queries": [q.to_JSON_object() for q in self.queries],
+            "plugins": [p.to_JSON_object() for p in self.plugins]
         }
 
 
@@ -440,6 +691,7 @@ class HarosSettings(object):
             "COLCON_PREFIX_PATH": os.environ.get("COLCON_PREFIX_PATH")
         },
         "blacklist": [],
+        "timeouts": {},
         "workspace": None,
         "cpp": {
             "parser": "clang",
@@ -460,9 +712,12 @@ class HarosSettings(object):
     def __init__(self, env=None, blacklist=None, workspace=None,
                  cpp_parser=None, cpp_includes=None, cpp_parser_lib=None,
                  cpp_parser_lib_file=None, cpp_compile_db=None,
-                 ignored_tags=None, ignored_rules=None, ignored_metrics=None):
+                 ignored_tags=None, ignored_rules=None, ignored_metrics=None,
+                 timeouts=None):
         self.environment = env or dict(self.DEFAULTS["environment"])
         self.plugin_blacklist = blacklist if not blacklist is None else []
+        self.plugin_timeouts = (timeouts
+                or dict(self.DEFAULTS["timeouts"]))
         self.workspace = workspace or self.find_ros_workspace()
         self.ignored_tags = (ignored_tags
                 or list(self.DEFAULTS["analysis"]["ignore"]["tags"]))
@@ -495,6 +750,9 @@ class HarosSettings(object):
         elif not env is None:
             raise ValueError("invalid value for environment")
         blacklist = data.get("plugin_blacklist", [])
+        timeouts = data.get("plugin_timeouts")
+        if not timeouts is None and not isinstance(timeouts, dict):
+            raise ValueError("invalid value for plugin_timeouts")
         workspace = ws or data.get("workspace")
         analysis = data.get("analysis", {})
         analysis_ignored = analysis.get("ignore", {})
@@ -512,7 +770,7 @@ class HarosSettings(object):
                    cpp_parser_lib_file=cpp_parser_lib_file,
                    cpp_includes=cpp_includes, cpp_compile_db=cpp_compile_db,
                    ignored_tags=ignored_tags, ignored_rules=ignored_rules,
-                   ignored_metrics=ignored_metrics)
+                   ignored_metrics=ignored_metrics, timeouts=timeouts)
 
     def find_ros_workspace(self):
         """This replicates the behaviour of `roscd`."""
@@ -634,7 +892,8 @@ class HarosDatabase(LoggingObject):
             self.rules[rule_id] = Rule(rule_id, rule["name"],
                                        rule.get("scope", "global"),
                                        rule["description"], tags,
-                                       query=rule.get("query"))
+                                       query=rule.get("query"),
+                                       python=rule.get("python"))
             if ignored_rules and rule_id in ignored_rules:
                 self.log.debug("Ignored rule: " + rule_id)
                 continue
@@ -679,6 +938,13 @@ class HarosDatabase(LoggingObject):
         for report in self.history:
             report.project = None
             report.by_package = {}
+        # ----- graph and measurement indexes are rebuilt when needed
+        for config in self.configurations:
+            config._graph = None
+        if not self.report is None:
+            for pkg_report in self.report.by_package.itervalues():
+                pkg_report._index = None
+                pkg_report._indexed = None
         # NOTE IMPORTANT!
         # storing bonsai source trees can sometimes hit the recursion limit
         for node in self.nodes.itervalues():
@@ -726,6 +992,16 @@ class HarosDatabase(LoggingObject):
 # Helper Functions
 ###############################################################################
 
+def _add_value(arrays, key, value):
+    # series of integers are kept in arrays; any other value turns the
+    # series into a list, so that values (and their sums) keep their types
+    values = arrays.get(key)
+    if values is None:
+        values = arrays[key] = array("l") if type(value) is int else []
+    elif isinstance(values, array) and not type(value) is int:
+        values = arrays[key] = list(values)
+    values.append(value)
+
 def avg(numbers, float_ = False):
     if not numbers:
         return 0.0 if float_ else 0
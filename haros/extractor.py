@@ -682,7 +682,7 @@ class PackageExtractor(LoggingObject):
                 self.log.debug("Found file %s at %s", filename, path)
                 source = SourceFile(filename, path, pkg)
                 ignore = source.set_file_stats()
-                if any(v for v in ignore.itervalues()):
+                if ignore:
                     analysis_ignore[source.id] = ignore
                 if pkg._analyse and source.language == "launch":
                     self.log.info("Parsing launch file: " + source.path)
@@ -26,6 +26,7 @@
 # |-- index.yaml
 # |-- configs.yaml
 # |-- parse_cache.json
+# |-- plugin_registry.json
 # |-- log.txt
 # |-+ repositories
 #   |-+ ...
@@ -50,6 +51,8 @@
 #   |-+ <project>
 #     |-- analysis.db
 #     |-- haros.db
+#     |-- query_cache.json
+#     |-- plugin_cache.json
 
 # init creates the default data dir
 # viz is copied to init dir
@@ -79,6 +82,8 @@
 #       -w  whitelist plugins
 #       -b  blacklist plugins
 #       -d  use given directory to load and export
+#       -j  number of worker processes
+#       --isolate-plugins  run each plugin in its own process
 #   haros export [args]
 #       runs export only
 #       -v export viz files too
@@ -106,8 +111,8 @@ from pkg_resources import Requirement, resource_filename
 
 from .data import HarosDatabase, HarosSettings
 from .extractor import ProjectExtractor, HardcodedNodeParser
-from .config_builder import ConfigurationBuilder
-from .plugin_manager import Plugin
+from .config_builder import ConfigurationBuilder, build_configurations
+from .plugin_manager import Plugin, PluginRegistry
 from .analysis_manager import AnalysisManager
 from .export_manager import JsonExporter, JUnitExporter
 from . import visualiser as viz
@@ -135,6 +140,7 @@ class HarosLauncher(object):
             "# workspace: '/path/to/ws'\n"
             "# environment: null\n"
             "# plugin_blacklist: []\n"
+            "# plugin_timeouts: {}\n"
             "# cpp:\n"
             # "#    parser: clang,\n"
             "#    parser_lib: '/usr/lib/llvm-3.8/lib'\n"
@@ -216,7 +222,10 @@ class HarosLauncher(object):
             use_repos=args.use_repos, parse_nodes=args.parse_nodes,
             copy_env=args.env, use_cache=(not args.no_cache),
             junit_xml_output=args.junit_xml_output,
-            minimal_output=args.minimal_output)
+            minimal_output=args.minimal_output, jobs=args.jobs,
+            query_timeout=args.query_timeout, query_limit=args.query_limit,
+            plugin_timeout=args.plugin_timeout,
+            isolate_plugins=args.isolate_plugins)
         return analyse.run()
 
     def command_export(self, args):
@@ -258,7 +267,7 @@ class HarosLauncher(object):
             run_from_source=self.run_from_source, use_repos=args.use_repos,
             ws=args.ws, copy_env=args.env, use_cache=(not args.no_cache),
             junit_xml_output=args.junit_xml_output,
-            minimal_output=args.minimal_output)
+            minimal_output=args.minimal_output, jobs=args.jobs)
         return parse.run()
 
     def parse_arguments(self, argv = None):
@@ -303,6 +312,18 @@ class HarosLauncher(object):
                             help = "load/export using the given directory")
         parser.add_argument("--no-cache", action = "store_true",
                             help = "do not use available caches")
+        parser.add_argument("-j", "--jobs", type = int, default = 1,
+                            help = "number of worker processes (default: 1)")
+        parser.add_argument("--query-timeout", type = float,
+                            metavar = "SECONDS",
+                            help = "time budget of each query, per scope")
+        parser.add_argument("--query-limit", type = int, metavar = "N",
+                            help = "maximum matches of each query, per scope")
+        parser.add_argument("--plugin-timeout", type = float,
+                            metavar = "SECONDS",
+                            help = "time budget of each plugin")
+        parser.add_argument("--isolate-plugins", action = "store_true",
+                            help = "run each plugin in its own process")
         parser.add_argument("--junit-xml-output", action='store_true',
                             help = "output JUnit XML report file(s)")
         parser.add_argument("--minimal-output", action='store_true',
@@ -330,6 +351,18 @@ class HarosLauncher(object):
                             help = "load/export using the given directory")
         parser.add_argument("--no-cache", action = "store_true",
                             help = "do not use available caches")
+        parser.add_argument("-j", "--jobs", type = int, default = 1,
+                            help = "number of worker processes (default: 1)")
+        parser.add_argument("--query-timeout", type = float,
+                            metavar = "SECONDS",
+                            help = "time budget of each query, per scope")
+        parser.add_argument("--query-limit", type = int, metavar = "N",
+                            help = "maximum matches of each query, per scope")
+        parser.add_argument("--plugin-timeout", type = float,
+                            metavar = "SECONDS",
+                            help = "time budget of each plugin")
+        parser.add_argument("--isolate-plugins", action = "store_true",
+                            help = "run each plugin in its own process")
         parser.add_argument("--junit-xml-output", action='store_true',
                             help = "output JUnit XML report file(s)")
         parser.add_argument("--minimal-output", action='store_true',
@@ -377,6 +410,8 @@ class HarosLauncher(object):
         parser.add_argument("--ws", help = "set the catkin workspace directory")
         parser.add_argument("--no-cache", action = "store_true",
                             help = "do not use available caches")
+        parser.add_argument("-j", "--jobs", type = int, default = 1,
+                            help = "number of worker processes (default: 1)")
         parser.add_argument("--junit-xml-output", action='store_true',
                             help = "output JUnit XML report file(s)")
         parser.add_argument("--minimal-output", action='store_true',
@@ -547,10 +582,17 @@ class HarosAnalyseRunner(HarosCommonExporter):
                  whitelist, blacklist, log = None, run_from_source = False,
                  use_repos = False, parse_nodes = False, copy_env = False,
                  use_cache = True, settings = None, junit_xml_output = False,
-                 minimal_output = False):
+                 minimal_output = False, jobs = 1, query_timeout = None,
+                 query_limit = None, plugin_timeout = None,
+                 isolate_plugins = False):
         HarosRunner.__init__(self, haros_dir, config_path, log,
             run_from_source, junit_xml_output, minimal_output)
         self.project_file = project_file
+        self.jobs = jobs
+        self.query_timeout = query_timeout
+        self.query_limit = query_limit
+        self.plugin_timeout = plugin_timeout
+        self.isolate_plugins = isolate_plugins
         self.use_repos = use_repos
         self.parse_nodes = parse_nodes
         self.copy_env = copy_env
@@ -560,6 +602,7 @@ class HarosAnalyseRunner(HarosCommonExporter):
         self.settings = settings
         self.project = None
         self.database = None
+        self.plugin_registry = None
         self.current_dir = None
         self.json_dir = None
         if data_dir:
@@ -628,31 +671,41 @@ class HarosAnalyseRunner(HarosCommonExporter):
         return extractor.configurations, extractor.node_specs, env
 
     def _extract_configurations(self, project, configs, nodes, environment):
-        for name, data in configs.iteritems():
-            if isinstance(data, list):
-                builder = ConfigurationBuilder(name, environment, self.database)
-                launch_files = data if isinstance(data, list) else data["launch"]
-            else:
-                builder = ConfigurationBuilder(name, environment, self.database,
-                    nodes=nodes, hints=data.get("hints"))
-                launch_files = data["launch"]
-            for launch_file in launch_files:
-                parts = launch_file.split(os.sep, 1)
-                if not len(parts) == 2:
-                    raise ValueError("invalid launch file: " + launch_file)
-                pkg = self.database.packages.get("package:" + parts[0])
-                if not pkg:
-                    raise ValueError("unknown package: " + parts[0])
-                path = os.path.join(pkg.path, parts[1])
-                launch = self.database.get_file(path)
-                if not launch:
-                    raise ValueError("unknown launch file: " + launch_file)
-                builder.add_launch(launch)
-            for msg in builder.errors:
+        if self.jobs > 1 and len(configs) > 1:
+            print "  > Building configurations with {} workers.".format(
+                min(self.jobs, len(configs)))
+        def build(name, data):
+            return self._build_configuration(name, data, nodes, environment)
+        results = build_configurations(self.database, build,
+                                       configs.iteritems(), jobs=self.jobs)
+        for configuration, errors in results:
+            for msg in errors:
                 self.log.warning("Configuration %s: %s",
-                                 builder.configuration.name, msg)
-            project.configurations.append(builder.configuration)
-            self.database.configurations.append(builder.configuration)
+                                 configuration.name, msg)
+            project.configurations.append(configuration)
+            self.database.configurations.append(configuration)
+
+    def _build_configuration(self, name, data, nodes, environment):
+        if isinstance(data, list):
+            builder = ConfigurationBuilder(name, environment, self.database)
+            launch_files = data
+        else:
+            builder = ConfigurationBuilder(name, environment, self.database,
+                nodes=nodes, hints=data.get("hints"))
+            launch_files = data["launch"]
+        for launch_file in launch_files:
+            parts = launch_file.split(os.sep, 1)
+            if not len(parts) == 2:
+                raise ValueError("invalid launch file: " + launch_file)
+            pkg = self.database.packages.get("package:" + parts[0])
+            if not pkg:
+                raise ValueError("unknown package: " + parts[0])
+            path = os.path.join(pkg.path, parts[1])
+            launch = self.database.get_file(path)
+            if not launch:
+                raise ValueError("unknown launch file: " + launch_file)
+            builder.add_launch(launch)
+        return builder
 
     def _load_history(self):
         """
@@ -683,10 +736,15 @@ class HarosAnalyseRunner(HarosCommonExporter):
         metrics.update(ms)
         print "[HAROS] Loading plugins..."
         blacklist = self.blacklist or self.settings.plugin_blacklist
+        registry_file = None
+        if self.use_cache:
+            registry_file = os.path.join(self.root, "plugin_registry.json")
+        self.plugin_registry = PluginRegistry(registry_file)
         plugins = Plugin.load_plugins(whitelist=self.whitelist,
                                       blacklist=blacklist,
                                       common_rules=self.database.rules,
-                                      common_metrics=self.database.metrics)
+                                      common_metrics=self.database.metrics,
+                                      registry=self.plugin_registry)
         if not plugins:
             if blacklist or self.whitelist:
                 msg = ("Could not find any analysis plugins "
@@ -708,10 +766,31 @@ class HarosAnalyseRunner(HarosCommonExporter):
 
     def _analyse(self, plugins, rules, metrics):
         print "[HAROS] Running analysis..."
+        # ----- import only the plugins with something to analyse
+        project = self.database.project
+        languages = set(sf.language for pkg in project.packages
+                        if pkg._analyse for sf in pkg.source_files)
+        plugins = Plugin.load_modules(plugins, languages,
+            configurations=bool(project.configurations),
+            registry=self.plugin_registry)
         self._empty_dir(self.export_dir)
         temp_path = tempfile.mkdtemp()
+        query_cache = None
+        plugin_cache = None
+        if self.use_cache:
+            self._ensure_dir(self.current_dir)
+            query_cache = os.path.join(self.current_dir, "query_cache.json")
+            plugin_cache = os.path.join(self.current_dir, "plugin_cache.json")
+        timeouts = self.settings.plugin_timeouts
         analysis = AnalysisManager(self.database, temp_path, self.export_dir,
-                                   pyflwor_dir=self.pyflwor_dir)
+                                   pyflwor_dir=self.pyflwor_dir,
+                                   jobs=self.jobs, query_cache=query_cache,
+                                   query_timeout=self.query_timeout,
+                                   query_limit=self.query_limit,
+                                   plugin_cache=plugin_cache,
+                                   plugin_timeout=self.plugin_timeout,
+                                   plugin_timeouts=timeouts,
+                                   isolate_plugins=self.isolate_plugins)
         try:
             analysis.run(plugins, allowed_rules=rules, allowed_metrics=metrics,
                          ignored_lines=self.settings.ignored_lines)
@@ -762,14 +841,14 @@ class HarosParseRunner(HarosAnalyseRunner):
                  log=None, run_from_source=False, use_repos=False, ws=None,
                  copy_env=False, use_cache=True, settings=None,
                  junit_xml_output = False,
-                 minimal_output = False):
+                 minimal_output = False, jobs = 1):
         HarosAnalyseRunner.__init__(
             self, haros_dir, config_path, project_file, data_dir,
             [], [], log=log, run_from_source=run_from_source,
             use_repos=use_repos, parse_nodes=True, copy_env=copy_env,
             use_cache=use_cache, settings=settings,
             junit_xml_output=junit_xml_output,
-            minimal_output=minimal_output
+            minimal_output=minimal_output, jobs=jobs
         )
         self.workspace = ws
 
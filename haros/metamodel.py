@@ -23,8 +23,10 @@
 # Imports
 ###############################################################################
 
-from collections import Counter
+from bisect import bisect_left, bisect_right
+from collections import Counter, deque
 import os
+import re
 
 import magic as file_cmd
 
@@ -242,6 +244,71 @@ class Location(object):
         return s
 
 
+class IgnoredLines(object):
+    """Lines of a source file to be ignored by the analysis, for all
+        rules and metrics or only for some of them (by id).
+        Single lines are kept in a set, and ranges as sorted arrays
+        of disjoint intervals, searched with bisection.
+    """
+    def __init__(self):
+        self.lines = set()
+        self.starts = []
+        self.ends = []
+        self.by_rule = {}   # rule or metric id -> IgnoredLines
+
+    def add(self, line, rule_ids = None):
+        if rule_ids:
+            for rule_id in rule_ids:
+                self._for_rule(rule_id).lines.add(line)
+        else:
+            self.lines.add(line)
+
+    def add_range(self, first, last, rule_ids = None):
+        if rule_ids:
+            for rule_id in rule_ids:
+                self._for_rule(rule_id).add_range(first, last)
+            return
+        # merge with overlapping or adjacent intervals
+        i = bisect_left(self.ends, first - 1)
+        j = bisect_right(self.starts, last + 1)
+        if i < j:
+            first = min(first, self.starts[i])
+            last = max(last, self.ends[j - 1])
+        self.starts[i:j] = [first]
+        self.ends[i:j] = [last]
+
+    def ignores_rule(self, rule_id, line):
+        # rules can be given by full id or without the plugin prefix
+        for key in (rule_id, rule_id.rsplit(":", 1)[-1]):
+            ignored = self.by_rule.get(key)
+            if not ignored is None and line in ignored:
+                return True
+        return False
+
+    def to_JSON_object(self):
+        return {
+            "lines": sorted(self.lines),
+            "ranges": zip(self.starts, self.ends),
+            "rules": dict((rule_id, ignored.to_JSON_object())
+                          for rule_id, ignored in self.by_rule.iteritems())
+        }
+
+    def _for_rule(self, rule_id):
+        ignored = self.by_rule.get(rule_id)
+        if ignored is None:
+            ignored = self.by_rule[rule_id] = IgnoredLines()
+        return ignored
+
+    def __contains__(self, line):
+        if line in self.lines:
+            return True
+        i = bisect_right(self.starts, line) - 1
+        return i >= 0 and line <= self.ends[i]
+
+    def __nonzero__(self):
+        return bool(self.lines or self.starts or self.by_rule)
+
+
 class SourceObject(MetamodelObject):
     """Base class for objects subject to analysis."""
     SCOPES = ("file", "node", "package", "repository", "project")
@@ -345,20 +412,32 @@ class SourceFile(SourceObject):
         self.timestamp = os.path.getmtime(self.path)
         self.lines = 0
         self.sloc = 0
-        ignore_all = []
-        to_ignore = {"*": ignore_all}
-        ilp, inlp = self._ignore_parsers()
+        ignored = IgnoredLines()
+        ranges = [] # open ranges: (first line, rule ids)
+        directive = self._ignore_directive()
         with open(self.path, "r") as handle:
             for line in handle:
                 self.lines += 1
                 sline = line.strip()
                 if sline:
                     self.sloc += 1
-                    if ilp(sline):
-                        ignore_all.append(self.lines)
-                    elif inlp(sline):
-                        ignore_all.append(self.lines + 1)
-        return to_ignore
+                    match = directive and directive.search(sline)
+                    if not match:
+                        continue
+                    kind = match.group(1)
+                    rules = _ignored_rules(match.group(2))
+                    if kind == "line":
+                        ignored.add(self.lines, rules)
+                    elif kind == "next-line":
+                        ignored.add(self.lines + 1, rules)
+                    elif kind == "begin":
+                        ranges.append((self.lines, rules))
+                    elif ranges:
+                        first, rules = ranges.pop()
+                        ignored.add_range(first, self.lines, rules)
+        for first, rules in ranges:
+            ignored.add_range(first, self.lines, rules)
+        return ignored
 
     def to_JSON_object(self):
         return {
@@ -390,12 +469,12 @@ class SourceFile(SourceObject):
     def __repr__(self):
         return self.id
 
-    def _ignore_parsers(self):
+    def _ignore_directive(self):
         if self.language == "cpp":
-            return (_cpp_ignore_line, _cpp_ignore_next_line)
-        elif self.language == "python":
-            return (_py_ignore_line, _py_ignore_next_line)
-        return (_no_parser, _no_parser)
+            return _CPP_IGNORE
+        elif self.language == "py":
+            return _PY_IGNORE
+        return None
 
 
 class Package(SourceObject):
@@ -851,22 +930,7 @@ class NodeInstance(Resource):
 
     @property
     def rt_outlinks(self):
-        visited = set()
-        queue = [self]
-        nodes = []
-        while queue:
-            current = queue.pop(0)
-            if current.id in visited:
-                continue
-            nodes.append(current)
-            visited.add(current.id)
-            for pub in self.publishers:
-                for sub in pub.topic.subscribers:
-                    queue.append(sub.node)
-            for cli in self.clients:
-                if cli.service.server:
-                    queue.append(cli.service.server.node)
-        return nodes
+        return list(self.configuration.graph.reachable(self))
 
     def traceability(self):
         return [self.launch.location]
@@ -1151,6 +1215,356 @@ class ResourceCollection(object):
         return previous
 
 
+class ParameterCollection(ResourceCollection):
+    """A ResourceCollection whose parameters can be deferred in bulk
+        (e.g., those forwarded to a node). Deferred parameters are only
+        created when one in their namespace is looked up, or when the
+        collection is used as a whole, and take the place in which
+        they were deferred.
+    """
+    def __init__(self, iterable):
+        self._all = []
+        self._counter = Counter()
+        self._deferred = [] # [position, namespace, function]
+        if not iterable is None:
+            for resource in iterable:
+                self.add(resource)
+
+    @property
+    def all(self):
+        self._resolve()
+        return self._all
+
+    @property
+    def enabled(self):
+        return [p for p in self.all if not p.conditions]
+
+    @property
+    def conditional(self):
+        return [p for p in self.all if p.conditions]
+
+    @property
+    def unresolved(self):
+        return [p for p in self.all if "?" in p.id]
+
+    @property
+    def counter(self):
+        self._resolve()
+        return self._counter
+
+    def __contains__(self, key):
+        self._resolve(key)
+        return key in self._counter
+
+    def get(self, name, conditional = True):
+        self._resolve(name)
+        for resource in reversed(self._all):
+            if resource.id == name:
+                if conditional or not resource.conditions:
+                    return resource
+        return None
+
+    def get_all(self, name, conditional = True):
+        self._resolve(name)
+        return [resource for resource in self._all if resource.id == name
+                and (conditional or not resource.conditions)]
+
+    def add(self, resource):
+        self._all.append(resource)
+        previous = self._counter[resource.id]
+        self._counter[resource.id] += 1
+        return previous
+
+    def defer(self, namespace, function):
+        """Add the parameters returned by `function()`, all of them
+            within `namespace`, when they are first needed.
+        """
+        self._deferred.append([len(self._all), namespace + "/", function])
+
+    def remove(self, resource):
+        for i, other in enumerate(self._all):
+            if other is resource:
+                break
+        else:
+            return False
+        del self._all[i]
+        self._counter[resource.id] -= 1
+        if not self._counter[resource.id]:
+            del self._counter[resource.id]
+        for entry in self._deferred:
+            if entry[0] > i:
+                entry[0] -= 1
+        return True
+
+    def _resolve(self, name = None):
+        if not self._deferred:
+            return
+        offset = 0
+        deferred = []
+        for entry in self._deferred:
+            entry[0] += offset
+            position, namespace, function = entry
+            if name is None or name.startswith(namespace):
+                params = function()
+                self._all[position:position] = params
+                offset += len(params)
+                for param in params:
+                    self._counter[param.id] += 1
+            else:
+                deferred.append(entry)
+        self._deferred = deferred
+
+    def __getstate__(self):
+        # deferred functions cannot be pickled
+        self._resolve()
+        return self.__dict__
+
+
+
+class IdentityIndex(object):
+    """Mapping keyed by object identity, for resources that compare
+        equal by name (e.g., node instances with colliding names).
+        Iterates over keys in insertion order.
+    """
+    def __init__(self):
+        self._items = {}    # id(key) -> (key, value)
+        self._order = []
+
+    def __getitem__(self, key):
+        return self._items[id(key)][1]
+
+    def __contains__(self, key):
+        return id(key) in self._items
+
+    def __iter__(self):
+        return iter(self._order)
+
+    def __len__(self):
+        return len(self._order)
+
+    def get(self, key, default = None):
+        item = self._items.get(id(key))
+        return default if item is None else item[1]
+
+    def setdefault(self, key, default = None):
+        item = self._items.get(id(key))
+        if item is None:
+            item = self._items[id(key)] = (key, default)
+            self._order.append(key)
+        return item[1]
+
+    def keys(self):
+        return list(self._order)
+
+    def values(self):
+        return [self._items[id(key)][1] for key in self._order]
+
+    def items(self):
+        return [self._items[id(key)] for key in self._order]
+
+    def iteritems(self):
+        for key in self._order:
+            yield self._items[id(key)]
+
+
+class ComputationGraph(object):
+    """Index of the links between the resources of a Configuration.
+        It is built once, when first requested, and caches the results
+        of reachability queries over node instances.
+        Node instances are connected from publishers to subscribers
+        and from service clients to servers.
+        Resources are indexed by identity, not by name.
+    """
+
+    def __init__(self, config):
+        self.configuration = config
+        self.publishes = IdentityIndex()    # node -> [topic]
+        self.subscribes = IdentityIndex()   # node -> [topic]
+        self.provides = IdentityIndex()     # node -> [service]
+        self.calls = IdentityIndex()        # node -> [service]
+        self.reads = IdentityIndex()        # node -> [parameter]
+        self.writes = IdentityIndex()       # node -> [parameter]
+        self.publishers = IdentityIndex()   # topic -> [node]
+        self.subscribers = IdentityIndex()  # topic -> [node]
+        self.servers = IdentityIndex()      # service -> [node]
+        self.clients = IdentityIndex()      # service -> [node]
+        self.readers = IdentityIndex()      # parameter -> [node]
+        self.writers = IdentityIndex()      # parameter -> [node]
+        self._succ = IdentityIndex()
+        self._pred = IdentityIndex()
+        self._edges = set()     # ids of (index, key, value) already added
+        self._searches = {}
+        self._paths = {}
+        self._components = None
+        self._component_of = None
+        self._build()
+
+    def successors(self, node):
+        return list(self._succ.get(node, ()))
+
+    def predecessors(self, node):
+        return list(self._pred.get(node, ()))
+
+    def reachable(self, node, reverse = False):
+        """Returns the nodes reachable from `node` (itself included),
+            in breadth-first order. If `reverse` is set, returns
+            the nodes from which `node` is reachable instead.
+        """
+        return self._search(node, reverse)[0]
+
+    def reaches(self, source, target):
+        """Returns whether there is a (non-empty) path from `source`
+            to `target`; a node only reaches itself through a cycle.
+        """
+        if source is target:
+            component = self.component(source)
+            return component is not None and (len(component) > 1
+                or any(n is source for n in self._succ[source]))
+        return id(target) in self._search(source, False)[1]
+
+    def shortest_path(self, source, target):
+        """Returns the list of nodes in a shortest path from
+            `source` to `target`, or None if there is no such path.
+        """
+        key = (id(source), id(target))
+        if key in self._paths:
+            return self._paths[key]
+        parents = self._search(source, False)[1]
+        path = None
+        if id(target) in parents:
+            path = []
+            current = target
+            while not current is None:
+                path.append(current)
+                current = parents[id(current)]
+            path.reverse()
+        self._paths[key] = path
+        return path
+
+    def components(self):
+        """Returns the strongly connected components of the graph,
+            as lists of nodes, in reverse topological order.
+        """
+        if self._components is None:
+            self._tarjan()
+        return self._components
+
+    def component(self, node):
+        if self._components is None:
+            self._tarjan()
+        return self._component_of.get(id(node))
+
+    def cycles(self):
+        return [c for c in self.components()
+                if len(c) > 1 or any(n is c[0] for n in self._succ[c[0]])]
+
+    def _build(self):
+        for node in self.configuration.nodes:
+            self._succ.setdefault(node, [])
+            self._pred.setdefault(node, [])
+            for link in node.publishers:
+                self._add(self.publishes, node, link.topic)
+                self._add(self.publishers, link.topic, node)
+            for link in node.subscribers:
+                self._add(self.subscribes, node, link.topic)
+                self._add(self.subscribers, link.topic, node)
+            for link in node.servers:
+                self._add(self.provides, node, link.service)
+                self._add(self.servers, link.service, node)
+            for link in node.clients:
+                self._add(self.calls, node, link.service)
+                self._add(self.clients, link.service, node)
+            for link in node.reads:
+                self._add(self.reads, node, link.parameter)
+                self._add(self.readers, link.parameter, node)
+            for link in node.writes:
+                self._add(self.writes, node, link.parameter)
+                self._add(self.writers, link.parameter, node)
+        for topic, publishers in self.publishers.iteritems():
+            self._connect(publishers, self.subscribers.get(topic, ()))
+        for service, clients in self.clients.iteritems():
+            self._connect(clients, self.servers.get(service, ()))
+
+    def _connect(self, sources, targets):
+        for source in sources:
+            for target in targets:
+                self._add(self._succ, source, target)
+                self._add(self._pred, target, source)
+
+    def _add(self, index, key, value):
+        values = index.setdefault(key, [])
+        edge = (id(index), id(key), id(value))
+        if not edge in self._edges:
+            self._edges.add(edge)
+            values.append(value)
+
+    def _search(self, node, reverse):
+        # breadth-first search; the parent map (by id) doubles as visited set
+        key = (id(node), reverse)
+        result = self._searches.get(key)
+        if result is None:
+            edges = self._pred if reverse else self._succ
+            order = [node]
+            parents = {id(node): None}
+            queue = deque(order)
+            while queue:
+                current = queue.popleft()
+                for other in edges.get(current, ()):
+                    if not id(other) in parents:
+                        parents[id(other)] = current
+                        order.append(other)
+                        queue.append(other)
+            result = (order, parents)
+            self._searches[key] = result
+        return result
+
+    def _tarjan(self):
+        # iterative version of Tarjan's algorithm, over node ids
+        index = {}
+        lowlink = {}
+        stack = []
+        on_stack = set()
+        components = []
+        component_of = {}
+        for root in self.configuration.nodes:
+            if id(root) in index:
+                continue
+            work = [(root, iter(self._succ[root]))]
+            index[id(root)] = lowlink[id(root)] = len(index)
+            stack.append(root)
+            on_stack.add(id(root))
+            while work:
+                node, children = work[-1]
+                for child in children:
+                    if not id(child) in index:
+                        index[id(child)] = lowlink[id(child)] = len(index)
+                        stack.append(child)
+                        on_stack.add(id(child))
+                        work.append((child, iter(self._succ[child])))
+                        break
+                    elif id(child) in on_stack:
+                        lowlink[id(node)] = min(lowlink[id(node)],
+                                                index[id(child)])
+                else:
+                    work.pop()
+                    if work:
+                        parent = id(work[-1][0])
+                        lowlink[parent] = min(lowlink[parent],
+                                              lowlink[id(node)])
+                    if lowlink[id(node)] == index[id(node)]:
+                        component = []
+                        while True:
+                            other = stack.pop()
+                            on_stack.discard(id(other))
+                            component.append(other)
+                            component_of[id(other)] = component
+                            if other is node:
+                                break
+                        components.append(component)
+        self._components = components
+        self._component_of = component_of
+
+
 class Configuration(MetamodelObject):
     """A configuration is more or less equivalent to an application.
         It is the result of a set of launch files,
@@ -1166,13 +1580,22 @@ class Configuration(MetamodelObject):
         self.nodes = ResourceCollection(nodes)
         self.topics = ResourceCollection(topics)
         self.services = ResourceCollection(services)
-        self.parameters = ResourceCollection(parameters)
+        self.parameters = ParameterCollection(parameters)
         self.dependencies = DependencySet()
+        self._graph = None
 
     @property
     def location(self):
         return RuntimeLocation(self)
 
+    @property
+    def graph(self):
+        # built on first use, after the configuration is complete;
+        # configurations saved by older versions have no _graph
+        if getattr(self, "_graph", None) is None:
+            self._graph = ComputationGraph(self)
+        return self._graph
+
     def get_collisions(self):
         counter = Counter()
         counter += self.nodes.counter
@@ -1429,20 +1852,16 @@ class WriteLink(ParameterPrimitive):
 # Helper Functions
 ###############################################################################
 
-def _cpp_ignore_line(line):
-    return "// haros:ignore-line" in line
-
-def _cpp_ignore_next_line(line):
-    return "// haros:ignore-next-line" in line
-
-def _py_ignore_line(line):
-    return "# haros:ignore-line" in line
+# comments such as "// haros:ignore-next-line" or "# haros:ignore-begin(r1)"
+_IGNORE_DIRECTIVE = (r"\s*haros:ignore-(line|next-line|begin|end)\b"
+                     r"(?:\(([^)]*)\))?")
+_CPP_IGNORE = re.compile(r"//" + _IGNORE_DIRECTIVE)
+_PY_IGNORE = re.compile(r"#" + _IGNORE_DIRECTIVE)
 
-def _py_ignore_next_line(line):
-    return "# haros:ignore-next-line" in line
-
-def _no_parser(line):
-    return False
+def _ignored_rules(text):
+    if not text:
+        return None
+    return tuple(r.strip() for r in text.split(",") if r.strip()) or None
 
 
 
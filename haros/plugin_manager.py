@@ -24,10 +24,12 @@
 ###############################################################################
 
 import importlib
+import json
 import logging
 import os
 import pkgutil
 from pkg_resources import resource_stream
+import sys
 import yaml
 
 
@@ -60,6 +62,7 @@ class AnalysisInterface(LoggingObject):
         self.languages  = set(languages)
         self.state      = None
         self.f_analysis = hasattr(module, "file_analysis")
+        self.b_analysis = hasattr(module, "file_batch_analysis")
         self.p_analysis = hasattr(module, "package_analysis")
         self.c_analysis = hasattr(module, "configuration_analysis")
 
@@ -69,6 +72,15 @@ class AnalysisInterface(LoggingObject):
             self.log.debug("Calling module.file_analysis")
             self.module.file_analysis(iface, scope)
 
+    def analyse_file_batch(self, iface, scopes):
+        # all files of a package with the same language;
+        # plugins that implement this are not called for single files
+        self.log.debug("Plugin.analyse_file_batch: %d files", len(scopes))
+        scopes = [scope for scope in scopes if scope.language in self.languages]
+        if self.b_analysis and scopes:
+            self.log.debug("Calling module.file_batch_analysis")
+            self.module.file_batch_analysis(iface, scopes)
+
     def analyse_package(self, iface, scope):
         self.log.debug("Plugin.analyse_package: " + scope.id)
         if self.p_analysis:
@@ -166,27 +178,187 @@ class ExportInterface(LoggingObject):
     pass
 
 
+###############################################################################
+# Plugin Registry
+###############################################################################
+
+class PluginRegistry(LoggingObject):
+    """A cache of the installed plugins (name and directory), of their
+        manifests and of the functions their modules define, so that
+        plugins need not be searched for nor imported on every run.
+        The search is repeated when a directory of the Python path
+        changes, and a plugin is read again when its files change.
+    """
+    VERSION = 1
+
+    def __init__(self, path = None):
+        self.path = path
+        self.stamps = {}    # search path -> mtime
+        self.found = []     # [plugin name, directory], in search order
+        self.entries = {}   # plugin name -> cached plugin data
+        self.changed = False
+        if path:
+            self._read()
+
+    def plugins(self):
+        """Names and directories of the installed plugins, in the order
+            of the Python path. The directory is None for plugins that
+            are not installed in a regular directory (e.g., zip files).
+        """
+        stamps = self._search_stamps()
+        if stamps != self.stamps:
+            self.log.debug("Searching for plugins.")
+            found = []
+            names = set()
+            for finder, name, ispkg in pkgutil.iter_modules():
+                if not name.startswith(Plugin.PREFIX) or name in names:
+                    continue
+                names.add(name)
+                path = getattr(finder, "path", None)
+                found.append([name, os.path.join(path, name)
+                                    if not path is None else None])
+            self.stamps = stamps
+            self.found = found
+            for name in set(self.entries).difference(names):
+                del self.entries[name]
+            self.changed = True
+        return [tuple(item) for item in self.found]
+
+    def manifest(self, name, directory):
+        """The manifest of a plugin, read again if its files changed."""
+        stamp = self._plugin_stamp(directory)
+        entry = self.entries.get(name)
+        if (not stamp is None and not entry is None
+                and entry["directory"] == directory
+                and entry["stamp"] == stamp):
+            return entry["manifest"]
+        self.log.debug("Reading manifest of %s.", name)
+        if directory is None:
+            with resource_stream(name, "plugin.yaml") as openfile:
+                manifest = yaml.safe_load(openfile)
+        else:
+            with open(os.path.join(directory, "plugin.yaml"), "r") as handle:
+                manifest = yaml.safe_load(handle)
+        if not stamp is None:
+            self.entries[name] = {
+                "directory": directory,
+                "stamp": stamp,
+                "manifest": manifest,
+                "functions": None
+            }
+            self.changed = True
+        return manifest
+
+    def functions(self, name):
+        entry = self.entries.get(name)
+        if entry is None or entry["functions"] is None:
+            return None
+        return set(entry["functions"])
+
+    def set_functions(self, name, functions):
+        entry = self.entries.get(name)
+        if not entry is None:
+            entry["functions"] = sorted(functions)
+            self.changed = True
+
+    def save(self):
+        if not self.path or not self.changed:
+            return
+        data = {
+            "version": self.VERSION,
+            "stamps": self.stamps,
+            "found": self.found,
+            "plugins": self.entries
+        }
+        try:
+            with open(self.path, "w") as handle:
+                json.dump(data, handle)
+            self.changed = False
+        except IOError as e:
+            self.log.warning("Could not save plugin registry: %s", e)
+
+    def _read(self):
+        try:
+            with open(self.path, "r") as handle:
+                data = json.load(handle)
+        except (IOError, ValueError) as e:
+            self.log.debug("Could not read plugin registry: %s", e)
+            return
+        if data.get("version") != self.VERSION:
+            return
+        self.stamps = data.get("stamps", {})
+        self.found = data.get("found", [])
+        self.entries = data.get("plugins", {})
+
+    @staticmethod
+    def _search_stamps():
+        # installing or removing a package changes its parent directory
+        stamps = {}
+        for path in sys.path:
+            path = os.path.abspath(path or os.curdir)
+            try:
+                stamps[path] = os.stat(path).st_mtime
+            except OSError:
+                pass
+        return stamps
+
+    @staticmethod
+    def _plugin_stamp(directory):
+        if directory is None:
+            return None
+        stamp = []
+        for name in ("plugin.yaml", "plugin.py", "__init__.py"):
+            try:
+                stamp.append(os.stat(os.path.join(directory, name)).st_mtime)
+            except OSError:
+                stamp.append(None)
+        return stamp
+
+
 ###############################################################################
 # HAROS Plugin
 ###############################################################################
 
 class Plugin(LoggingObject):
     PREFIX = "haros_plugin_"
-
-    def __init__(self, name):
+    # functions that analyse files, regardless of the project contents
+    FILE_FUNCTIONS = ("file_analysis", "file_batch_analysis")
+    CONFIG_FUNCTIONS = ("configuration_analysis",)
+    FUNCTIONS = FILE_FUNCTIONS + CONFIG_FUNCTIONS + (
+        "pre_analysis", "package_analysis", "post_analysis",
+        "pre_process", "process_file_violation", "process_file_metric",
+        "process_package_violation", "process_package_metric",
+        "process_configuration_violation", "process_configuration_metric",
+        "post_process"
+    )
+
+    def __init__(self, name, directory = None):
         self.name       = name
+        self.directory  = directory
         self.version    = "0.1"
+        self.languages  = set()
         self.rules      = None
         self.metrics    = None
         self.analysis   = None
         self.process    = None
         self.export     = None
         self.tmp_path   = None
-
-    def load(self, common_rules = None, common_metrics = None):
+        self.parallel   = None  # "files" if file analyses are independent
+        self.cache      = None  # "files" if file analyses can be cached
+        self.functions  = None  # defined by the module, if known
+
+    def load(self, common_rules = None, common_metrics = None,
+             registry = None):
+        """Read the plugin manifest. The plugin module is imported only
+            if there is no registry; otherwise, see load_module().
+        """
         self.log.debug("Plugin.load")
-        with resource_stream(self.name, "plugin.yaml") as openfile:
-            manifest = yaml.safe_load(openfile)
+        if registry is None:
+            with resource_stream(self.name, "plugin.yaml") as openfile:
+                manifest = yaml.safe_load(openfile)
+        else:
+            manifest = registry.manifest(self.name, self.directory)
+            self.functions = registry.functions(self.name)
         if (not "version" in manifest
                 or not "name" in manifest
                 or manifest["name"] != self.name):
@@ -195,6 +367,16 @@ class Plugin(LoggingObject):
         self.version = str(manifest["version"])
         self.rules = manifest.get("rules", {})
         self.metrics = manifest.get("metrics", {})
+        self.parallel = manifest.get("parallel")
+        if not self.parallel in (None, "files"):
+            self.log.warning("Plugin %s: unknown parallel mode '%s'",
+                             self.name, self.parallel)
+            self.parallel = None
+        self.cache = manifest.get("cache")
+        if not self.cache in (None, "files"):
+            self.log.warning("Plugin %s: unknown cache mode '%s'",
+                             self.name, self.cache)
+            self.cache = None
         self.log.debug("Loaded %s [%s]", self.name, self.version)
         if common_rules:
             rm = [id for id in self.rules if id in common_rules]
@@ -206,17 +388,76 @@ class Plugin(LoggingObject):
             for id in rm:
                 self.log.warning("Plugin %s cannot override %s", self.name, id)
                 del self.metrics[id]
+        self.languages = set(manifest.get("languages", []))
+        if registry is None:
+            self.load_module()
+
+    def load_module(self, registry = None):
+        if not self.analysis is None:
+            return
         self.log.info("Loading plugin script.")
         module = importlib.import_module(self.name + ".plugin",
                                          package = self.name)
-        languages = manifest.get("languages", [])
-        self.analysis = AnalysisInterface(module, languages)
+        self.analysis = AnalysisInterface(module, self.languages)
         self.process = ProcessingInterface(module)
         self.export = ExportInterface()
+        self.functions = set(f for f in self.FUNCTIONS if hasattr(module, f))
+        if not registry is None:
+            registry.set_functions(self.name, self.functions)
+
+    def is_applicable(self, languages, configurations = True):
+        """Whether the plugin has anything to do for a project with
+            source files in the given languages (and configurations).
+            This is always the case if the plugin module was never
+            imported, or if it analyses packages or processes reports.
+        """
+        if self.functions is None:
+            return True
+        other = (self.functions.difference(self.FILE_FUNCTIONS)
+                               .difference(self.CONFIG_FUNCTIONS)
+                               .difference(("pre_analysis", "pre_process")))
+        if other:
+            return True
+        if configurations and self.functions.intersection(
+                self.CONFIG_FUNCTIONS):
+            return True
+        return bool(self.functions.intersection(self.FILE_FUNCTIONS)
+                    and self.languages.intersection(languages))
+
+    @classmethod
+    def load_modules(cls, plugins, languages, configurations = True,
+                     registry = None):
+        """Import the modules of the plugins that are applicable to
+            a project (see is_applicable). Returns those plugins.
+        """
+        loaded = []
+        for plugin in plugins:
+            if not plugin.is_applicable(languages, configurations):
+                cls.log.info("Skipping %s; nothing to analyse.", plugin.name)
+                continue
+            try:
+                plugin.load_module(registry = registry)
+            except ImportError as e:
+                cls.log.error("Failed to import %s; %s", plugin.name, e)
+            else:
+                if plugin.is_applicable(languages, configurations):
+                    loaded.append(plugin)
+                else:
+                    cls.log.info("Skipping %s; nothing to analyse.",
+                                 plugin.name)
+        if not registry is None:
+            registry.save()
+        return loaded
 
     @classmethod
     def load_plugins(cls, whitelist = None, blacklist = None,
-                     common_rules = None, common_metrics = None):
+                     common_rules = None, common_metrics = None,
+                     registry = None):
+        """Find the installed plugins and read their manifests.
+            With a registry (PluginRegistry), plugins are found and
+            read from its cache, when possible, and their modules are
+            not imported until load_modules() is called.
+        """
         cls.log.debug("load_plugins(%s, %s)", whitelist, blacklist)
         plugins = []
         pfilter = set()
@@ -238,18 +479,23 @@ class Plugin(LoggingObject):
                     pfilter.add(cls.PREFIX + name)
             mode = -1
             str_mode = "blacklisted"
-        for finder, name, ispkg in pkgutil.iter_modules():
-            if not name.startswith(cls.PREFIX):
-                continue
+        if registry is None:
+            found = ((name, None) for finder, name, ispkg
+                     in pkgutil.iter_modules()
+                     if name.startswith(cls.PREFIX))
+        else:
+            found = registry.plugins()
+        for name, directory in found:
             if mode > 0 and not name in pfilter:
                 continue
             if mode < 0 and name in pfilter:
                 continue
             pfilter.discard(name)
-            plugin = cls(name)
+            plugin = cls(name, directory = directory)
             try:
                 plugin.load(common_rules = common_rules,
-                            common_metrics = common_metrics)
+                            common_metrics = common_metrics,
+                            registry = registry)
             except MalformedManifestError as e:
                 cls.log.warning(e.value)
             except ImportError as e:
@@ -258,4 +504,6 @@ class Plugin(LoggingObject):
                 plugins.append(plugin)
         for name in pfilter:
             cls.log.warning("Could not find %s plugin: %s", str_mode, name)
+        if not registry is None:
+            registry.save()
         return plugins
@@ -27,8 +27,10 @@
 from __future__ import unicode_literals
 from builtins import str, bytes
 
+import re
 import sys
 
+from pkg_resources import get_distribution, DistributionNotFound
 from pyflwor.parser import Parser
 from pyflwor.lexer import Lexer
 from ply import lex, yacc
@@ -39,34 +41,72 @@ from ply import lex, yacc
 ###############################################################################
 
 class MonkeyPatchLexer(Lexer):
-    def __new__(cls, pyflwor_dir, **kwargs):
+    def __new__(cls, pyflwor_dir, lextab="lextab", **kwargs):
         self = super(Lexer, cls).__new__(cls, **kwargs)
-        self.lexer = lex.lex(object=self, debug=False, optimize=True,
-                             outputdir=pyflwor_dir, **kwargs)
+        # tables are only read and written in optimized mode; without
+        # a directory for them, PLY would write next to this module
+        self.lexer = lex.lex(object=self, debug=False,
+                             optimize=pyflwor_dir is not None,
+                             lextab=lextab, outputdir=pyflwor_dir, **kwargs)
         return self.lexer
 
 
 class MonkeyPatchParser(Parser):
-    def __new__(cls, pyflwor_dir, **kwargs):
+    def __new__(cls, pyflwor_dir, tabmodule="parsetab", **kwargs):
         self = super(Parser, cls).__new__(cls, **kwargs)
         self.names = dict()
         self.yacc = yacc.yacc(module=self, debug=False,
-                              optimize=True, write_tables=False,
+                              optimize=True, tabmodule=tabmodule,
+                              write_tables=pyflwor_dir is not None,
                               outputdir=pyflwor_dir, **kwargs)
         return self.yacc
 
 
+###############################################################################
+# Query Compiler
+###############################################################################
+
+class QueryCompiler(object):
+    """Compiles each query only once, with a single lexer and parser.
+        Compiled queries are functions of the query namespace.
+        The lexer and parser tables are written to `pyflwor_dir` (if any),
+        named after the pyflwor version, so that they are reused between
+        runs.
+    """
+
+    def __init__(self, pyflwor_dir):
+        version = re.sub(r"\W", "_", pyflwor_version())
+        self.lexer = MonkeyPatchLexer(pyflwor_dir, lextab="lextab_" + version)
+        self.parser = MonkeyPatchParser(pyflwor_dir,
+                                        tabmodule="parsetab_" + version)
+        self._cache = {}
+
+    def compile(self, query):
+        qfunction = self._cache.get(query)
+        if qfunction is None:
+            qbytes = bytes(query, "utf-8").decode("unicode_escape")
+            qfunction = self.parser.parse(qbytes, lexer=self.lexer)
+            self._cache[query] = qfunction
+        return qfunction
+
+    def __call__(self, query, namespace):
+        return self.compile(query)(namespace)
+
+
+def pyflwor_version():
+    for name in ("pyflwor-ext", "pyflwor"):
+        try:
+            return str(get_distribution(name).version)
+        except DistributionNotFound:
+            pass
+    return "0"
+
+
 ###############################################################################
 # Entry Point
 ###############################################################################
 
 def make_parser(pyflwor_dir):
-    if pyflwor_dir not in sys.path:
+    if not pyflwor_dir is None and pyflwor_dir not in sys.path:
         sys.path.insert(0, pyflwor_dir)
-    def execute(query, namespace):
-        lexer = MonkeyPatchLexer(pyflwor_dir)
-        parser = MonkeyPatchParser(pyflwor_dir)
-        qbytes = bytes(query, "utf-8").decode("unicode_escape")
-        qfunction = parser.parse(qbytes, lexer=lexer)
-        return qfunction(namespace)
-    return execute
+    return QueryCompiler(pyflwor_dir)
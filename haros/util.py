@@ -23,8 +23,13 @@
 # Imports
 ###############################################################################
 
+from collections import deque
 import logging
+import multiprocessing
 import os
+import select
+import time
+import traceback
 
 
 ###############################################################################
@@ -88,3 +93,137 @@ class Event(list):
 
     def __repr__(self):
         return "Event({})".format(list.__repr__(self))
+
+
+###############################################################################
+# Worker Processes
+###############################################################################
+
+# Workers are forked from the current process, so they start with a
+# (copy-on-write) snapshot of its memory, and their targets need not be
+# picklable. They send their results back to the parent through a pipe.
+
+class WorkerError(Exception):
+    def __init__(self, value):
+        self.value = value
+    def __str__(self):
+        return repr(self.value)
+
+
+class WorkerProcess(object):
+    """A forked process that runs `target(conn)`, where `conn` is its end
+        of a pipe to the parent (which can also send to it, if `duplex`).
+        `task` and `deadline` (a time.time() value) are for the parent.
+    """
+    def __init__(self, target, daemon = True, duplex = False, task = None,
+                 deadline = None):
+        self.conn, child = multiprocessing.Pipe(duplex = duplex)
+        self.process = multiprocessing.Process(target = target,
+                                               args = (child,))
+        self.process.daemon = daemon # daemons cannot start processes
+        self.process.start()
+        child.close()
+        self.task = task
+        self.deadline = deadline
+
+    def fileno(self):
+        return self.conn.fileno()
+
+    def send(self, message):
+        self.conn.send(message)
+
+    def receive(self):
+        return self.conn.recv()
+
+    def stop(self):
+        if self.process.is_alive():
+            self.process.terminate()
+        self.process.join()
+        self.conn.close()
+
+
+def run_workers(pending, start, receive, jobs, expire = None):
+    """Runs worker processes until there are no pending tasks and no
+        running workers, with up to `jobs` running at once.
+        `pending` is a deque of tasks, and `start(task)` returns a new
+        (or resumed) WorkerProcess for a task.
+        `receive(worker, message)` is called with each message a worker
+        sends, and with EOFError when the worker closes its pipe. It returns
+        True when the worker is done; it is then up to `receive` to stop it
+        (or to keep it for later).
+        Workers whose deadline has passed are stopped and passed to
+        `expire(worker)`. Callbacks may add more tasks to `pending`.
+    """
+    running = {} # file descriptor -> worker
+    try:
+        while pending or running:
+            while pending and len(running) < jobs:
+                worker = start(pending.popleft())
+                running[worker.fileno()] = worker
+            deadlines = [w.deadline for w in running.itervalues()
+                         if not w.deadline is None]
+            timeout = None
+            if deadlines:
+                timeout = max(0.0, min(deadlines) - time.time())
+            for fd in select.select(list(running), [], [], timeout)[0]:
+                worker = running[fd]
+                try:
+                    message = worker.receive()
+                except EOFError:
+                    message = EOFError
+                if receive(worker, message):
+                    del running[fd]
+            now = time.time()
+            for fd, worker in running.items():
+                if not worker.deadline is None and worker.deadline <= now:
+                    del running[fd]
+                    worker.stop()
+                    if not expire is None:
+                        expire(worker)
+    finally:
+        for worker in running.itervalues():
+            worker.stop()
+
+
+def map_workers(function, n, jobs):
+    """Returns [function(i) for i in xrange(n)], computed by up to `jobs`
+        worker processes, which take the next `i` as they finish.
+        Results must be picklable. Errors raised by `function` are raised
+        again in the parent, as WorkerError.
+    """
+    results = [None] * n
+    tasks = deque(xrange(n))
+
+    def target(conn):
+        i = conn.recv()
+        while not i is None:
+            try:
+                conn.send((i, None, function(i)))
+            except Exception as e:
+                conn.send((i, "{}: {}\n{}".format(type(e).__name__, e,
+                          traceback.format_exc()), None))
+            i = conn.recv()
+        conn.close()
+
+    def start(slot):
+        worker = WorkerProcess(target, duplex = True)
+        worker.task = tasks.popleft()
+        worker.send(worker.task)
+        return worker
+
+    def receive(worker, message):
+        if message is EOFError:
+            worker.stop()
+            if not worker.task is None:
+                raise WorkerError("worker exited unexpectedly")
+            return True
+        i, error, value = message
+        if not error is None:
+            raise WorkerError(error)
+        results[i] = value
+        worker.task = tasks.popleft() if tasks else None
+        worker.send(worker.task)
+        return False
+
+    run_workers(deque(xrange(min(jobs, n))), start, receive, jobs)
+    return results
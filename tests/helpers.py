@@ -0,0 +1,113 @@
+
+#Copyright (c) 2017 Andre Santos
+#
+#Permission is hereby granted, free of charge, to any person obtaining a copy
+#of this software and associated documentation files (the "Software"), to deal
+#in the Software without restriction, including without limitation the rights
+#to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#copies of the Software, and to permit persons to whom the Software is
+#furnished to do so, subject to the following conditions:
+
+#The above copyright notice and this permission notice shall be included in
+#all copies or substantial portions of the Software.
+
+#THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+#THE SOFTWARE.
+
+###############################################################################
+# Imports
+###############################################################################
+
+import os
+import shutil
+import tempfile
+import types
+
+from haros.config_builder import ConfigurationBuilder
+from haros.data import HarosDatabase
+from haros.launch_parser import LaunchParser
+from haros.plugin_manager import (
+    AnalysisInterface, ExportInterface, Plugin, ProcessingInterface
+)
+from haros.metamodel import (
+    Node, Package, Project, Publication, RosName, SourceFile, Subscription
+)
+
+
+###############################################################################
+# Test Fixtures
+###############################################################################
+
+class LaunchWorkspace(object):
+    """A package (`fake_pkg`) with the nodes `talker` and `listener`
+        and the given launch files (name -> XML), in a temporary directory.
+        The talker publishes `chatter` and subscribes `reply`,
+        the listener subscribes `chatter`.
+    """
+    NODES = (("talker", ["chatter"], ["reply"]),
+             ("listener", [], ["chatter"]))
+
+    def __init__(self, launch_files):
+        self.root = tempfile.mkdtemp(prefix = "haros_test_")
+        self.package = Package("fake_pkg")
+        self.package.path = os.path.join(self.root, "fake_pkg")
+        os.makedirs(os.path.join(self.package.path, "launch"))
+        self.project = Project("default")
+        self.project.packages.append(self.package)
+        self.package.project = self.project
+        for name, xml in launch_files.iteritems():
+            path = os.path.join(self.package.path, "launch", name)
+            with open(path, "w") as f:
+                f.write(xml)
+            sf = SourceFile(name, "launch", self.package)
+            self.package.source_files.append(sf)
+        for name, advertise, subscribe in self.NODES:
+            node = Node(name, self.package, rosname = RosName(name))
+            for topic in advertise:
+                node.advertise.append(
+                    Publication(topic, "", "std_msgs/String", 10))
+            for topic in subscribe:
+                node.subscribe.append(
+                    Subscription(topic, "", "std_msgs/String", 10))
+            self.package.nodes.append(node)
+        self.database = HarosDatabase()
+        self.database.register_project(self.project)
+        parser = LaunchParser(pkgs = self.database.packages)
+        for sf in self.package.source_files:
+            sf.tree = parser.parse(sf.path)
+
+    def launch_file(self, name):
+        return self.database.get_file(
+            os.path.join(self.package.path, "launch", name))
+
+    def build(self, launch, name = "test"):
+        builder = ConfigurationBuilder(name, {}, self.database)
+        builder.add_launch(self.launch_file(launch))
+        return builder
+
+    def close(self):
+        shutil.rmtree(self.root, ignore_errors = True)
+
+
+def make_plugin(name, tmp_path, languages = ("cpp",), **functions):
+    """A plugin whose module defines the given functions
+        (e.g., `file_analysis`), without a manifest.
+    """
+    module = types.ModuleType(name)
+    for key, function in functions.iteritems():
+        setattr(module, key, function)
+    plugin = Plugin(name)
+    plugin.languages = set(languages)
+    plugin.rules = {}
+    plugin.metrics = {}
+    plugin.analysis = AnalysisInterface(module, plugin.languages)
+    plugin.process = ProcessingInterface(module)
+    plugin.export = ExportInterface()
+    plugin.functions = set(functions)
+    plugin.tmp_path = tmp_path
+    return plugin
@@ -0,0 +1,985 @@
+
+#Copyright (c) 2017 Andre Santos
+#
+#Permission is hereby granted, free of charge, to any person obtaining a copy
+#of this software and associated documentation files (the "Software"), to deal
+#in the Software without restriction, including without limitation the rights
+#to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#copies of the Software, and to permit persons to whom the Software is
+#furnished to do so, subject to the following conditions:
+
+#The above copyright notice and this permission notice shall be included in
+#all copies or substantial portions of the Software.
+
+#THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+#THE SOFTWARE.
+
+###############################################################################
+# Imports
+###############################################################################
+
+from collections import Counter, namedtuple
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from haros.analysis_manager import (
+    AnalysisManager, PluginInterface, PluginTimeoutError, QueryCache,
+    QueryEngine, _PluginWatchdog
+)
+from haros.data import (
+    AnalysisReport, ConfigurationAnalysis, FileAnalysis, PackageAnalysis,
+    PluginProfile
+)
+from haros.metamodel import (
+    IgnoredLines, Publication, ServiceClientCall, ServiceServerCall,
+    SourceFile
+)
+from haros.pyflwor_monkey_patch import make_parser
+
+from .helpers import LaunchWorkspace, make_plugin
+
+
+###############################################################################
+# Query Result Cache
+###############################################################################
+
+Rule = namedtuple("Rule", ["id", "query"])
+
+LAUNCH = """<launch>
+  <node pkg="fake_pkg" type="talker" name="talker"/>
+</launch>
+"""
+
+REMAPPED = """<launch>
+  <node pkg="fake_pkg" type="talker" name="talker">
+    <remap from="chatter" to="other"/>
+  </node>
+</launch>
+"""
+
+
+class QueryCacheTest(unittest.TestCase):
+    def _workspace(self, launch):
+        ws = LaunchWorkspace({"main.launch": launch})
+        self.addCleanup(ws.close)
+        return ws
+
+    def test_fingerprint_of_same_model(self):
+        a = self._workspace(LAUNCH)
+        b = self._workspace(LAUNCH)
+        self.assertEqual(QueryCache.fingerprint(a.package),
+                         QueryCache.fingerprint(b.package))
+        a.build("main.launch")
+        b.build("main.launch")
+        self.assertEqual(QueryCache.fingerprint(a.package),
+                         QueryCache.fingerprint(b.package))
+
+    def test_fingerprint_covers_node_instances(self):
+        ws = self._workspace(LAUNCH)
+        before = QueryCache.fingerprint(ws.package)
+        ws.build("main.launch")
+        self.assertNotEqual(QueryCache.fingerprint(ws.package), before)
+
+    def test_fingerprint_covers_configurations(self):
+        a = self._workspace(LAUNCH)
+        b = self._workspace(REMAPPED)
+        a.build("main.launch")
+        b.build("main.launch")
+        self.assertNotEqual(QueryCache.fingerprint(a.package),
+                            QueryCache.fingerprint(b.package))
+
+    def test_cached_matches_are_reused(self):
+        ws = self._workspace(LAUNCH)
+        path = os.path.join(ws.root, "query_cache.json")
+        rule = Rule("test", "nodes[self.name == 'talker']")
+        talker = ws.package.nodes[0]
+        cache = QueryCache(path)
+        self.assertIsNone(cache.get(rule, ws.package))
+        cache.put(rule, ws.package, [talker, (talker, 1)])
+        cache.save()
+        cache = QueryCache(path)
+        self.assertEqual(cache.get(rule, ws.package), [talker, (talker, 1)])
+        self.assertEqual(cache.hits, 1)
+        ws.build("main.launch")
+        self.assertIsNone(QueryCache(path).get(rule, ws.package))
+
+
+###############################################################################
+# Plugin Interface
+###############################################################################
+
+ToolFile = namedtuple("ToolFile", ["path"])
+
+# prints "path:1: ok" for each file argument
+ECHO_TOOL = ["sh", "-c", 'for f; do echo "$f:1: ok"; done', "sh"]
+
+
+def _is_running(pid):
+    try:
+        os.kill(pid, 0)
+    except OSError:
+        return False
+    return True
+
+
+class RunToolTest(unittest.TestCase):
+    def setUp(self):
+        self.iface = PluginInterface(None, {}, set(), set(), None)
+
+    def test_output_by_file(self):
+        files = [ToolFile("/tmp/haros_test_{}.cpp".format(i))
+                 for i in xrange(40)]
+        result = self.iface.run_tool(ECHO_TOOL, files, jobs = 8,
+                                     max_files = 1)
+        self.assertEqual(len(result), 40)
+        for sf in files:
+            self.assertEqual(result[sf], [sf.path + ":1: ok"])
+
+    def test_no_files(self):
+        self.assertEqual(self.iface.run_tool(ECHO_TOOL, []), {})
+
+    def test_timeout_kills_tools(self):
+        # each tool process writes its pid and sleeps
+        tmp = tempfile.mkdtemp(prefix = "haros_test_")
+        self.addCleanup(shutil.rmtree, tmp, True)
+        pids = os.path.join(tmp, "pids")
+        tool = ["sh", "-c", 'echo $$ >> "$0"; exec sleep 30', pids]
+        files = [ToolFile("/tmp/haros_test_{}.cpp".format(i))
+                 for i in xrange(4)]
+        start = time.time()
+        with self.assertRaises(PluginTimeoutError):
+            with _PluginWatchdog(0.5):
+                self.iface.run_tool(tool, files, jobs = 4, max_files = 1)
+        self.assertLess(time.time() - start, 5.0)
+        with open(pids) as f:
+            pids = [int(pid) for pid in f.read().split()]
+        self.assertTrue(pids)
+        deadline = time.time() + 5.0
+        while pids and time.time() < deadline:
+            pids = [pid for pid in pids if _is_running(pid)]
+            time.sleep(0.05)
+        self.assertEqual(pids, [])
+
+
+def _findings(pkg):
+    # (rule, message, scope, line, function, class) and
+    # (metric, value, scope, line, function, class) to report
+    violations = [
+        ("found", "file"),
+        ("found", "line 1", None, 1),
+        ("found", "ignored line", None, 2),
+        ("other", "ignored for this rule", None, 3),
+        ("found", "not ignored for this rule", None, 3),
+        ("other", "in package", pkg, 5, "f", "C")
+    ]
+    metrics = [
+        ("size", 1),
+        ("size", 2, None, 2),
+        ("size", 3, None, 3),
+        ("lines", 4, None, 3),
+        ("size", 5, pkg, 5, "f")
+    ]
+    return violations, metrics
+
+
+def _reporting_plugin(tmp, bulk):
+    def report(iface, violations, metrics):
+        if bulk:
+            iface.report_violations(violations)
+            iface.report_metrics(metrics)
+        else:
+            for item in violations:
+                iface.report_violation(*item)
+            for item in metrics:
+                iface.report_metric(*item)
+    def file_analysis(iface, scope):
+        report(iface, *_findings(scope.package))
+    def post_process(iface):
+        pkg = iface.find_package("fake_pkg")
+        report(iface, [("found", "processing", pkg)], [("lines", 9, pkg)])
+    return make_plugin("haros_plugin_bulk", tmp, ("launch",),
+                       file_analysis = file_analysis,
+                       post_process = post_process)
+
+
+class BulkReportTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp(prefix = "haros_test_")
+        self.addCleanup(shutil.rmtree, self.tmp, True)
+        self.ws = LaunchWorkspace({"a.launch": LAUNCH, "b.launch": LAUNCH})
+        self.addCleanup(self.ws.close)
+        rule = {"name": "Rule", "description": "", "tags": []}
+        self.ws.database.register_rules({
+            "found": dict(rule, scope = "file"),
+            "other": dict(rule, scope = "package")
+        }, prefix = "haros_plugin_bulk:")
+        metric = {"name": "Metric", "description": "", "scope": "file"}
+        self.ws.database.register_metrics({"size": metric, "lines": metric},
+                                          prefix = "haros_plugin_bulk:")
+        ignored = IgnoredLines()
+        ignored.add(2)
+        ignored.add(3, ["other", "haros_plugin_bulk:lines"])
+        self.ignored = {self.ws.launch_file("a.launch").id: ignored}
+
+    def _run(self, bulk, **kwargs):
+        out_dir = tempfile.mkdtemp(dir = self.tmp)
+        manager = AnalysisManager(self.ws.database, out_dir, out_dir,
+                                  **kwargs)
+        manager.run([_reporting_plugin(out_dir, bulk)],
+                    ignored_lines = self.ignored)
+        report = manager.report.by_package[self.ws.package.id]
+        results = []
+        for r in [report] + report.file_analysis:
+            results.append((
+                [(v.rule.id, v.details, self._location(v.location),
+                  [obj.id for obj in v.affected]) for v in r.violations],
+                [(m.metric.id, m.value, self._location(m.location))
+                 for m in r.metrics]))
+        return results
+
+    @staticmethod
+    def _location(location):
+        return (location.package.id,
+                location.file.id if location.file else None,
+                location.line, location.function, location.class_)
+
+    def test_bulk_reports_match_single_reports(self):
+        expected = self._run(False)
+        a = self.ws.launch_file("a.launch").id
+        b = self.ws.launch_file("b.launch").id
+        counts = dict((r[0][0][2][1], (len(r[0]), len(r[1])))
+                      for r in expected[1:])
+        self.assertEqual(counts, {a: (3, 2), b: (5, 4)})
+        self.assertEqual(len(expected[0][0]), 3)
+        self.assertEqual(len(expected[0][1]), 3)
+        self.assertEqual(self._run(True), expected)
+        for kwargs in ({"jobs": 3}, {"isolate_plugins": True}):
+            self.assertEqual(self._run(False, **kwargs), expected)
+            self.assertEqual(self._run(True, **kwargs), expected)
+
+
+###############################################################################
+# Plugin Time Limits
+###############################################################################
+
+def _busy_catching_exceptions(seconds):
+    # a plugin that keeps going after any Exception
+    deadline = time.time() + seconds
+    while time.time() < deadline:
+        try:
+            time.sleep(0.01)
+        except Exception:
+            pass
+
+
+class PluginTimeoutTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp(prefix = "haros_test_")
+        self.manager = AnalysisManager(None, self.tmp, self.tmp)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp, ignore_errors = True)
+
+    def test_watchdog_is_not_caught_as_exception(self):
+        start = time.time()
+        with self.assertRaises(PluginTimeoutError):
+            with _PluginWatchdog(0.2):
+                _busy_catching_exceptions(5.0)
+        self.assertLess(time.time() - start, 2.0)
+
+    def test_plugin_catching_exceptions_is_stopped(self):
+        iface = PluginInterface(None, {}, set(), set(), None)
+        post_analysis = lambda iface: _busy_catching_exceptions(5.0)
+        plugin = make_plugin("haros_plugin_test", self.tmp,
+                             post_analysis = post_analysis)
+        profile = PluginProfile(plugin.name, time_limit = 0.2)
+        self.manager._profiles[plugin.name] = profile
+        start = time.time()
+        self.manager._analyse_plugin(iface, plugin)
+        self.assertLess(time.time() - start, 2.0)
+        self.assertEqual(profile.timed_out, "post_analysis")
+
+
+###############################################################################
+# Query Tables
+###############################################################################
+
+TABLES = """<launch>
+  <param name="a" value="1"/>
+  <param name="b" value="x"/>
+  <node pkg="fake_pkg" type="talker" name="talker"/>
+  <node pkg="fake_pkg" type="listener" name="listener"/>
+</launch>
+"""
+
+def _query_workspace():
+    # a workspace with a configuration, with links and parameters
+    # of different types, and a node with a (launch) source file
+    ws = LaunchWorkspace({"main.launch": TABLES})
+    talker, listener = ws.package.nodes
+    talker.source_files.append(ws.launch_file("main.launch"))
+    talker.client.append(ServiceClientCall("reset", "", "std_srvs/Empty"))
+    listener.advertise.append(Publication("count", "", "std_msgs/Int32", 1))
+    listener.service.append(ServiceServerCall("reset", "", "std_srvs/Empty"))
+    config = ws.build("main.launch").configuration
+    ws.project.configurations.append(config)
+    ws.database.configurations.append(config)
+    return ws, config
+
+
+class QueryTableTest(unittest.TestCase):
+    # (table lookup, equivalent query over the model)
+    GLOBAL = (
+        ('files_by_package["fake_pkg"]',
+         'files[self.package.name == "fake_pkg"]'),
+        ('files_by_language["launch"]', 'files[self.language == "launch"]'),
+        ('nodes_by_language["launch"]', 'nodes[self.language == "launch"]'),
+        ('publishers_by_type["std_msgs/String"]',
+         'configs/nodes/publishers[self.type == "std_msgs/String"]'),
+        ('publishers_by_type["std_msgs/Int32"]',
+         'configs/nodes/publishers[self.type == "std_msgs/Int32"]'),
+        ('subscribers_by_type["std_msgs/String"]',
+         'configs/nodes/subscribers[self.type == "std_msgs/String"]'),
+        ('servers_by_type["std_srvs/Empty"]',
+         'configs/nodes/servers[self.type == "std_srvs/Empty"]'),
+        ('clients_by_type["std_srvs/Empty"]',
+         'configs/nodes/clients[self.type == "std_srvs/Empty"]'),
+        ('parameters_by_type["int"]',
+         'configs/parameters[self.type == "int"]'),
+        ('parameters_by_type["string"]',
+         'configs/parameters[self.type == "string"]')
+    )
+    PACKAGE = (
+        ('files_by_language["launch"]', 'files[self.language == "launch"]'),
+        ('nodes_by_language["launch"]', 'nodes[self.language == "launch"]')
+    )
+    CONFIGURATION = (
+        ('publishers_by_type["std_msgs/String"]',
+         'nodes/publishers[self.type == "std_msgs/String"]'),
+        ('subscribers_by_type["std_msgs/String"]',
+         'nodes/subscribers[self.type == "std_msgs/String"]'),
+        ('servers_by_type["std_srvs/Empty"]',
+         'nodes/servers[self.type == "std_srvs/Empty"]'),
+        ('clients_by_type["std_srvs/Empty"]',
+         'nodes/clients[self.type == "std_srvs/Empty"]'),
+        ('parameters_by_type["int"]', 'parameters[self.type == "int"]')
+    )
+
+    def setUp(self):
+        self.ws, self.config = _query_workspace()
+        self.addCleanup(self.ws.close)
+        self.pyflwor = make_parser(None)
+        self.engine = QueryEngine(self.ws.database, self.pyflwor)
+
+    def _matches(self, query, data):
+        return set(id(obj) for obj in self.pyflwor(query, data))
+
+    def _check(self, cases, data):
+        for table, query in cases:
+            expected = self._matches(query, data)
+            self.assertTrue(expected, query)
+            # tables are looked up in FLWR expressions; in path expressions,
+            # pyflwor takes the subscript as a predicate over the table items
+            rows = self._matches("for x in {} return x".format(table), data)
+            self.assertEqual(rows, expected, table)
+
+    def _scope_data(self, make_data, scope):
+        data = dict(QueryEngine.query_data)
+        make_data(data, scope)
+        return data
+
+    def test_global_tables(self):
+        self._check(self.GLOBAL, self.engine.data)
+
+    def test_package_tables(self):
+        data = self._scope_data(self.engine._pkg_data, self.ws.package)
+        self._check(self.PACKAGE, data)
+
+    def test_configuration_tables(self):
+        data = self._scope_data(self.engine._config_data, self.config)
+        self._check(self.CONFIGURATION, data)
+
+    def test_unknown_keys(self):
+        data = self.engine.data
+        for table in ("files_by_language", "publishers_by_type"):
+            query = 'for x in {}["unknown"] return x'.format(table)
+            self.assertEqual(self._matches(query, data), set())
+
+
+###############################################################################
+# File Dispatch
+###############################################################################
+
+class FileDispatchTest(unittest.TestCase):
+    # file name -> language, in project order (after the launch files)
+    FILES = (("a.cpp", "cpp"), ("b.py", "py"), ("c.h", "cpp"),
+             ("d.txt", "unknown"), ("e.py", "py"))
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp(prefix = "haros_test_")
+        self.addCleanup(shutil.rmtree, self.tmp, True)
+        self.ws = LaunchWorkspace({"a.launch": LAUNCH})
+        self.addCleanup(self.ws.close)
+        os.mkdir(os.path.join(self.ws.package.path, "src"))
+        for name, language in self.FILES:
+            path = os.path.join(self.ws.package.path, "src", name)
+            open(path, "w").close()
+            sf = SourceFile(name, "src", self.ws.package)
+            sf.language = language
+            self.ws.package.source_files.append(sf)
+
+    def _run(self, languages):
+        # file analyses of each plugin (and batches of its _batch twin)
+        calls = {}
+        def record(name):
+            def file_analysis(iface, scope):
+                calls.setdefault(name, []).append(scope.name)
+            def file_batch_analysis(iface, scopes):
+                calls.setdefault(name + "_batch", []).append(
+                    [scope.name for scope in scopes])
+            return file_analysis, file_batch_analysis
+        plugins = []
+        for name, langs in languages:
+            file_analysis, batch_analysis = record(name)
+            plugins.append(make_plugin(name, self.tmp, langs,
+                                       file_analysis = file_analysis))
+            plugins.append(make_plugin(name + "_batch", self.tmp, langs,
+                file_batch_analysis = batch_analysis))
+        plugins.append(make_plugin("package_only", self.tmp, ("cpp",),
+            package_analysis = lambda iface, scope: None))
+        manager = AnalysisManager(self.ws.database, self.tmp, self.tmp)
+        manager.run(plugins, ignored_lines = {})
+        self.assertEqual(manager._plugin_files(plugins[-1]), [])
+        return calls
+
+    def test_plugins_get_files_in_their_languages(self):
+        calls = self._run([("cpp", ("cpp",)), ("py", ("launch", "py")),
+                           ("none", ()), ("other", ("java",))])
+        self.assertEqual(calls, {
+            "cpp": ["a.cpp", "c.h"],
+            "cpp_batch": [["a.cpp", "c.h"]],
+            "py": ["a.launch", "b.py", "e.py"],
+            "py_batch": [["a.launch"], ["b.py", "e.py"]]
+        })
+
+    def test_files_of_unknown_language_go_to_no_plugin(self):
+        languages = [("all", ("cpp", "py", "launch", "java"))]
+        calls = self._run(languages)
+        self.assertEqual(calls["all"],
+                         ["a.launch", "a.cpp", "b.py", "c.h", "e.py"])
+        self.assertEqual(calls["all_batch"],
+                         [["a.launch"], ["a.cpp", "c.h"], ["b.py", "e.py"]])
+
+    def test_packages_not_analysed(self):
+        self.ws.package._analyse = False
+        self.assertEqual(self._run([("cpp", ("cpp",))]), {})
+
+
+###############################################################################
+# Plugin Result Cache
+###############################################################################
+
+class PluginCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp(prefix = "haros_test_")
+        self.addCleanup(shutil.rmtree, self.tmp, True)
+        # a.launch and b.launch have the same contents
+        self.ws = LaunchWorkspace({"a.launch": LAUNCH, "b.launch": LAUNCH,
+                                   "c.launch": REMAPPED})
+        self.addCleanup(self.ws.close)
+        self.ws.database.register_rules({"found": {"name": "Found",
+            "description": "", "tags": [], "scope": "file"}},
+            prefix = "haros_plugin_cached:")
+        self.ws.database.register_metrics({"size": {"name": "Size",
+            "description": "", "scope": "file"}},
+            prefix = "haros_plugin_cached:")
+        self.cache = os.path.join(self.tmp, "plugin_cache.json")
+        self.calls = os.path.join(self.tmp, "calls")
+        self.version = "0.1"
+
+    def _run(self, ignored_lines = None, **kwargs):
+        calls = self.calls
+        def file_analysis(iface, scope):
+            # calls are counted in a file, as they may run in workers
+            with open(calls, "a") as f:
+                f.write(scope.id + "\n")
+            iface.report_violation("found", scope.name, line = 2)
+            iface.report_metric("size", len(scope.name))
+        out_dir = tempfile.mkdtemp(dir = self.tmp)
+        plugin = make_plugin("haros_plugin_cached", out_dir, ("launch",),
+                             file_analysis = file_analysis)
+        plugin.cache = "files"
+        plugin.parallel = "files"
+        plugin.version = self.version
+        manager = AnalysisManager(self.ws.database, out_dir, out_dir,
+                                  plugin_cache = self.cache, **kwargs)
+        manager.run([plugin], ignored_lines = ignored_lines or {})
+        report = manager.report.by_package[self.ws.package.id]
+        return dict((r.source_file.id,
+                     ([(v.rule.id, v.details, v.location.file.id,
+                        v.location.line) for v in r.violations],
+                      [(m.metric.id, m.value, m.location.file.id)
+                       for m in r.metrics]))
+                    for r in report.file_analysis)
+
+    def _calls(self):
+        try:
+            with open(self.calls) as f:
+                calls = f.read().split()
+        except IOError:
+            calls = []
+        if os.path.exists(self.calls):
+            os.remove(self.calls)
+        return sorted(calls)
+
+    def _files(self):
+        return sorted(sf.id for sf in self.ws.package.source_files)
+
+    def test_second_run_reuses_results(self):
+        first = self._run()
+        self.assertEqual(self._calls(), self._files())
+        self.assertEqual(self._run(), first)
+        self.assertEqual(self._calls(), [])
+
+    def test_files_with_same_contents(self):
+        first = self._run()
+        self._calls()
+        second = self._run()
+        for sf in self.ws.package.source_files:
+            violations, metrics = second[sf.id]
+            self.assertEqual([v[2] for v in violations], [sf.id])
+            self.assertEqual([m[2] for m in metrics], [sf.id])
+        self.assertEqual(second, first)
+
+    def test_hits_of_workers_are_merged(self):
+        first = self._run()
+        self._calls()
+        self.assertEqual(self._run(jobs = 2), first)
+        self.assertEqual(self._calls(), [])
+        # entries used by the workers are saved for the next run
+        self.assertEqual(self._run(), first)
+        self.assertEqual(self._calls(), [])
+
+    def test_changed_contents_are_analysed(self):
+        self._run()
+        self._calls()
+        sf = self.ws.launch_file("c.launch")
+        with open(sf.path, "a") as f:
+            f.write("\n")
+        self._run()
+        self.assertEqual(self._calls(), [sf.id])
+
+    def test_new_version_is_analysed(self):
+        self._run()
+        self._calls()
+        self.version = "0.2"
+        self._run()
+        self.assertEqual(self._calls(), self._files())
+
+    def test_changed_ignored_lines_are_analysed(self):
+        self._run()
+        self._calls()
+        sf = self.ws.launch_file("a.launch")
+        ignored = IgnoredLines()
+        ignored.add(2)
+        results = self._run(ignored_lines = {sf.id: ignored})
+        self.assertEqual(self._calls(), [sf.id])
+        self.assertEqual(results[sf.id], ([], [(u"haros_plugin_cached:size",
+                                                len(sf.name), sf.id)]))
+
+
+###############################################################################
+# Query Execution
+###############################################################################
+
+def _rule(scope, query = None, python = None):
+    return {"name": "Rule", "description": "", "tags": [], "scope": scope,
+            "query": query, "python": python}
+
+
+def _pid_rule(data):
+    return [os.getpid()]
+
+
+def _sleep_rule(data):
+    time.sleep(0.2)
+    return ()
+
+
+def _talker_rule(data):
+    return (node for node in data["nodes"] if node.name == "talker")
+
+
+def _publisher_rule(data):
+    return [link for node in data["nodes"] for link in node.publishers]
+
+
+class QueryExecutionTest(unittest.TestCase):
+    RULES = {
+        "pkg_nodes": _rule("package", query = "nodes"),
+        "pkg_files": _rule("package",
+                           query = 'files[self.language == "launch"]'),
+        "config_publishers": _rule("configuration",
+                                   query = "nodes/publishers"),
+        "config_topics": _rule("configuration", query = "topics"),
+        "subscribers": _rule("global", query = "configs/nodes/subscribers"),
+        "packages": _rule("global", query = "packages")
+    }
+
+    def setUp(self):
+        self.ws, self.config = _query_workspace()
+        self.addCleanup(self.ws.close)
+        self.pyflwor = make_parser(None)
+
+    def _execute(self, rules, **kwargs):
+        # returns the engine and (scope, rule, details, affected objects)
+        # of each violation, in a fixed order
+        database = self.ws.database
+        database.register_rules(rules, prefix = "test:")
+        engine = QueryEngine(database, self.pyflwor, **kwargs)
+        reports = {None: AnalysisReport(self.ws.project)}
+        reports[self.ws.package.id] = PackageAnalysis(self.ws.package)
+        for sf in self.ws.package.source_files:
+            reports[sf.id] = FileAnalysis(sf)
+        reports[self.config.id] = ConfigurationAnalysis(self.config)
+        engine.execute([database.rules["test:" + key]
+                        for key in sorted(rules)], reports)
+        violations = sorted((scope, v.rule.id, v.details,
+                             tuple(id(obj) for obj in v.affected))
+                            for scope, report in reports.iteritems()
+                            for v in report.violations)
+        return engine, violations
+
+    def test_parallel_execution_matches_sequential(self):
+        engine, expected = self._execute(self.RULES)
+        self.assertEqual(set(v[1][5:] for v in expected), set(self.RULES))
+        for jobs in (2, 3):
+            engine, violations = self._execute(self.RULES, jobs = jobs)
+            self.assertEqual(violations, expected)
+
+    def test_parallel_execution_uses_workers(self):
+        rules = {"pkg": _rule("package", python = __name__ + ":_pid_rule"),
+                 "config": _rule("configuration",
+                                 python = __name__ + ":_pid_rule")}
+        engine, violations = self._execute(rules)
+        parent = "Query found: {}".format(os.getpid())
+        self.assertEqual([v[2] for v in violations], [parent, parent])
+        engine, violations = self._execute(rules, jobs = 2)
+        self.assertEqual(len(violations), 2)
+        self.assertNotIn(parent, [v[2] for v in violations])
+
+    def _scanned(self, scope):
+        # objects in the collections of the data of a rule scope
+        if scope == "package":
+            pkg = self.ws.package
+            return pkg.id, len(pkg.source_files) + len(pkg.nodes)
+        if scope == "configuration":
+            config = self.config
+            return config.id, (len(config.nodes) + len(config.topics)
+                               + len(config.services) + len(config.parameters))
+        db = self.ws.database
+        return None, (len(db.files) + len(db.packages) + len(db.nodes)
+                      + len(db.configurations))
+
+    def test_query_profiles(self):
+        for jobs in (1, 2):
+            engine, violations = self._execute(self.RULES, jobs = jobs)
+            matches = Counter(v[1] for v in violations)
+            self.assertEqual(set(engine.profiles),
+                             set("test:" + key for key in self.RULES))
+            for rule_id, profile in engine.profiles.iteritems():
+                scope, objects = self._scanned(profile.rule.scope)
+                self.assertEqual([(s[0], s[2], s[3]) for s in profile.scopes],
+                                 [(scope, matches[rule_id], objects)])
+                self.assertEqual(profile.match_count, matches[rule_id])
+                self.assertEqual(profile.object_count, objects)
+                self.assertEqual(profile.cached, 0)
+                self.assertEqual(profile.overruns, [])
+                self.assertGreaterEqual(profile.compile_time, 0.0)
+                self.assertGreaterEqual(profile.scopes[0][1], 0.0)
+                self.assertEqual(profile.eval_time, profile.scopes[0][1])
+                self.assertEqual(profile.total_time,
+                                 profile.compile_time + profile.eval_time)
+                data = profile.to_JSON_object()
+                self.assertEqual(data["rule"], rule_id)
+                self.assertEqual(data["evalTime"], profile.eval_time)
+                self.assertEqual(data["matches"], matches[rule_id])
+                self.assertEqual(data["objects"], objects)
+                self.assertEqual(data["scopes"], [{"scope": scope,
+                    "time": profile.eval_time,
+                    "matches": matches[rule_id], "objects": objects}])
+
+    def test_slowest_queries_first(self):
+        tmp = tempfile.mkdtemp(prefix = "haros_test_")
+        self.addCleanup(shutil.rmtree, tmp, True)
+        rules = dict(self.RULES)
+        rules["slow"] = _rule("package", python = __name__ + ":_sleep_rule")
+        self.ws.database.register_rules(rules, prefix = "test:")
+        manager = AnalysisManager(self.ws.database, tmp, tmp)
+        manager.run([], ignored_lines = {})
+        profiles = manager.report.queries
+        self.assertEqual(len(profiles), len(rules))
+        self.assertEqual(profiles[0].rule.id, "test:slow")
+        self.assertGreaterEqual(profiles[0].eval_time, 0.2)
+        times = [p.total_time for p in profiles]
+        self.assertEqual(times, sorted(times, reverse = True))
+
+    def test_batched_rules_match_separate_rules(self):
+        rules = {
+            "talker": _rule("package", query = 'nodes[self.name == "talker"]'),
+            "listener": _rule("package",
+                              query = 'nodes[self.name == "listener"]'),
+            "string": _rule("configuration", query =
+                'nodes/publishers[self.type == "std_msgs/String"]'),
+            "int": _rule("configuration", query =
+                'nodes / publishers[self.type == "std_msgs/Int32"]'),
+            "empty": _rule("configuration", query =
+                'nodes/publishers[self.type == "std_msgs/Empty"]'),
+            "topics": _rule("configuration", query = "topics")
+        }
+        expected = []
+        for key, rule in rules.iteritems():
+            engine, violations = self._execute({key: rule})
+            self.assertEqual(engine._paths, {})
+            expected.extend(violations)
+        expected.sort()
+        self.assertEqual(len(expected), 7)
+        for jobs in (1, 2):
+            engine, violations = self._execute(rules, jobs = jobs)
+            self.assertEqual(engine._paths, {
+                "test:talker": "nodes", "test:listener": "nodes",
+                "test:string": "nodes/publishers",
+                "test:int": "nodes/publishers",
+                "test:empty": "nodes/publishers"})
+            self.assertEqual(violations, expected)
+
+    def test_python_rules_match_queries(self):
+        module = __name__ + ":"
+        cases = (
+            ("package", 'nodes[self.name == "talker"]',
+             module + "_talker_rule",
+             '[n for n in nodes if n.name == "talker"]'),
+            ("configuration", "nodes/publishers", module + "_publisher_rule",
+             "[l for n in nodes for l in n.publishers]"),
+            ("global", "packages", None, "packages")
+        )
+        for scope, query, function, expression in cases:
+            rules = {"query": _rule(scope, query = query),
+                     "expression": _rule(scope, python = expression)}
+            if not function is None:
+                rules["function"] = _rule(scope, python = function)
+            for jobs in (1, 2):
+                engine, violations = self._execute(rules, jobs = jobs)
+                found = {}
+                for scope_id, rule_id, details, affected in violations:
+                    found.setdefault(rule_id, []).append(
+                        (scope_id, details, affected))
+                self.assertTrue(found["test:query"])
+                self.assertEqual(len(found), len(rules))
+                for matches in found.itervalues():
+                    self.assertEqual(matches, found["test:query"])
+
+    def test_python_rule_errors(self):
+        rules = {
+            "module": _rule("package", python = "haros_no_such_module:rule"),
+            "function": _rule("package", python = __name__ + ":_no_rule"),
+            "syntax": _rule("package", python = "nodes["),
+            "raises": _rule("package", python = "1 / 0"),
+            "none": _rule("package", python = "None"),
+            "nodes": _rule("package", python = "nodes")
+        }
+        for jobs in (1, 2):
+            engine, violations = self._execute(rules, jobs = jobs)
+            # rules that cannot be loaded are skipped
+            self.assertEqual(set(engine.profiles),
+                             set(["test:raises", "test:none", "test:nodes"]))
+            self.assertEqual(engine.profiles["test:raises"].match_count, 0)
+            self.assertEqual(engine.profiles["test:none"].match_count, 0)
+            self.assertEqual([v[1] for v in violations],
+                             ["test:nodes", "test:nodes"])
+
+
+###############################################################################
+# Query Budgets
+###############################################################################
+
+def _slow_rule(data):
+    time.sleep(30)
+    return ()
+
+
+class QueryBudgetTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp(prefix = "haros_test_")
+        self.addCleanup(shutil.rmtree, self.tmp, True)
+        self.ws = LaunchWorkspace({"main.launch": LAUNCH})
+        self.addCleanup(self.ws.close)
+        rule = lambda python: {"name": "Rule", "description": "",
+            "tags": [], "scope": "package", "python": python}
+        self.ws.database.register_rules({
+            "slow": rule(__name__ + ":_slow_rule"),
+            "nodes": rule("nodes"),
+            "none": rule("()")
+        }, prefix = "test:")
+
+    def _run(self, **kwargs):
+        manager = AnalysisManager(self.ws.database, self.tmp, self.tmp,
+                                  **kwargs)
+        start = time.time()
+        manager.run([], ignored_lines = {})
+        self.elapsed = time.time() - start
+        report = manager.report.by_package[self.ws.package.id]
+        overruns = dict((p.rule.id, p.overruns)
+                        for p in manager.report.queries)
+        return [v.rule.id for v in report.violations], overruns
+
+    def test_slow_query_is_stopped(self):
+        violations, overruns = self._run(query_timeout = 0.5)
+        self.assertLess(self.elapsed, 10.0)
+        self.assertEqual(violations, ["test:nodes", "test:nodes"])
+        self.assertEqual(overruns["test:slow"],
+                         [(self.ws.package.id, "time")])
+        self.assertEqual(overruns["test:nodes"], [])
+
+    def test_matches_over_limit_are_dropped(self):
+        self.ws.database.rules.pop("test:slow")
+        violations, overruns = self._run(query_limit = 1, jobs = 2)
+        self.assertEqual(violations, ["test:nodes"])
+        self.assertEqual(overruns["test:nodes"],
+                         [(self.ws.package.id, "matches")])
+        self.assertEqual(overruns["test:none"], [])
+
+
+###############################################################################
+# Plugin Workers
+###############################################################################
+
+def _state_plugins(tmp):
+    # `counter` keeps module state from analysis to processing,
+    # and sees the violations that `reporter` found during analysis
+    state = {"files": 0, "seen": 0}
+    def file_analysis(iface, scope):
+        state["files"] += 1
+    def process_file_violation(iface, datum):
+        state["seen"] += 1
+    def post_process(iface):
+        pkg = iface.find_package("fake_pkg")
+        iface.report_metric("files", state["files"], scope = pkg)
+        iface.report_metric("seen", state["seen"], scope = pkg)
+    counter = make_plugin("haros_plugin_counter", tmp, ("launch",),
+                          file_analysis = file_analysis,
+                          process_file_violation = process_file_violation,
+                          post_process = post_process)
+    report = lambda iface, scope: iface.report_violation("found", "")
+    reporter = make_plugin("haros_plugin_reporter", tmp, ("launch",),
+                           file_analysis = report)
+    return [reporter, counter]
+
+
+class PluginWorkerTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp(prefix = "haros_test_")
+        self.addCleanup(shutil.rmtree, self.tmp, True)
+        self.ws = LaunchWorkspace({"a.launch": LAUNCH, "b.launch": LAUNCH})
+        self.addCleanup(self.ws.close)
+        database = self.ws.database
+        database.register_rules({"found": {"name": "Found",
+            "description": "", "tags": [], "scope": "file"}},
+            prefix = "haros_plugin_reporter:")
+        database.register_metrics({
+            "files": {"name": "Files", "description": "", "scope": "package"},
+            "seen": {"name": "Seen", "description": "", "scope": "package"}
+        }, prefix = "haros_plugin_counter:")
+
+    def _run(self, **kwargs):
+        out_dir = tempfile.mkdtemp(dir = self.tmp)
+        manager = AnalysisManager(self.ws.database, out_dir, out_dir,
+                                  **kwargs)
+        manager.run(_state_plugins(out_dir), ignored_lines = {})
+        report = manager.report.by_package[self.ws.package.id]
+        return dict((m.metric.id.split(":")[1], m.value)
+                    for m in report.metrics)
+
+    def test_processing_keeps_analysis_state(self):
+        expected = {"files": 2, "seen": 2}
+        self.assertEqual(self._run(), expected)
+        self.assertEqual(self._run(jobs = 2), expected)
+        self.assertEqual(self._run(isolate_plugins = True), expected)
+
+
+class PluginFileWorkerTest(unittest.TestCase):
+    FILES = 10
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp(prefix = "haros_test_")
+        self.addCleanup(shutil.rmtree, self.tmp, True)
+        self.ws = LaunchWorkspace(dict(("f{}.launch".format(i), LAUNCH)
+                                       for i in xrange(self.FILES)))
+        self.addCleanup(self.ws.close)
+        self.ws.database.register_rules({"found": {"name": "Found",
+            "description": "", "tags": [], "scope": "file"}},
+            prefix = "haros_plugin_files:")
+        self.ws.database.register_metrics({"size": {"name": "Size",
+            "description": "", "scope": "file"}},
+            prefix = "haros_plugin_files:")
+        self.pids = os.path.join(self.tmp, "pids")
+
+    def _run(self, fail = None, **kwargs):
+        pids = self.pids
+        def file_analysis(iface, scope):
+            with open(pids, "a") as f:
+                f.write("{}\n".format(os.getpid()))
+            iface.report_violation("found", scope.name, line = 1)
+            if scope.name == fail:
+                raise ValueError(scope.name)
+            iface.report_violation("found", scope.name, line = 2)
+            iface.report_metric("size", len(scope.name))
+        out_dir = tempfile.mkdtemp(dir = self.tmp)
+        plugin = make_plugin("haros_plugin_files", out_dir, ("launch",),
+                             file_analysis = file_analysis)
+        plugin.parallel = "files"
+        manager = AnalysisManager(self.ws.database, out_dir, out_dir,
+                                  **kwargs)
+        manager.run([plugin], ignored_lines = {})
+        report = manager.report.by_package[self.ws.package.id]
+        return [(r.source_file.id,
+                 [(v.rule.id, v.details, v.location.line)
+                  for v in r.violations],
+                 [(m.metric.id, m.value) for m in r.metrics])
+                for r in report.file_analysis]
+
+    def _workers(self):
+        with open(self.pids) as f:
+            pids = set(int(pid) for pid in f.read().split())
+        os.remove(self.pids)
+        pids.discard(os.getpid())
+        return len(pids)
+
+    def test_split_files_match_sequential(self):
+        expected = self._run()
+        self.assertEqual(self._workers(), 0)
+        self.assertEqual(sum(len(r[1]) for r in expected), 2 * self.FILES)
+        self.assertEqual(self._run(jobs = 3), expected)
+        self.assertGreater(self._workers(), 1)
+        self.assertEqual(self._run(jobs = 3, isolate_plugins = True),
+                         expected)
+
+    def test_failed_file_stops_the_plugin(self):
+        fail = self.ws.package.source_files[self.FILES // 2].name
+        expected = self._run(fail = fail)
+        found = [len(r[1]) for r in expected]
+        half = self.FILES // 2
+        self.assertEqual(found, [2] * half + [1] + [0] * (half - 1))
+        self.assertEqual(self._run(fail = fail, jobs = 3), expected)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,438 @@
+
+#Copyright (c) 2017 Andre Santos
+#
+#Permission is hereby granted, free of charge, to any person obtaining a copy
+#of this software and associated documentation files (the "Software"), to deal
+#in the Software without restriction, including without limitation the rights
+#to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#copies of the Software, and to permit persons to whom the Software is
+#furnished to do so, subject to the following conditions:
+
+#The above copyright notice and this permission notice shall be included in
+#all copies or substantial portions of the Software.
+
+#THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+#THE SOFTWARE.
+
+###############################################################################
+# Imports
+###############################################################################
+
+import unittest
+
+from haros.config_builder import (
+    ConfigurationBuilder, ConfigurationError, build_configurations
+)
+from haros.metamodel import (
+    Location, Node, Publication, RosName, ServiceClientCall,
+    ServiceServerCall, SourceCondition, Subscription
+)
+
+from .helpers import LaunchWorkspace
+
+
+###############################################################################
+# Include Memoization
+###############################################################################
+
+SENSOR = """<launch>
+  <arg name="robot" default="r0"/>
+  <group ns="$(arg robot)">
+    <node pkg="fake_pkg" type="talker" name="talker"/>
+    <remap from="a" to="b" if="$(optenv HAROS_TEST_UNSET)"/>
+  </group>
+</launch>
+"""
+
+INCLUDES = """<launch>
+  <include file="$(find fake_pkg)/launch/sensor.launch">
+    <arg name="robot" value="a"/>
+  </include>
+  <include file="$(find fake_pkg)/launch/sensor.launch">
+    <arg name="robot" value="b"/>
+  </include>
+  <include file="$(find fake_pkg)/launch/sensor.launch">
+    <arg name="robot" value="a"/>
+  </include>
+  <include file="$(find fake_pkg)/launch/sensor.launch" ns="x">
+    <arg name="robot" value="a"/>
+  </include>
+</launch>
+"""
+
+
+class IncludeMemoizationTest(unittest.TestCase):
+    def setUp(self):
+        self.ws = LaunchWorkspace({"sensor.launch": SENSOR,
+                                   "main.launch": INCLUDES})
+
+    def tearDown(self):
+        self.ws.close()
+
+    def test_replayed_includes_create_their_nodes(self):
+        builder = self.ws.build("main.launch")
+        names = sorted(n.rosname.full for n in builder.configuration.nodes)
+        self.assertEqual(names, ["/a/talker", "/a/talker", "/b/talker",
+                                 "/x/a/talker"])
+
+    def test_replayed_includes_keep_their_errors(self):
+        builder = self.ws.build("main.launch")
+        errors = [e for e in builder.errors
+                  if e == "cannot resolve conditional remap"]
+        self.assertEqual(len(errors), 4)
+
+
+###############################################################################
+# Private Parameter Forwarding
+###############################################################################
+
+PRIVATE_PARAMS = """<launch>
+  <param name="~early" value="1"/>
+  <group ns="g">
+    <node pkg="fake_pkg" type="talker" name="a"/>
+  </group>
+  <param name="~x" value="2"/>
+  <param name="~late" value="3"/>
+  <node pkg="fake_pkg" type="listener" name="b">
+    <param name="~x" value="4"/>
+  </node>
+</launch>
+"""
+
+
+DELETE_PARAM = """<launch>
+  <rosparam command="delete" param="/b/late"/>
+</launch>
+"""
+
+
+class PrivateParamForwardingTest(unittest.TestCase):
+    def setUp(self):
+        self.ws = LaunchWorkspace({"main.launch": PRIVATE_PARAMS,
+                                   "delete.launch": DELETE_PARAM})
+
+    def tearDown(self):
+        self.ws.close()
+
+    def _params(self):
+        builder = self.ws.build("main.launch")
+        return dict((p.rosname.full, p.value)
+                    for p in builder.configuration.parameters)
+
+    def test_private_param_after_group(self):
+        params = self._params()
+        self.assertNotIn("/g/a/x", params)
+        self.assertNotIn("/g/a/late", params)
+        self.assertEqual(params["/b/late"], 3)
+
+    def test_private_param_before_group(self):
+        params = self._params()
+        self.assertEqual(params["/g/a/early"], 1)
+        self.assertEqual(params["/b/early"], 1)
+
+    def test_node_params_override_forwarded_params(self):
+        params = self._params()
+        self.assertEqual(params["/b/x"], 4)
+
+    def test_forwarded_params_keep_their_place(self):
+        builder = self.ws.build("main.launch")
+        self.assertEqual([p.rosname.full
+                          for p in builder.configuration.parameters],
+                         ["/g/a/early", "/b/early", "/b/late", "/b/x"])
+
+    def test_forwarded_params_are_created_when_needed(self):
+        params = self.ws.build("main.launch").configuration.parameters
+        self.assertEqual(params.get("/b/late").value, 3)
+        self.assertEqual(len(params._deferred), 1)
+        self.assertEqual([p.rosname.full for p in params._all],
+                         ["/b/early", "/b/late", "/b/x"])
+        self.assertIn("/g/a/early", params)
+        self.assertEqual(len(params._deferred), 0)
+
+    def test_deleted_forwarded_param(self):
+        builder = self.ws.build("main.launch")
+        builder.add_launch(self.ws.launch_file("delete.launch"))
+        self.assertEqual(builder.errors, [])
+        self.assertEqual([p.rosname.full
+                          for p in builder.configuration.parameters],
+                         ["/g/a/early", "/b/early", "/b/x"])
+
+
+###############################################################################
+# Parallel Configuration Building
+###############################################################################
+
+class ParallelBuildTest(unittest.TestCase):
+    def setUp(self):
+        self.ws = LaunchWorkspace({"sensor.launch": SENSOR,
+                                   "main.launch": INCLUDES,
+                                   "params.launch": PRIVATE_PARAMS})
+        self.tasks = [("sensor", "sensor.launch"), ("main", "main.launch"),
+                      ("params", "params.launch")]
+
+    def tearDown(self):
+        self.ws.close()
+
+    def _build(self, jobs):
+        build = lambda name, launch: self.ws.build(launch, name = name)
+        return build_configurations(self.ws.database, build, self.tasks,
+                                    jobs = jobs)
+
+    @staticmethod
+    def _summary(config, errors):
+        return (config.name,
+                sorted(n.rosname.full for n in config.nodes),
+                sorted(t.rosname.full for t in config.topics),
+                sorted((p.rosname.full, p.value) for p in config.parameters),
+                len(errors))
+
+    def test_same_configurations_as_sequential_build(self):
+        expected = [self._summary(c, e) for c, e in self._build(1)]
+        results = self._build(2)
+        self.assertEqual([self._summary(c, e) for c, e in results], expected)
+
+    def test_configurations_share_the_extracted_nodes(self):
+        nodes = dict((n.node_name, n) for n in self.ws.package.nodes)
+        for config, errors in self._build(2):
+            for instance in config.nodes:
+                self.assertIs(instance.node, nodes[instance.node.node_name])
+                self.assertIs(instance.configuration, config)
+                self.assertTrue(any(i is instance
+                                    for i in instance.node.instances))
+
+    def test_links_share_the_calls_of_their_nodes(self):
+        talker = [n for n in self.ws.package.nodes if n.name == "talker"][0]
+        call = talker.advertise[0]
+        condition = SourceCondition("ok", location = Location(
+            self.ws.package, line = 3))
+        call.conditions.append(condition)
+        call.location = Location(self.ws.package, line = 2)
+        links = 0
+        for config, errors in self._build(2):
+            for instance in config.nodes:
+                for link in instance.publishers:
+                    links += 1
+                    self.assertIs(link.conditions, call.conditions)
+                    self.assertIs(link.source_location, call.location)
+                    self.assertIs(link.topic.configuration, config)
+                    self.assertTrue(any(c is condition
+                                        for c in link.topic.conditions))
+        self.assertTrue(links > 0)
+
+    def test_errors_keep_their_type(self):
+        def build(name, launch):
+            if name == "main":
+                raise ValueError("invalid launch file: " + launch)
+            if name == "params":
+                raise ConfigurationError("cannot find package: x")
+            return self.ws.build(launch, name = name)
+        for jobs in (1, 3):
+            with self.assertRaises(ValueError):
+                build_configurations(self.ws.database, build, self.tasks,
+                                     jobs = jobs)
+        self.tasks.pop(1)
+        for jobs in (1, 3):
+            with self.assertRaises(ConfigurationError) as context:
+                build_configurations(self.ws.database, build, self.tasks,
+                                     jobs = jobs)
+            self.assertEqual(context.exception.value, "cannot find package: x")
+
+
+###############################################################################
+# Resource Conditions
+###############################################################################
+
+# /chatter and /reset end up unconditional (with l3), the rest do not
+CONDITIONAL = """<launch>
+  <arg name="a"/>
+  <arg name="b"/>
+  <node pkg="fake_pkg" type="talker" name="t1" if="$(arg a)"/>
+  <node pkg="fake_pkg" type="talker" name="t2" unless="$(arg b)"/>
+  <node pkg="fake_pkg" type="listener" name="l1" if="$(arg a)"/>
+  <group if="$(arg b)">
+    <node pkg="fake_pkg" type="listener" name="l2"/>
+    <node pkg="fake_pkg" type="talker" name="t3" if="$(arg a)"/>
+  </group>
+  <node pkg="fake_pkg" type="listener" name="l3"/>
+  <node pkg="fake_pkg" type="talker" name="t4" ns="x" if="$(arg b)"/>
+  <node pkg="fake_pkg" type="talker" name="t5" ns="x" if="$(arg a)"/>
+</launch>
+"""
+
+
+def _full_conditions(links):
+    # the conditions of a resource, computed again from all of its links
+    conditions = []
+    for link in links:
+        own = link.node.conditions + link.conditions
+        if not own:
+            return []
+        for condition in own:
+            if not any(c is condition for c in conditions):
+                conditions.append(condition)
+    return conditions
+
+
+class ResourceConditionsTest(unittest.TestCase):
+    def setUp(self):
+        self.ws = LaunchWorkspace({"main.launch": CONDITIONAL})
+        self.addCleanup(self.ws.close)
+        nodes = dict((n.name, n) for n in self.ws.package.nodes)
+        self.talker = nodes["talker"]
+        self.talker.client.append(
+            ServiceClientCall("reset", "", "std_srvs/Empty"))
+        nodes["listener"].service.append(
+            ServiceServerCall("reset", "", "std_srvs/Empty"))
+
+    def _check(self, config):
+        resources = ([(t, t.publishers + t.subscribers)
+                      for t in config.topics]
+                     + [(s, list(s.servers) + s.clients)
+                        for s in config.services])
+        for resource, links in resources:
+            self.assertTrue(links)
+            ids = [id(c) for c in resource.conditions]
+            self.assertEqual(len(ids), len(set(ids)))
+            self.assertEqual(sorted(ids),
+                             sorted(id(c) for c in _full_conditions(links)),
+                             resource.id)
+        return dict((r.id, len(r.conditions)) for r, links in resources)
+
+    def test_node_conditions(self):
+        config = self.ws.build("main.launch").configuration
+        self.assertEqual(self._check(config), {"/chatter": 0, "/reply": 4,
+            "/x/chatter": 2, "/x/reply": 2, "/reset": 0, "/x/reset": 2})
+
+    def test_node_and_call_conditions(self):
+        call = self.talker.advertise[0]
+        condition = SourceCondition("ok")
+        call.conditions.append(condition)
+        config = self.ws.build("main.launch").configuration
+        # the condition of the call is counted once for both talkers
+        self.assertEqual(self._check(config), {"/chatter": 0, "/reply": 4,
+            "/x/chatter": 3, "/x/reply": 2, "/reset": 0, "/x/reset": 2})
+        # the conditions of the call are shared, not extended
+        self.assertEqual(call.conditions, [condition])
+
+
+###############################################################################
+# Extraction Hints
+###############################################################################
+
+DRIVERS = """<launch>
+  <node pkg="fake_pkg" type="driver" name="driver"/>
+  <node pkg="fake_pkg" type="driver" name="remapped">
+    <remap from="t1" to="r1"/>
+    <remap from="ht1" to="r2"/>
+  </node>
+</launch>
+"""
+
+LINKS = 60
+
+
+class ExtractionHintsTest(unittest.TestCase):
+    # hint kind -> (node attribute, instance attribute, name prefix)
+    KINDS = {"advertise": ("advertise", "publishers", "t"),
+             "subscribe": ("subscribe", "subscribers", "s"),
+             "service": ("service", "servers", "srv"),
+             "client": ("client", "clients", "cl")}
+
+    def setUp(self):
+        self.ws = LaunchWorkspace({"main.launch": DRIVERS})
+        self.addCleanup(self.ws.close)
+        pkg = self.ws.package
+        driver = Node("driver", pkg, rosname = RosName("driver"))
+        # extracted links, half of them without a known type
+        for i in xrange(LINKS):
+            msg_type = "std_msgs/Int32" if i % 2 == 0 else None
+            driver.advertise.append(Publication("t{}".format(i), "",
+                                                msg_type, 10))
+            driver.subscribe.append(Subscription("s{}".format(i), "",
+                                                 msg_type, 10))
+        for i in xrange(LINKS // 4):
+            driver.service.append(ServiceServerCall("srv{}".format(i), "",
+                                                    "std_srvs/Empty"))
+            driver.client.append(ServiceClientCall("cl{}".format(i), "",
+                                                   "std_srvs/Empty"))
+        pkg.nodes.append(driver)
+        self.ws.database.nodes[driver.id] = driver
+        self.driver = driver
+
+    def _hints(self):
+        # hints for every extracted link (one with a different type)
+        # and for as many links that were not extracted
+        hints = {}
+        for kind, (calls, links, prefix) in self.KINDS.iteritems():
+            msg_type = ("std_msgs/Int32" if prefix in ("t", "s")
+                        else "std_srvs/Empty")
+            hinted = hints[kind] = {}
+            for call in getattr(self.driver, calls):
+                hinted[call.name] = msg_type
+            for i in xrange(len(hinted)):
+                hinted["h" + prefix + str(i)] = msg_type
+        hints["advertise"]["t0"] = "std_msgs/Bool"
+        return hints
+
+    def _check(self, instance, hints, refined):
+        for kind, (calls, links, prefix) in self.KINDS.iteritems():
+            extracted_types = dict((call.name, call.type)
+                                   for call in getattr(self.driver, calls))
+            extracted = set(extracted_types)
+            instance_links = getattr(instance, links)
+            names = set(hints.get(kind, {})) | extracted
+            self.assertEqual(len(instance_links),
+                             len(names) + len(refined.get(kind, ())))
+            for name, msg_type in hints.get(kind, {}).iteritems():
+                full = "/" + name
+                target = instance.remaps.get(full, full)
+                # scan all the links, as hints used to
+                found = [link for link in instance_links
+                         if (link.topic if prefix in ("t", "s")
+                             else link.service).rosname.full == target]
+                self.assertEqual(len(found),
+                                 1 + (name in refined.get(kind, ())),
+                                 (kind, name))
+                resource = getattr(found[0], "topic", None) or found[0].service
+                if name in extracted:
+                    self.assertEqual(found[0].rosname.full, full)
+                    expected = extracted_types[name] or msg_type
+                    self.assertEqual(resource.type, expected, (kind, name))
+                else:
+                    self.assertEqual(resource.type, msg_type, (kind, name))
+
+    def test_hints_of_nodes_with_many_links(self):
+        hints = self._hints()
+        instance_hints = {"/remapped": {"advertise": {"extra":
+                                                      "std_msgs/Empty"}}}
+        builder = ConfigurationBuilder("test", {}, self.ws.database,
+            nodes = {"fake_pkg/driver": hints}, hints = instance_hints)
+        builder.add_launch(self.ws.launch_file("main.launch"))
+        config = builder.configuration
+        instances = dict((n.rosname.full, n) for n in config.nodes)
+        self.assertEqual(sorted(instances), ["/driver", "/remapped"])
+        # refining an untyped link does not stop the scan,
+        # so the hint still adds a link of its own
+        untyped = dict((kind, [call.name
+                               for call in getattr(self.driver, kind)
+                               if call.type is None])
+                       for kind in ("advertise", "subscribe"))
+        self._check(instances["/driver"], hints, untyped)
+        merged = dict((kind, dict(value)) for kind, value in hints.items())
+        merged["advertise"]["extra"] = "std_msgs/Empty"
+        # shared topics are typed by now, only the remapped one is not
+        self._check(instances["/remapped"], merged, {"advertise": ["t1"]})
+        self.assertEqual(sorted(builder._merged_hints),
+                         [("fake_pkg/driver", "/driver"),
+                          ("fake_pkg/driver", "/remapped")])
+        self.assertIn("/r1", [t.rosname.full for t in config.topics])
+        self.assertIn("/r2", [t.rosname.full for t in config.topics])
+
+
+if __name__ == "__main__":
+    unittest.main()
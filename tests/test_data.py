@@ -0,0 +1,180 @@
+
+#Copyright (c) 2017 Andre Santos
+#
+#Permission is hereby granted, free of charge, to any person obtaining a copy
+#of this software and associated documentation files (the "Software"), to deal
+#in the Software without restriction, including without limitation the rights
+#to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#copies of the Software, and to permit persons to whom the Software is
+#furnished to do so, subject to the following conditions:
+
+#The above copyright notice and this permission notice shall be included in
+#all copies or substantial portions of the Software.
+
+#THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+#THE SOFTWARE.
+
+###############################################################################
+# Imports
+###############################################################################
+
+import cPickle
+import os
+import shutil
+import tempfile
+import unittest
+
+from haros.data import (
+    FileAnalysis, Measurement, MeasurementIndex, MeasurementList, Metric,
+    PackageAnalysis, PluginProfile, Statistics
+)
+from haros.metamodel import Location, Package, SourceFile
+
+
+###############################################################################
+# Measurement Index
+###############################################################################
+
+SLOC = Metric("sloc", "Lines of Code", "function", "")
+COMMENTS = Metric("comments", "Comments", "file", "")
+
+
+class MeasurementIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.package = Package("fake_pkg")
+        self.package.path = tempfile.mkdtemp(prefix = "haros_test_")
+        os.mkdir(os.path.join(self.package.path, "src"))
+        self.report = PackageAnalysis(self.package)
+        self.files = []
+        for name in ("a.cpp", "b.py"):
+            open(os.path.join(self.package.path, "src", name), "w").close()
+            sf = SourceFile(name, "src", self.package)
+            sf.language = "cpp" if name.endswith(".cpp") else "py"
+            sf.lines = 100
+            self.package.source_files.append(sf)
+            self.files.append(FileAnalysis(sf))
+        self.report.file_analysis.extend(self.files)
+
+    def tearDown(self):
+        shutil.rmtree(self.package.path, ignore_errors = True)
+
+    def _measure(self, i, metric, value, function = None):
+        sf = self.files[i].source_file
+        datum = Measurement(metric, Location(self.package, file = sf,
+                                             fun = function), value)
+        self.files[i].metrics.append(datum)
+        return datum
+
+    def test_sum_and_average(self):
+        for value in (1, 2, 3, 4):
+            self._measure(0, SLOC, value)
+        self._measure(1, SLOC, 10)
+        self.assertEqual(self.report.sum_metric("sloc"), 20)
+        self.assertEqual(self.report.avg_metric("sloc"), 4)
+        self.assertEqual(self.report.sum_metric("comments"), 0)
+
+    def test_integer_sums_stay_integers(self):
+        self._measure(0, SLOC, 1)
+        self._measure(0, SLOC, 2)
+        self._measure(1, SLOC, 3)
+        self.assertIs(type(self.report.sum_metric("sloc")), int)
+        index = self.report.metric_index()
+        sf = self.files[1].source_file
+        self.assertEqual(list(index.values("sloc", sf.id)), [3])
+
+    def test_values_keep_their_types(self):
+        self._measure(0, SLOC, 1)
+        self._measure(0, SLOC, 2.5)
+        self._measure(0, SLOC, 3)
+        values = list(self.report.metric_index().values("sloc"))
+        self.assertEqual([type(v) for v in values], [int, float, int])
+        self.assertEqual(self.report.sum_metric("sloc"), 6.5)
+
+    def test_appended_measurements_are_indexed(self):
+        self._measure(0, SLOC, 1)
+        index = self.report.metric_index()
+        self._measure(1, SLOC, 2)
+        self.assertIs(self.report.metric_index(), index)
+        self.assertEqual(self.report.sum_metric("sloc"), 3)
+
+    def test_replaced_measurements_are_indexed(self):
+        self._measure(0, SLOC, 1)
+        self._measure(0, SLOC, 2)
+        self.assertEqual(self.report.sum_metric("sloc"), 3)
+        metrics = self.files[0].metrics
+        metrics[1] = Measurement(SLOC, metrics[1].location, 20)
+        self.assertEqual(self.report.sum_metric("sloc"), 21)
+        self.files[0].metrics = MeasurementList([metrics[0]])
+        self.assertEqual(self.report.sum_metric("sloc"), 1)
+
+    def test_plain_lists_are_indexed(self):
+        # file reports saved by older versions
+        self.files[0].metrics = []
+        self._measure(0, SLOC, 1)
+        self.assertEqual(self.report.sum_metric("sloc"), 1)
+        self.files[0].metrics[0] = Measurement(SLOC, None, 5)
+        self.assertEqual(self.report.sum_metric("sloc"), 5)
+
+    def test_measurement_list_pickling(self):
+        self._measure(0, SLOC, 1)
+        self.files[0].metrics.pop()
+        metrics = cPickle.loads(cPickle.dumps(self.files[0].metrics,
+                                              cPickle.HIGHEST_PROTOCOL))
+        self.assertIsInstance(metrics, MeasurementList)
+        self.assertEqual(metrics.version, 1)
+
+    def test_function_measurements(self):
+        self._measure(0, SLOC, 10, function = "f")
+        self._measure(0, SLOC, 100)
+        index = self.report.metric_index()
+        self.assertEqual(list(index.values("sloc", functions = True)), [10])
+        self.assertEqual(index.sum("sloc"), 110)
+
+    def test_histogram_and_percentile(self):
+        index = MeasurementIndex()
+        for value in (1, 2, 3, 4, 5):
+            index.add(Measurement(SLOC, None, value), "f")
+        self.assertEqual(index.histogram("sloc", [0, 2, 5]), [1, 4])
+        self.assertEqual(index.histogram("sloc", [2, 4]), [3])
+        self.assertEqual(index.percentile("sloc", 50), 3)
+        self.assertEqual(index.percentile("sloc", 25, "f"), 2)
+        self.assertEqual(index.percentile("sloc", 100), 5)
+        self.assertIsNone(index.percentile("comments", 50))
+
+    def test_statistics_of_python_files(self):
+        self._measure(0, COMMENTS, 5)
+        self._measure(1, COMMENTS, 7)
+        stats = Statistics.from_reports((self.report,))
+        self.assertEqual(stats.comment_lines, 12)
+        self.assertEqual(stats.cpp_lines, 100)
+        self.assertEqual(stats.python_lines, 100)
+
+
+###############################################################################
+# Plugin Profile
+###############################################################################
+
+class PluginProfileTest(unittest.TestCase):
+    def test_process_peak_and_growth(self):
+        profile = PluginProfile("plugin")
+        profile.add("file_analysis", 1.0, 0.5, 0.0, 90000, 100)
+        profile.add("file_analysis", 1.0, 0.5, 0.0, 80000, 20)
+        profile.add("processing", 0.5, 0.25, 0.0, 95000, 5000)
+        self.assertEqual(profile.process_peak_rss, 95000)
+        self.assertEqual(profile.rss_growth, 5120)
+        data = profile.to_JSON_object()
+        self.assertNotIn("peakRss", data)
+        self.assertEqual(data["processPeakRss"], 95000)
+        self.assertEqual(data["rssGrowth"], 5120)
+        phases = dict((p["phase"], p) for p in data["phases"])
+        self.assertEqual(phases["file_analysis"]["processPeakRss"], 90000)
+        self.assertEqual(phases["file_analysis"]["rssGrowth"], 120)
+
+
+if __name__ == "__main__":
+    unittest.main()
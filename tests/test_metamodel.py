@@ -0,0 +1,233 @@
+
+#Copyright (c) 2017 Andre Santos
+#
+#Permission is hereby granted, free of charge, to any person obtaining a copy
+#of this software and associated documentation files (the "Software"), to deal
+#in the Software without restriction, including without limitation the rights
+#to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#copies of the Software, and to permit persons to whom the Software is
+#furnished to do so, subject to the following conditions:
+
+#The above copyright notice and this permission notice shall be included in
+#all copies or substantial portions of the Software.
+
+#THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+#THE SOFTWARE.
+
+###############################################################################
+# Imports
+###############################################################################
+
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+from haros.analysis_manager import LazyGraph
+from haros.metamodel import IgnoredLines, Package, SourceFile
+
+from .helpers import LaunchWorkspace
+
+
+###############################################################################
+# Computation Graph
+###############################################################################
+
+PIPELINE = """<launch>
+  <node pkg="fake_pkg" type="talker" name="talker"/>
+  <node pkg="fake_pkg" type="listener" name="listener"/>
+</launch>
+"""
+
+COLLISION = """<launch>
+  <node pkg="fake_pkg" type="talker" name="talker"/>
+  <node pkg="fake_pkg" type="talker" name="talker"/>
+  <node pkg="fake_pkg" type="listener" name="listener"/>
+</launch>
+"""
+
+CYCLE = """<launch>
+  <node pkg="fake_pkg" type="talker" name="talker"/>
+  <node pkg="fake_pkg" type="listener" name="listener">
+    <remap from="chatter" to="reply"/>
+  </node>
+  <node pkg="fake_pkg" type="talker" name="echo">
+    <remap from="chatter" to="reply"/>
+    <remap from="reply" to="chatter"/>
+  </node>
+</launch>
+"""
+
+
+class ComputationGraphTest(unittest.TestCase):
+    def setUp(self):
+        self.ws = LaunchWorkspace({"pipeline.launch": PIPELINE,
+                                   "collision.launch": COLLISION,
+                                   "cycle.launch": CYCLE})
+
+    def tearDown(self):
+        self.ws.close()
+
+    def _nodes(self, launch):
+        config = self.ws.build(launch).configuration
+        return config, dict((n.rosname.full, n) for n in config.nodes)
+
+    def test_reaches(self):
+        config, nodes = self._nodes("pipeline.launch")
+        talker, listener = nodes["/talker"], nodes["/listener"]
+        self.assertTrue(config.graph.reaches(talker, listener))
+        self.assertFalse(config.graph.reaches(listener, talker))
+        self.assertEqual(config.graph.shortest_path(talker, listener),
+                         [talker, listener])
+
+    def test_node_does_not_reach_itself_without_cycle(self):
+        config, nodes = self._nodes("pipeline.launch")
+        for node in config.nodes:
+            self.assertFalse(config.graph.reaches(node, node))
+        self.assertEqual(config.graph.cycles(), [])
+
+    def test_node_reaches_itself_through_cycle(self):
+        config, nodes = self._nodes("cycle.launch")
+        talker, echo = nodes["/talker"], nodes["/echo"]
+        self.assertTrue(config.graph.reaches(talker, talker))
+        self.assertTrue(config.graph.reaches(echo, echo))
+        self.assertFalse(config.graph.reaches(nodes["/listener"],
+                                              nodes["/listener"]))
+        self.assertEqual(len(config.graph.cycles()), 1)
+
+    def test_colliding_instances_are_distinct(self):
+        config = self.ws.build("collision.launch").configuration
+        talkers = [n for n in config.nodes if n.rosname.full == "/talker"]
+        listener = config.nodes.get("/listener")
+        self.assertEqual(len(talkers), 2)
+        self.assertEqual(talkers[0], talkers[1]) # same name
+        predecessors = config.graph.predecessors(listener)
+        self.assertEqual(len(predecessors), 2)
+        self.assertTrue(predecessors[0] is talkers[0])
+        self.assertTrue(predecessors[1] is talkers[1])
+        self.assertEqual(len(config.graph.components()), 3)
+
+    def test_graph_of_configuration_without_graph_attribute(self):
+        # configurations pickled before the graph was added
+        config, nodes = self._nodes("pipeline.launch")
+        del config._graph
+        self.assertTrue(config.graph.reaches(nodes["/talker"],
+                                             nodes["/listener"]))
+
+    def test_graph_is_not_saved(self):
+        config, nodes = self._nodes("pipeline.launch")
+        config.graph
+        self.ws.database.configurations.append(config)
+        self.ws.database._compact()
+        self.assertIsNone(config._graph)
+
+    def test_query_graph_is_built_on_first_use(self):
+        config, nodes = self._nodes("pipeline.launch")
+        graph = LazyGraph(config)
+        self.assertIsNone(config._graph)
+        self.assertTrue(graph.reaches(nodes["/talker"], nodes["/listener"]))
+        self.assertIsNotNone(config._graph)
+
+
+###############################################################################
+# Ignored Lines
+###############################################################################
+
+ANNOTATED = """import os
+x = 1 # haros:ignore-line
+# haros:ignore-next-line(rule_a, metric_b)
+y = 2
+# haros:ignore-begin
+z = 3
+# haros:ignore-begin(rule_b)
+w = 4
+# haros:ignore-end
+# haros:ignore-end
+v = 5 # haros:ignore-line(plugin:rule_c)
+# haros:ignore-begin(rule_d)
+u = 6
+"""
+
+
+class IgnoredLinesTest(unittest.TestCase):
+    def test_ranges_match_sets_of_lines(self):
+        rng = random.Random(0)
+        for i in xrange(20):
+            ignored = IgnoredLines()
+            expected = set()
+            for j in xrange(rng.randint(1, 20)):
+                first = rng.randint(1, 100)
+                last = first + rng.randint(0, 10)
+                if rng.random() < 0.3:
+                    ignored.add(first)
+                    expected.add(first)
+                else:
+                    ignored.add_range(first, last)
+                    expected.update(xrange(first, last + 1))
+            for line in xrange(0, 120):
+                self.assertEqual(line in ignored, line in expected)
+            self.assertFalse(None in ignored)
+            # ranges are kept disjoint and sorted
+            ranges = zip(ignored.starts, ignored.ends)
+            self.assertEqual(ranges, sorted(ranges))
+            for (a, b), (c, d) in zip(ranges, ranges[1:]):
+                self.assertGreater(c, b + 1)
+
+    def test_adjacent_ranges_are_merged(self):
+        ignored = IgnoredLines()
+        ignored.add_range(5, 10)
+        ignored.add_range(20, 25)
+        ignored.add_range(11, 12)
+        self.assertEqual(zip(ignored.starts, ignored.ends),
+                         [(5, 12), (20, 25)])
+        ignored.add_range(8, 21)
+        self.assertEqual(zip(ignored.starts, ignored.ends), [(5, 25)])
+
+    def test_rules_are_ignored_by_line(self):
+        ignored = IgnoredLines()
+        ignored.add(3, ["rule_a", "plugin:rule_b"])
+        ignored.add_range(10, 20, ["rule_a"])
+        self.assertFalse(3 in ignored)
+        self.assertTrue(ignored)
+        for rule_id in ("rule_a", "plugin:rule_a", "plugin:rule_b"):
+            self.assertTrue(ignored.ignores_rule(rule_id, 3))
+        self.assertFalse(ignored.ignores_rule("rule_b", 3))
+        self.assertFalse(ignored.ignores_rule("other:rule_b", 3))
+        self.assertFalse(ignored.ignores_rule("plugin:rule_c", 3))
+        self.assertFalse(ignored.ignores_rule("rule_a", 4))
+        self.assertTrue(ignored.ignores_rule("plugin:rule_a", 15))
+        self.assertFalse(ignored.ignores_rule("plugin:rule_a", 21))
+        self.assertFalse(IgnoredLines())
+
+    def test_comments_of_a_file(self):
+        tmp = tempfile.mkdtemp(prefix = "haros_test_")
+        self.addCleanup(shutil.rmtree, tmp, True)
+        pkg = Package("fake_pkg")
+        pkg.path = tmp
+        os.mkdir(os.path.join(tmp, "src"))
+        with open(os.path.join(tmp, "src", "a.py"), "w") as f:
+            f.write(ANNOTATED)
+        sf = SourceFile("a.py", "src", pkg)
+        sf.language = "py"
+        ignored = sf.set_file_stats()
+        self.assertEqual(sf.lines, 13)
+        self.assertEqual([line for line in xrange(1, 15) if line in ignored],
+                         [2, 5, 6, 7, 8, 9, 10])
+        rules = [(rule_id, line) for rule_id in ("rule_a", "metric_b",
+                                                 "plugin:rule_b", "rule_c",
+                                                 "plugin:rule_c", "rule_d")
+                 for line in xrange(1, 15)
+                 if ignored.ignores_rule(rule_id, line)]
+        self.assertEqual(rules, [("rule_a", 4), ("metric_b", 4),
+            ("plugin:rule_b", 7), ("plugin:rule_b", 8), ("plugin:rule_b", 9),
+            ("plugin:rule_c", 11), ("rule_d", 12), ("rule_d", 13)])
+
+
+if __name__ == "__main__":
+    unittest.main()
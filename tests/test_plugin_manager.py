@@ -0,0 +1,171 @@
+
+#Copyright (c) 2017 Andre Santos
+#
+#Permission is hereby granted, free of charge, to any person obtaining a copy
+#of this software and associated documentation files (the "Software"), to deal
+#in the Software without restriction, including without limitation the rights
+#to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#copies of the Software, and to permit persons to whom the Software is
+#furnished to do so, subject to the following conditions:
+
+#The above copyright notice and this permission notice shall be included in
+#all copies or substantial portions of the Software.
+
+#THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+#THE SOFTWARE.
+
+###############################################################################
+# Imports
+###############################################################################
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+import unittest
+
+from haros.plugin_manager import Plugin, PluginRegistry
+
+
+###############################################################################
+# Plugin Registry
+###############################################################################
+
+NAME = "haros_plugin_registry_test"
+
+MANIFEST = """name: {}
+version: "{}"
+languages: [cpp]
+rules: {{}}
+metrics: {{}}
+"""
+
+# the module writes to `imports` when it is imported
+MODULE = """with open({!r}, "a") as f:
+    f.write("imported\\n")
+
+def file_analysis(iface, scope):
+    pass
+"""
+
+
+class PluginRegistryTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp(prefix = "haros_test_")
+        self.addCleanup(shutil.rmtree, self.tmp, True)
+        self.plugins = os.path.join(self.tmp, "plugins")
+        self.imports = os.path.join(self.tmp, "imports")
+        self.path = os.path.join(self.tmp, "registry.json")
+        self.clock = int(time.time())
+        self._make_plugin(NAME, "0.1")
+        sys.path.insert(0, self.plugins)
+        self.addCleanup(sys.path.remove, self.plugins)
+        self.addCleanup(self._unload)
+
+    def _make_plugin(self, name, version):
+        directory = os.path.join(self.plugins, name)
+        os.makedirs(directory)
+        open(os.path.join(directory, "__init__.py"), "w").close()
+        with open(os.path.join(directory, "plugin.py"), "w") as f:
+            f.write(MODULE.format(self.imports))
+        self._write(name, version)
+        # make sure that the search path looks changed
+        self._touch(self.plugins)
+
+    def _write(self, name, version, stamp = None):
+        path = os.path.join(self.plugins, name, "plugin.yaml")
+        with open(path, "w") as f:
+            f.write(MANIFEST.format(name, version))
+        self._touch(path, stamp)
+
+    def _touch(self, path, stamp = None):
+        # a later time (whole seconds, which are set exactly) on each call
+        if stamp is None:
+            self.clock += 10
+            stamp = self.clock
+        os.utime(path, (stamp, stamp))
+
+    def _unload(self):
+        for name in list(sys.modules):
+            if name.startswith(NAME):
+                del sys.modules[name]
+
+    def _imports(self):
+        try:
+            with open(self.imports) as f:
+                count = len(f.read().split())
+        except IOError:
+            return 0
+        os.remove(self.imports)
+        return count
+
+    def _load(self, names = (NAME,)):
+        registry = PluginRegistry(self.path)
+        plugins = Plugin.load_plugins(whitelist = names, registry = registry)
+        return registry, plugins
+
+    def test_modules_are_imported_when_applicable(self):
+        registry, plugins = self._load()
+        plugin, = plugins
+        self.assertEqual(plugin.directory, os.path.join(self.plugins, NAME))
+        self.assertIsNone(plugin.analysis)
+        self.assertIsNone(plugin.functions)
+        self.assertEqual(self._imports(), 0)
+        # functions are unknown until the module is imported once
+        loaded = Plugin.load_modules(plugins, set(["py"]), registry = registry)
+        self.assertEqual(loaded, [])
+        self.assertEqual(self._imports(), 1)
+        self.assertEqual(plugin.functions, set(["file_analysis"]))
+        self._unload()
+        registry, plugins = self._load()
+        plugin, = plugins
+        self.assertEqual(plugin.functions, set(["file_analysis"]))
+        self.assertEqual(Plugin.load_modules(plugins, set(["py"]),
+                                             registry = registry), [])
+        self.assertEqual(self._imports(), 0)
+        self.assertEqual(Plugin.load_modules(plugins, set(["cpp"]),
+                                             registry = registry), plugins)
+        self.assertEqual(self._imports(), 1)
+        self.assertIsNotNone(plugin.analysis)
+
+    def test_changed_manifest_is_read_again(self):
+        registry, plugins = self._load()
+        Plugin.load_modules(plugins, set(["cpp"]), registry = registry)
+        stamp = os.stat(os.path.join(self.plugins, NAME,
+                                     "plugin.yaml")).st_mtime
+        # same stamp: the cached manifest is used
+        self._write(NAME, "0.2", stamp = stamp)
+        registry, plugins = self._load()
+        self.assertEqual(plugins[0].version, "0.1")
+        self.assertEqual(plugins[0].functions, set(["file_analysis"]))
+        self._write(NAME, "0.3")
+        registry, plugins = self._load()
+        self.assertEqual(plugins[0].version, "0.3")
+        # the module may have changed too
+        self.assertIsNone(plugins[0].functions)
+
+    def test_new_plugins_are_found(self):
+        other = NAME + "_other"
+        registry, plugins = self._load((NAME, other))
+        self.assertEqual([p.name for p in plugins], [NAME])
+        self.assertFalse(registry.changed)
+        registry, plugins = self._load((NAME, other))
+        self.assertEqual([p.name for p in plugins], [NAME])
+        self._make_plugin(other, "0.1")
+        registry, plugins = self._load((NAME, other))
+        self.assertEqual(sorted(p.name for p in plugins), [NAME, other])
+        shutil.rmtree(os.path.join(self.plugins, other))
+        self._touch(self.plugins)
+        registry, plugins = self._load((NAME, other))
+        self.assertEqual([p.name for p in plugins], [NAME])
+        self.assertNotIn(other, registry.entries)
+
+
+if __name__ == "__main__":
+    unittest.main()
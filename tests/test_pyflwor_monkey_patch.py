@@ -0,0 +1,74 @@
+
+#Copyright (c) 2017 Andre Santos
+#
+#Permission is hereby granted, free of charge, to any person obtaining a copy
+#of this software and associated documentation files (the "Software"), to deal
+#in the Software without restriction, including without limitation the rights
+#to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#copies of the Software, and to permit persons to whom the Software is
+#furnished to do so, subject to the following conditions:
+
+#The above copyright notice and this permission notice shall be included in
+#all copies or substantial portions of the Software.
+
+#THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+#THE SOFTWARE.
+
+###############################################################################
+# Imports
+###############################################################################
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import haros
+from haros.pyflwor_monkey_patch import make_parser
+
+
+###############################################################################
+# Query Compiler
+###############################################################################
+
+def _tables(path):
+    return sorted(name for name in os.listdir(path)
+                  if name.startswith("lextab_") or name.startswith("parsetab_"))
+
+
+class QueryCompilerTest(unittest.TestCase):
+    def setUp(self):
+        self.pyflwor_dir = tempfile.mkdtemp(prefix = "haros_test_")
+        self.haros_dir = os.path.dirname(os.path.abspath(haros.__file__))
+        self.haros_tables = _tables(self.haros_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.pyflwor_dir, ignore_errors = True)
+
+    def test_tables_are_written_to_pyflwor_dir(self):
+        compiler = make_parser(self.pyflwor_dir)
+        self.assertEqual(list(compiler("xs[self > 1]", {"xs": [1, 2, 3]})),
+                         [2, 3])
+        tables = _tables(self.pyflwor_dir)
+        self.assertEqual([name[:4] for name in tables if name.endswith(".py")],
+                         ["lext", "pars"])
+        self.assertEqual(_tables(self.haros_dir), self.haros_tables)
+
+    def test_no_tables_without_pyflwor_dir(self):
+        compiler = make_parser(None)
+        self.assertEqual(list(compiler("xs[self > 1]", {"xs": [1, 2, 3]})),
+                         [2, 3])
+        self.assertEqual(_tables(self.haros_dir), self.haros_tables)
+
+    def test_queries_are_compiled_once(self):
+        compiler = make_parser(self.pyflwor_dir)
+        self.assertIs(compiler.compile("xs"), compiler.compile("xs"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,91 @@
+
+#Copyright (c) 2017 Andre Santos
+#
+#Permission is hereby granted, free of charge, to any person obtaining a copy
+#of this software and associated documentation files (the "Software"), to deal
+#in the Software without restriction, including without limitation the rights
+#to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#copies of the Software, and to permit persons to whom the Software is
+#furnished to do so, subject to the following conditions:
+
+#The above copyright notice and this permission notice shall be included in
+#all copies or substantial portions of the Software.
+
+#THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+#THE SOFTWARE.
+
+###############################################################################
+# Imports
+###############################################################################
+
+from collections import deque
+import os
+import time
+import unittest
+
+from haros.util import map_workers, run_workers, WorkerError, WorkerProcess
+
+
+###############################################################################
+# Worker Processes
+###############################################################################
+
+def _fail(i):
+    if i == 2:
+        raise ValueError("task " + str(i))
+    return i
+
+
+class MapWorkersTest(unittest.TestCase):
+    def test_results_in_order(self):
+        self.assertEqual(map_workers(lambda i: i * i, 10, 3),
+                         [i * i for i in xrange(10)])
+
+    def test_results_from_workers(self):
+        pids = map_workers(lambda i: os.getpid(), 4, 2)
+        self.assertFalse(os.getpid() in pids)
+
+    def test_more_jobs_than_tasks(self):
+        self.assertEqual(map_workers(str, 2, 8), ["0", "1"])
+        self.assertEqual(map_workers(str, 0, 2), [])
+
+    def test_errors_are_raised_again(self):
+        with self.assertRaises(WorkerError) as context:
+            map_workers(_fail, 4, 2)
+        self.assertTrue("ValueError: task 2" in str(context.exception))
+
+
+class RunWorkersTest(unittest.TestCase):
+    def test_messages_and_end_of_workers(self):
+        received = []
+        def start(task):
+            def target(conn):
+                conn.send(task)
+                conn.send(task * 10)
+                conn.close()
+            return WorkerProcess(target, task = task)
+        def receive(worker, message):
+            if message is EOFError:
+                worker.stop()
+                return True
+            received.append(message)
+            return False
+        run_workers(deque([1, 2, 3]), start, receive, 2)
+        self.assertEqual(sorted(received), [1, 2, 3, 10, 20, 30])
+
+    def test_workers_past_deadline_are_stopped(self):
+        expired = []
+        def start(task):
+            return WorkerProcess(lambda conn: time.sleep(30), task = task,
+                                 deadline = time.time() + 0.2)
+        started = time.time()
+        run_workers(deque(["slow"]), start, lambda w, m: True, 1,
+                    expire = expired.append)
+        self.assertTrue(time.time() - started < 10)
+        self.assertEqual([w.task for w in expired], ["slow"])
+        self.assertFalse(expired[0].process.is_alive())